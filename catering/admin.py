@@ -1,69 +1,171 @@
-from django.contrib import admin
-from django.http import HttpResponse
-from django.core.files.uploadhandler import StopUpload
-from django.utils.html import format_html
-import csv
-from .models import Dish, Order, OrderItem, Restaurant
-from import_export import resources
-from import_export.admin import ImportExportModelAdmin
 from django import forms
-from django.shortcuts import render
-from django.contrib import messages
-from import_export.formats import base_formats
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path
+
+from shared.pagination import EstimatedCountPaginator
+from .enums import OrderStatus
+from .exports import CONTENT_TYPES, export_response
+from .models import Dish, DishImport, Order, OrderItem, Restaurant
+from .servises import transition_orders
+from .tasks import finish_orders, import_dishes
 
 admin.site.register(Restaurant)
-admin.site.register(OrderItem)
 
-class DishResource(resources.ModelResource):
-    class Meta:
-        model = Dish
-        fields = ('id', 'name', 'price', 'restaurant')
-        import_id_fields = ['id'] 
-        skip_unchanged = True
-        report_skipped = False
+
+def export_table(model_admin: admin.ModelAdmin, request, table: str, file_format: str):
+    """Streams the whole table (`exports.export_response`) to the users who can view it."""
+    if not model_admin.has_view_permission(request) or file_format not in CONTENT_TYPES:
+        raise PermissionDenied
+    return export_response(table, file_format)
+
 
 class CsvImportForm(forms.Form):
-    csv_file = forms.FileField(label="CSV file")
+    csv_file = forms.FileField(label="CSV file", help_text="Columns: name,price,restaurant")
+
 
 @admin.register(Dish)
-class DishAdmin(ImportExportModelAdmin):
-    resource_class = DishResource
-    list_display = ("name", "price", "restaurant")
+class DishAdmin(admin.ModelAdmin):
+    list_display = ("name", "price", "restaurant", "available")
+    list_select_related = ("restaurant",)
     search_fields = ("name",)
-    list_filter = ("name", "restaurant")
-    formats = [base_formats.CSV]
-
-    @admin.action(description='Import Dishes from CSV')
-    def import_csv(self, request, queryset):
-        if not request.user.is_superuser:
-            return self.message_user(request, "You do not have permission to perform this action.", level='ERROR')
-
-        if request.method == "POST":
-            form = CsvImportForm(request.POST, request.FILES)
-            if form.is_valid():
-                csv_file = form.cleaned_data['csv_file']
-                try:
-                    # Import data using import_export
-                    data = csv_file.read().decode('utf-8')
-                    dish_resource = self.get_resource_class()()
-                    dataset = dish_resource.import_data(data, dry_run=False, raise_errors=True, file_format=base_formats.CSV)
-
-                    if dataset.has_errors():
-                        for err in dataset.invalid_rows:
-                            self.message_user(request, f"Ошибка в строке {err.number}: {err.error}", level=messages.ERROR)
-                    else:
-                        self.message_user(request, "Successfully imported dishes from CSV.")
-
-                except Exception as e:
-                    self.message_user(request, f"Error importing dishes: {e}", level='ERROR')
-        else:
-            form = CsvImportForm()
-            return render(request, "admin/csv_form.html", {"form": form}) # Return the form
+    list_filter = ("restaurant", "available")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/catering/dish/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path("import-csv/", self.admin_site.admin_view(self.import_csv), name="catering_dish_import_csv"),
+            path(
+                "import-csv/<int:import_id>/",
+                self.admin_site.admin_view(self.import_progress),
+                name="catering_dish_import_progress",
+            ),
+            path(
+                "export/<str:file_format>/",
+                self.admin_site.admin_view(self.export),
+                name="catering_dish_export",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def export(self, request, file_format: str):
+        return export_table(self, request, "dishes", file_format)
+
+    def import_csv(self, request):
+        """Saves the uploaded file and imports it in the background (`tasks.import_dishes`)."""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+
+        form = CsvImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            csv_file = form.cleaned_data["csv_file"]
+            dish_import = DishImport.objects.create(file=csv_file, size=csv_file.size, created_by=request.user)
+            transaction.on_commit(lambda: import_dishes.delay(dish_import.pk))
+            return redirect("admin:catering_dish_import_progress", dish_import.pk)
+
+        context = {**self.admin_site.each_context(request), "opts": self.model._meta, "form": form}
+        return render(request, "admin/catering/dish/import_csv.html", context)
+
+    def import_progress(self, request, import_id: int):
+        """The progress page of an import, polled as JSON while it runs."""
+        dish_import = get_object_or_404(DishImport, pk=import_id)
+        data = {
+            "status": dish_import.status,
+            "progress": dish_import.progress,
+            "imported": dish_import.imported,
+            "failed": dish_import.failed,
+            "errors": dish_import.errors,
+        }
+        if request.headers.get("Accept") == "application/json":
+            return JsonResponse(data)
+
+        context = {**self.admin_site.each_context(request), "opts": self.model._meta, "import": dish_import, **data}
+        return render(request, "admin/catering/dish/import_progress.html", context)
+
+
+@admin.register(DishImport)
+class DishImportAdmin(admin.ModelAdmin):
+    list_display = ("id", "file", "status", "imported", "failed", "created_by", "created_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = [field.name for field in DishImport._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
 
 class DishOrderItemInline(admin.TabularInline):
     model = OrderItem
+    # a search box instead of a <select> rendering every dish per row
+    autocomplete_fields = ("dish",)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("dish")
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("__str__", "id", "status")
-    inlines = (DishOrderItemInline,)
\ No newline at end of file
+    list_display = ("__str__", "id", "status", "eta")
+    # `Order.__str__` shows the email of the user
+    list_select_related = ("user",)
+    list_filter = ("status", "eta")
+    raw_id_fields = ("user",)
+    inlines = (DishOrderItemInline,)
+    actions = ("cancel_orders", "mark_orders_failed")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/catering/order/change_list.html"
+
+    @admin.action(description="Cancel the selected orders", permissions=["change"])
+    def cancel_orders(self, request, queryset):
+        self.transition(request, queryset, OrderStatus.CANCELLED_BY_ADMIN)
+
+    @admin.action(description="Mark the selected orders as failed", permissions=["change"])
+    def mark_orders_failed(self, request, queryset):
+        self.transition(request, queryset, OrderStatus.FAILED)
+
+    def transition(self, request, queryset, status: OrderStatus):
+        """
+        Moves the selected orders to the status in one UPDATE (`servises.transition_orders`).
+
+        The provider orders are cancelled and the tracking is archived by one
+        background task for all of them (`tasks.finish_orders`).
+        """
+        order_ids = list(queryset.values_list("pk", flat=True))
+        moved = transition_orders(order_ids, status)
+        if moved:
+            transaction.on_commit(lambda: finish_orders.delay(moved))
+
+        skipped = len(order_ids) - len(moved)
+        message = f"{len(moved)} orders moved to {dict(OrderStatus.choices())[status]}."
+        if skipped:
+            message += f" {skipped} orders were skipped, their status can not change to it."
+        self.message_user(request, message, messages.WARNING if skipped else messages.SUCCESS)
+
+    def get_urls(self):
+        urls = [
+            path(
+                "export/<str:file_format>/",
+                self.admin_site.admin_view(self.export),
+                name="catering_order_export",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def export(self, request, file_format: str):
+        return export_table(self, request, "orders", file_format)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "order", "dish", "quantity")
+    # `OrderItem.__str__` and `Order.__str__` show the dish and the email of the user
+    list_select_related = ("order__user", "dish")
+    raw_id_fields = ("order", "dish")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
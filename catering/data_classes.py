@@ -1,8 +1,68 @@
 from dataclasses import dataclass, field
 from typing import Any
 
+from shared.codecs import DataclassCodec
 
-@dataclass
+
+@dataclass(slots=True)
+class RestaurantTracking:
+    """The part of the order cooked in one restaurant."""
+
+    external_id: str | None = None
+    status: str | None = None
+    request_body: dict | None = None
+
+
+@dataclass(slots=True)
+class DeliveryTracking:
+    """The delivery of the order by one provider."""
+
+    external_id: str | None = None
+    status: str | None = None
+    location: Any = None
+
+
+@dataclass(slots=True)
 class TrackingOrder:
-    restaurants: dict[str, dict[str, Any]] = field(default_factory=dict)
-    delivery_providers: dict[str, dict[str, Any]] = field(default_factory=dict)
+    """
+    The state of an order in processing, cached in the "orders" namespace.
+
+    {
+        "restaurants": {
+            "1": {  // internal restaurant id
+                "status": "not_started",  // internal
+                "external_id": "13",
+                "request_body": {...},
+            },
+        },
+        "delivery_providers": {
+            "uklon": {"status": "delivery", "external_id": "...", "location": [..., ...]},
+        },
+    }
+    """
+
+    restaurants: dict[str, RestaurantTracking] = field(default_factory=dict)
+    delivery_providers: dict[str, DeliveryTracking] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "restaurants": {key: _entry_to_dict(entry) for key, entry in self.restaurants.items()},
+            "delivery_providers": {key: _entry_to_dict(entry) for key, entry in self.delivery_providers.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TrackingOrder":
+        return cls(
+            restaurants={key: RestaurantTracking(**entry) for key, entry in data.get("restaurants", {}).items()},
+            delivery_providers={
+                key: DeliveryTracking(**entry) for key, entry in data.get("delivery_providers", {}).items()
+            },
+        )
+
+
+def _entry_to_dict(entry) -> dict[str, Any]:
+    return {name: getattr(entry, name) for name in entry.__slots__}
+
+
+# bump the version when the fields change incompatibly, older entries are then read as cache misses
+tracking_order_codec = DataclassCodec(TrackingOrder, version=1)
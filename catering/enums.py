@@ -30,4 +30,45 @@ class OrderStatus(enum.StrEnum):
             _element = (element.value, element.name.replace("_", " ").lower().capitalize())
             results.append(_element)
 
-        return results
\ No newline at end of file
+        return results
+
+
+# statuses an order never leaves, its tracking is archived to `Order.tracking` (see servises.archive_tracking)
+TERMINAL_ORDER_STATUSES = frozenset(
+    {
+        OrderStatus.COOKING_REJECTED,
+        OrderStatus.DELIVERED,
+        OrderStatus.NOT_DELIVERED,
+        OrderStatus.CANCELLED_BY_CUSTOMER,
+        OrderStatus.CANCELLED_BY_MANAGER,
+        OrderStatus.CANCELLED_BY_ADMIN,
+        OrderStatus.CANCELLED_BY_RESTAURANT,
+        OrderStatus.CANCELLED_BY_DRIVER,
+        OrderStatus.FAILED,
+    }
+)
+
+
+# the statuses the admin moves orders to in bulk (admin.OrderAdmin actions) -> the statuses they may follow
+ADMIN_ORDER_TRANSITIONS = {
+    OrderStatus.CANCELLED_BY_ADMIN: frozenset(
+        {
+            OrderStatus.NOT_STARTED,
+            OrderStatus.COOKING,
+            OrderStatus.COOKED,
+            OrderStatus.DELIVERY_LOOKUP,
+        }
+    ),
+    OrderStatus.FAILED: frozenset(OrderStatus) - TERMINAL_ORDER_STATUSES,
+}
+
+
+class ImportStatus(enum.StrEnum):
+    PENDING = enum.auto()
+    RUNNING = enum.auto()
+    DONE = enum.auto()
+    FAILED = enum.auto()
+
+    @classmethod
+    def choices(cls):
+        return [(element.value, element.name.lower().capitalize()) for element in cls]
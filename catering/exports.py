@@ -0,0 +1,118 @@
+import csv
+import json
+from itertools import groupby
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Dish, Order
+
+# rows fetched per round trip, a server-side cursor on PostgreSQL
+CHUNK_SIZE = 2000
+# the response is written in pieces of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+DISH_COLUMNS = ("id", "name", "price", "restaurant_id", "restaurant")
+ORDER_COLUMNS = ("id", "status", "eta", "total", "user", "dish", "restaurant", "quantity")
+
+
+class Echo:
+    """A file for `csv.writer` returning the written line instead of storing it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def dish_rows() -> Iterator[tuple]:
+    return (
+        Dish.objects.order_by("pk")
+        .values_list("pk", "name", "price", "restaurant_id", "restaurant__name")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def order_item_rows() -> Iterator[tuple]:
+    """A row per item of every order (one with None items for an order without any), ordered by order."""
+    return (
+        Order.objects.order_by("pk", "items__pk")
+        .values_list(
+            "pk",
+            "status",
+            "eta",
+            "total",
+            "user__email",
+            "items__dish__name",
+            "items__dish__restaurant__name",
+            "items__quantity",
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def dishes_json() -> Iterator[dict]:
+    for row in dish_rows():
+        yield dict(zip(DISH_COLUMNS, row))
+
+
+def orders_json() -> Iterator[dict]:
+    for _, rows in groupby(order_item_rows(), key=lambda row: row[0]):
+        rows = list(rows)
+        order = dict(zip(ORDER_COLUMNS[:5], rows[0][:5]))
+        order["items"] = [dict(zip(ORDER_COLUMNS[5:], row[5:])) for row in rows if row[5] is not None]
+        yield order
+
+
+def csv_lines(header: Iterable[str], rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_lines(objects: Iterable[dict]) -> Iterator[str]:
+    """A JSON array written object by object."""
+    yield "["
+    for index, obj in enumerate(objects):
+        yield ("," if index else "") + json.dumps(obj, cls=DjangoJSONEncoder)
+    yield "]"
+
+
+def buffered(lines: Iterable[str]) -> Iterator[str]:
+    """Joins the lines into pieces of `BUFFER_SIZE`, the response is not written a row at a time."""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+EXPORTS = {
+    ("dishes", "csv"): lambda: csv_lines(DISH_COLUMNS, dish_rows()),
+    ("dishes", "json"): lambda: json_lines(dishes_json()),
+    ("orders", "csv"): lambda: csv_lines(ORDER_COLUMNS, order_item_rows()),
+    ("orders", "json"): lambda: json_lines(orders_json()),
+}
+CONTENT_TYPES = {"csv": "text/csv", "json": "application/json"}
+
+
+def export_response(table: str, file_format: str) -> StreamingHttpResponse:
+    """
+    Streams a table as a file, the memory does not grow with the table.
+
+    Args:
+        table: "dishes", or "orders" with their items.
+        file_format: "csv" or "json".
+
+    Returns:
+        The response, rows are read while it is sent.
+    """
+    response = StreamingHttpResponse(
+        buffered(EXPORTS[(table, file_format)]()), content_type=CONTENT_TYPES[file_format]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{table}.{file_format}"'
+    return response
@@ -0,0 +1,100 @@
+import csv
+import io
+import logging
+from itertools import islice
+
+from django.utils import timezone
+
+from shared.cache import CacheService
+from .enums import ImportStatus
+from .models import Dish, DishImport, Restaurant
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("name", "price", "restaurant")
+# the errors kept in `DishImport.errors`, the others are only counted
+MAX_ERRORS = 100
+
+
+class DishImporter:
+    """
+    Upserts the dishes of a CSV import by (restaurant, name).
+
+    The file is parsed row by row and written in `bulk_create(update_conflicts=True)`
+    chunks, so neither the file nor the dishes are held in memory. The progress
+    and the failed rows are saved to the import after every chunk for the admin
+    to poll. Bulk writes skip the signals, so the menu is invalidated here.
+    """
+
+    def __init__(self, dish_import: DishImport, chunk_size: int = 1000):
+        self.dish_import = dish_import
+        self.chunk_size = chunk_size
+        # restaurant name -> id, None for unknown ones
+        self.restaurants: dict[str, int | None] = {}
+
+    def run(self):
+        dish_import = self.dish_import
+        dish_import.status = ImportStatus.RUNNING
+        dish_import.save(update_fields=["status"])
+        try:
+            with dish_import.file.open("rb") as file:
+                reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+                missing = set(COLUMNS) - set(reader.fieldnames or ())
+                if missing:
+                    raise ValueError(f"The file has no {', '.join(sorted(missing))} column")
+
+                while rows := list(islice(reader, self.chunk_size)):
+                    self.import_chunk(rows, reader.line_num - len(rows) + 1)
+                    dish_import.position = file.tell()
+                    dish_import.save(update_fields=["position", "imported", "failed", "errors"])
+            dish_import.status = ImportStatus.DONE
+        except Exception as e:
+            logger.exception(f"Dish import {dish_import.pk} failed")
+            dish_import.errors.append([None, str(e)])
+            dish_import.status = ImportStatus.FAILED
+        finally:
+            dish_import.finished_at = timezone.now()
+            dish_import.save(update_fields=["status", "finished_at", "errors"])
+            CacheService().delete(namespace="menu", key="restaurants")
+
+    def import_chunk(self, rows: list[dict[str, str]], first_line: int):
+        self.load_restaurants({(row.get("restaurant") or "").strip() for row in rows})
+
+        # the last row of a dish wins, one statement can not update a row twice
+        dishes: dict[tuple[int, str], Dish] = {}
+        for line, row in enumerate(rows, start=first_line):
+            name = (row.get("name") or "").strip()
+            restaurant = (row.get("restaurant") or "").strip()
+            restaurant_id = self.restaurants.get(restaurant)
+            if not name:
+                self.error(line, "no name")
+            elif restaurant_id is None:
+                self.error(line, f"unknown restaurant {restaurant!r}")
+            else:
+                try:
+                    price = int(row.get("price") or "")
+                except ValueError:
+                    self.error(line, f"invalid price {row.get('price')!r}")
+                    continue
+                dishes[(restaurant_id, name)] = Dish(name=name, price=price, restaurant_id=restaurant_id)
+
+        Dish.objects.bulk_create(
+            dishes.values(),
+            update_conflicts=True,
+            unique_fields=["restaurant", "name"],
+            update_fields=["price"],
+        )
+        self.dish_import.imported += len(dishes)
+
+    def load_restaurants(self, names: set[str]):
+        names = names - self.restaurants.keys()
+        if not names:
+            return
+        self.restaurants.update(dict.fromkeys(names))
+        for restaurant_id, name in Restaurant.objects.filter(name__in=names).order_by("-pk").values_list("pk", "name"):
+            self.restaurants[name] = restaurant_id
+
+    def error(self, line: int, message: str):
+        self.dish_import.failed += 1
+        if len(self.dish_import.errors) < MAX_ERRORS:
+            self.dish_import.errors.append([line, message])
@@ -0,0 +1,423 @@
+"""
+End-to-end load test of the order pipeline against the local mock providers.
+
+The harness (`manage.py loadtest`) starts the FastAPI mocks from
+`catering/testproviders/` with the configured cooking/delivery times and error
+rates, optionally the whole stack (API, Celery worker and beat, webhook
+consumer), fires `create_order` requests at the API and follows every order in
+the database until it is delivered. The mocks send their webhooks to the API on their own.
+
+Everything runs on one box against the database and Redis of the Django settings.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.celery import app as celery_app
+from users.models import User
+from .enums import OrderStatus
+from .models import Dish, Order, Restaurant
+
+logger = logging.getLogger(__name__)
+
+TESTPROVIDERS_DIR = Path(__file__).resolve().parent / "testproviders"
+
+# mock provider -> (port, Django setting with its URL)
+MOCKS = {
+    "kfc": (8001, "KFC_PROVIDER_URL"),
+    "silpo": (8002, "SILPO_PROVIDER_URL"),
+    "uber": (8003, "UBER_PROVIDER_URL"),
+    "uklon": (8004, "UKLON_PROVIDER_URL"),
+}
+
+COOKED_STATUSES = {OrderStatus.COOKED, OrderStatus.DELIVERY_LOOKUP, OrderStatus.DELIVERY, OrderStatus.DELIVERED}
+FAILED_STATUSES = {
+    OrderStatus.COOKING_REJECTED,
+    OrderStatus.NOT_DELIVERED,
+    OrderStatus.FAILED,
+    OrderStatus.CANCELLED_BY_RESTAURANT,
+    OrderStatus.CANCELLED_BY_DRIVER,
+}
+
+LOADTEST_USER_EMAIL = "loadtest@example.com"
+LOADTEST_DISHES = {
+    "Silpo": ("Silpo street 1", ["Salad", "Soup", "Pizza"]),
+    "KFC": ("KFC street 2", ["Burger", "Wings", "Fries"]),
+}
+
+
+@dataclass
+class LoadTestConfig:
+    orders: int = 1000
+    concurrency: int = 100
+    # new orders per second, 0 sends them as fast as `concurrency` allows
+    rate: float = 0
+    api_url: str = "http://127.0.0.1:8000"
+    mock_host: str = "127.0.0.1"
+    start_mocks: bool = True
+    start_stack: bool = False
+    api_workers: int = 4
+    celery_concurrency: int = 50
+    # environment of the mocks, see testproviders/mock_config.py
+    mock_env: dict[str, str] = field(default_factory=dict)
+    timeout: float = 600
+    poll_interval: float = 0.5
+    log_dir: Path = Path("loadtest-logs")
+    seed: int | None = None
+
+
+@dataclass
+class OrderTimings:
+    """Seconds since the `create_order` request of the order was sent."""
+
+    started: float
+    cooked: float | None = None
+    delivered: float | None = None
+    failed: bool = False
+
+
+@dataclass
+class LoadTestReport:
+    requested: int = 0
+    create_errors: int = 0
+    create_latencies: list[float] = field(default_factory=list)
+    orders: dict[int, OrderTimings] = field(default_factory=dict)
+    utilization: list[float] = field(default_factory=list)
+    load_duration: float = 0
+    total_duration: float = 0
+
+    def summary(self) -> dict:
+        to_cooked = [t.cooked - t.started for t in self.orders.values() if t.cooked is not None]
+        to_delivered = [t.delivered - t.started for t in self.orders.values() if t.delivered is not None]
+
+        return {
+            "orders": {
+                "requested": self.requested,
+                "create_errors": self.create_errors,
+                "created": len(self.orders),
+                "cooked": len(to_cooked),
+                "delivered": len(to_delivered),
+                "failed": sum(t.failed for t in self.orders.values()),
+                "unfinished": sum(t.delivered is None and not t.failed for t in self.orders.values()),
+            },
+            "create_order_latency": percentiles(self.create_latencies),
+            "time_to_cooked": percentiles(to_cooked),
+            "time_to_delivered": percentiles(to_delivered),
+            "throughput": {
+                "created_per_second": len(self.orders) / self.load_duration if self.load_duration else 0,
+                "delivered_per_second": len(to_delivered) / self.total_duration if self.total_duration else 0,
+            },
+            "worker_utilization": {
+                "mean": statistics.fmean(self.utilization) if self.utilization else None,
+                "max": max(self.utilization, default=None),
+                "samples": len(self.utilization),
+            },
+        }
+
+
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    """Returns p50/p95/p99 of the values, None for an empty list."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+class LocalProcesses:
+    """Child processes of the harness, stopped together when the test is over."""
+
+    def __init__(self, log_dir: Path):
+        self.log_dir = log_dir
+        self.processes: dict[str, subprocess.Popen] = {}
+
+    def start(self, name: str, command: list[str], env: dict[str, str] | None = None):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log = open(self.log_dir / f"{name}.log", "wb")
+        self.processes[name] = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env=os.environ | (env or {}),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        log.close()
+
+    def check(self):
+        """Raises if any of the processes died."""
+        for name, process in self.processes.items():
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with {process.returncode}, see {self.log_dir / name}.log")
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class WorkerUtilization(threading.Thread):
+    """Samples the share of busy Celery worker processes with the remote control API."""
+
+    def __init__(self, interval: float = 2.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples: list[float] = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            inspect = celery_app.control.inspect(timeout=1)
+            stats = inspect.stats() or {}
+            active = inspect.active() or {}
+
+            capacity = sum(worker["pool"].get("max-concurrency", 0) for worker in stats.values())
+            if capacity:
+                self.samples.append(sum(len(tasks) for tasks in active.values()) / capacity)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class OrderTracker:
+    """Follows the orders in the database, one query per poll for all unfinished orders."""
+
+    def __init__(self, orders: dict[int, OrderTimings], started_at: float):
+        self.orders = orders
+        self.started_at = started_at
+
+    def unfinished(self) -> list[int]:
+        # orders are added by the sending thread while the tracker polls
+        return [pk for pk, timings in list(self.orders.items()) if timings.delivered is None and not timings.failed]
+
+    def poll(self):
+        now = time.perf_counter() - self.started_at
+        for pk, status in Order.objects.filter(pk__in=self.unfinished()).values_list("pk", "status"):
+            timings = self.orders[pk]
+            if status in COOKED_STATUSES and timings.cooked is None:
+                timings.cooked = now
+            if status == OrderStatus.DELIVERED:
+                timings.delivered = now
+            elif status in FAILED_STATUSES:
+                timings.failed = True
+
+
+class LoadTest:
+    def __init__(self, config: LoadTestConfig, stdout=sys.stdout):
+        self.config = config
+        self.stdout = stdout
+        self.random = random.Random(config.seed)
+        self.report = LoadTestReport(requested=config.orders)
+
+    def mock_url(self, provider: str) -> str:
+        port, _ = MOCKS[provider]
+        return f"http://{self.config.mock_host}:{port}"
+
+    def stack_env(self) -> dict[str, str]:
+        """The environment the API and the workers need to talk to the local mocks."""
+        return {setting: self.mock_url(provider) for provider, (_, setting) in MOCKS.items()}
+
+    def start_mocks(self, processes: LocalProcesses):
+        env = self.config.mock_env | {
+            "KFC_WEBHOOK_URL": self.config.api_url + reverse("kfc-webhook"),
+            "PYTHONUNBUFFERED": "1",
+        }
+        for provider, (port, _) in MOCKS.items():
+            processes.start(
+                f"mock_{provider}",
+                [
+                    sys.executable, "-m", "uvicorn", f"{provider}:app",
+                    "--app-dir", str(TESTPROVIDERS_DIR),
+                    "--host", self.config.mock_host,
+                    "--port", str(port),
+                    "--log-level", "warning",
+                ],
+                env,
+            )
+        for provider in MOCKS:
+            wait_until_up(f"{self.mock_url(provider)}/docs")
+
+    def start_stack(self, processes: LocalProcesses):
+        env = self.stack_env()
+        api = urlsplit(self.config.api_url)
+        processes.start(
+            "api",
+            [
+                "gunicorn", "config.wsgi:application",
+                "--bind", f"{api.hostname}:{api.port or 8000}",
+                "--workers", str(self.config.api_workers),
+                "--worker-class", "gthread",
+                "--threads", "8",
+            ],
+            env,
+        )
+        processes.start(
+            "worker",
+            [
+                "celery", "-A", "config", "worker", "-l", "warning",
+                "-Q", "high_priority,default,low_priority",
+                # the order tasks mostly sleep between polls of the providers
+                "--pool", "threads",
+                "--concurrency", str(self.config.celery_concurrency),
+            ],
+            env,
+        )
+        # the Silpo orders and the deliveries only move on with the polls scheduled by beat
+        processes.start(
+            "beat",
+            [
+                "celery", "-A", "config", "beat", "-l", "warning",
+                "--schedule", str(processes.log_dir / "celerybeat-schedule"),
+            ],
+            env,
+        )
+        processes.start("webhook_consumer", [sys.executable, "manage.py", "consume_webhooks"], env)
+        wait_until_up(self.config.api_url + reverse("api-root"))
+
+    def prepare_data(self) -> tuple[str, list[list[int]]]:
+        """
+        Creates the load test customer and menu.
+
+        Returns:
+            The access token of the customer and the dish ids of every restaurant.
+        """
+        user = User.objects.filter(email=LOADTEST_USER_EMAIL).first()
+        if user is None:
+            user = User.objects.create_user(email=LOADTEST_USER_EMAIL, password=get_random_string(32))
+
+        menus = []
+        for name, (address, dishes) in LOADTEST_DISHES.items():
+            restaurant, _ = Restaurant.objects.get_or_create(name=name, defaults={"address": address})
+            menus.append(
+                [
+                    Dish.objects.get_or_create(name=dish, restaurant=restaurant, defaults={"price": 100})[0].pk
+                    for dish in dishes
+                ]
+            )
+
+        return str(AccessToken.for_user(user)), menus
+
+    def order_body(self, menus: list[list[int]]) -> dict:
+        """A random order from one or several restaurants."""
+        restaurants = self.random.sample(menus, k=self.random.randint(1, len(menus)))
+        return {
+            "items": [
+                {"dish": self.random.choice(menu), "quantity": self.random.randint(1, 3)} for menu in restaurants
+            ],
+            "eta": date.today().isoformat(),
+        }
+
+    async def send_orders(self, token: str, menus: list[list[int]], started_at: float):
+        url = self.config.api_url + reverse("food-create-order")
+        semaphore = asyncio.Semaphore(self.config.concurrency)
+        limits = httpx.Limits(max_connections=self.config.concurrency)
+
+        async with httpx.AsyncClient(headers={"Authorization": f"Bearer {token}"}, limits=limits, timeout=60) as client:
+
+            async def create_order(body: dict):
+                async with semaphore:
+                    sent = time.perf_counter()
+                    try:
+                        response = await client.post(url, json=body)
+                        response.raise_for_status()
+                    except httpx.HTTPError as e:
+                        logger.warning(f"create_order failed: {e}")
+                        self.report.create_errors += 1
+                        return
+
+                    self.report.create_latencies.append(time.perf_counter() - sent)
+                    self.report.orders[response.json()["id"]] = OrderTimings(started=sent - started_at)
+
+            requests = []
+            for number in range(self.config.orders):
+                if self.config.rate:
+                    await asyncio.sleep(max(started_at + number / self.config.rate - time.perf_counter(), 0))
+                requests.append(asyncio.create_task(create_order(self.order_body(menus))))
+            await asyncio.gather(*requests)
+
+    def send_load(self, token: str, menus: list[list[int]], started_at: float):
+        asyncio.run(self.send_orders(token, menus, started_at))
+        self.report.load_duration = time.perf_counter() - started_at
+
+    def run(self) -> dict:
+        config = self.config
+        with LocalProcesses(config.log_dir) as processes:
+            if config.start_mocks:
+                self.write(f"Starting the mock providers, logs in {config.log_dir}/")
+                self.start_mocks(processes)
+            if config.start_stack:
+                self.write("Starting the API, the Celery worker and beat and the webhook consumer")
+                self.start_stack(processes)
+            else:
+                self.write(
+                    "Expecting the API, Celery workers and beat and `manage.py consume_webhooks` to run with: "
+                    + " ".join(f"{key}={value}" for key, value in self.stack_env().items())
+                )
+
+            token, menus = self.prepare_data()
+            utilization = WorkerUtilization()
+            utilization.start()
+
+            started_at = time.perf_counter()
+            self.write(f"Sending {config.orders} orders, {config.concurrency} at once")
+            # orders are sent from another thread, so they are followed from the very first one
+            sender = threading.Thread(target=self.send_load, args=(token, menus, started_at), daemon=True)
+            sender.start()
+
+            tracker = OrderTracker(self.report.orders, started_at)
+            deadline = started_at + config.timeout
+            while (sender.is_alive() or tracker.unfinished()) and time.perf_counter() < deadline:
+                processes.check()
+                tracker.poll()
+                time.sleep(config.poll_interval)
+
+            self.report.total_duration = time.perf_counter() - started_at
+            utilization.stop()
+            self.report.utilization = utilization.samples
+
+        return self.report.summary()
+
+    def write(self, message: str):
+        self.stdout.write(message + "\n")
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    """Waits until the URL answers anything but a connection error."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"{url} is not up after {timeout}s")
+            time.sleep(0.2)
@@ -0,0 +1,63 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from catering.data_classes import DeliveryTracking, RestaurantTracking, TrackingOrder, tracking_order_codec
+from catering.enums import OrderStatus
+from shared.codecs import DataclassCodec, PickleCodec
+
+
+class PickledDict(PickleCodec):
+    """How the tracking orders were cached before the codec: a pickled `asdict()`, rebuilt on every read."""
+
+    def encode(self, value: TrackingOrder) -> bytes:
+        return super().encode(value.to_dict())
+
+    def decode(self, data: bytes) -> TrackingOrder:
+        return TrackingOrder.from_dict(super().decode(data))
+
+
+def sample_order(items: int) -> TrackingOrder:
+    """A Silpo + KFC order with `items` dishes in every restaurant, in delivery."""
+    return TrackingOrder(
+        restaurants={
+            "1": RestaurantTracking(
+                "4f0c9a52-1c7e-4e59-a1c5-3d7a2b9f1e10",
+                OrderStatus.COOKED,
+                {"items": [{"id": f"silpo-{i}", "quantity": 1 + i % 3} for i in range(items)]},
+            ),
+            "2": RestaurantTracking(
+                "kfc-93412",
+                OrderStatus.COOKED,
+                {"order": [{"dish": f"Bucket {i}", "quantity": 1 + i % 2} for i in range(items)]},
+            ),
+        },
+        delivery_providers={
+            "uklon": DeliveryTracking("b2f1d3e4-7a8b-4c5d-9e0f-1a2b3c4d5e6f", OrderStatus.DELIVERY, [50.4501, 30.5234])
+        },
+    )
+
+
+class Command(BaseCommand):
+    help = "Compares the encode/decode time and the size of the cached tracking orders for every codec"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=10_000, help="Encodes and decodes per measurement")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        codecs = {
+            "pickle (before)": PickledDict(),
+            "orjson": DataclassCodec(TrackingOrder, compress_threshold=float("inf")),
+            "orjson + zlib": tracking_order_codec,
+        }
+
+        self.stdout.write(f"{'order':<18}{'codec':<18}{'bytes':>8}{'encode, us':>12}{'decode, us':>12}")
+        for label, order in (("small (2 items)", sample_order(2)), ("large (200 items)", sample_order(100))):
+            for name, codec in codecs.items():
+                data = codec.encode(order)
+                assert codec.decode(data) == order
+
+                encode = timeit.timeit(lambda: codec.encode(order), number=number) / number * 1e6
+                decode = timeit.timeit(lambda: codec.decode(data), number=number) / number * 1e6
+                self.stdout.write(f"{label:<18}{name:<18}{len(data):>8}{encode:>12.2f}{decode:>12.2f}")
@@ -0,0 +1,74 @@
+import datetime
+import io
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from catering.enums import OrderStatus
+from catering.models import Dish, Order, Restaurant
+from catering.views import OrderSerializer, RestaurantSerializer
+from shared.parsers import ORJSONParser
+from shared.renderers import ORJSONRenderer
+
+
+def menu_page(restaurants: int, dishes: int) -> list[dict]:
+    """A `RestaurantSerializer` page of restaurants with `dishes` dishes each, built without the database."""
+    page = []
+    for restaurant_id in range(1, restaurants + 1):
+        restaurant = Restaurant(pk=restaurant_id, name=f"Restaurant {restaurant_id}", address="Khreshchatyk 1, Kyiv")
+        restaurant._prefetched_objects_cache = {
+            "dishes": [
+                Dish(pk=restaurant_id * 1000 + i, name=f"Dish {i}", price=10 + i % 20, restaurant=restaurant)
+                for i in range(dishes)
+            ]
+        }
+        page.append(restaurant)
+    return RestaurantSerializer(page, many=True).data
+
+
+def order_list(orders: int) -> list[dict]:
+    statuses = list(OrderStatus)
+    return OrderSerializer(
+        [
+            Order(pk=i, status=statuses[i % len(statuses)], eta=datetime.date(2025, 7, 10), total=100 + i)
+            for i in range(orders)
+        ],
+        many=True,
+    ).data
+
+
+class Command(BaseCommand):
+    help = "Compares the render and parse time of the API responses with DRF's json and with orjson"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=1000, help="Renders and parses per measurement")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        stacks = {
+            "json (before)": (JSONRenderer(), JSONParser()),
+            "orjson": (ORJSONRenderer(), ORJSONParser()),
+        }
+        payloads = {
+            "menu (10 x 50)": menu_page(10, 50),
+            "orders (10)": order_list(10),
+            "orders (1000)": order_list(1000),
+        }
+
+        self.stdout.write(f"{'payload':<18}{'stack':<16}{'bytes':>9}{'render, us':>12}{'parse, us':>12}")
+        for label, data in payloads.items():
+            for name, (renderer, parser) in stacks.items():
+                content = renderer.render(data)
+                assert parser.parse(io.BytesIO(content), parser_context={}) == JSONParser().parse(
+                    io.BytesIO(content), parser_context={}
+                )
+
+                render = timeit.timeit(lambda: renderer.render(data), number=number) / number * 1e6
+                parse = (
+                    timeit.timeit(lambda: parser.parse(io.BytesIO(content), parser_context={}), number=number)
+                    / number
+                    * 1e6
+                )
+                self.stdout.write(f"{label:<18}{name:<16}{len(content):>9}{render:>12.2f}{parse:>12.2f}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shared.metrics import cache_stats
+
+
+class Command(BaseCommand):
+    help = "Switches the cache instrumentation on or off in all processes, or prints the metrics"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["on", "off", "show"])
+
+    def handle(self, *args, **options):
+        match options["action"]:
+            case "on":
+                cache_stats.set_enabled(True)
+            case "off":
+                cache_stats.set_enabled(False)
+            case "show":
+                self.stdout.write(cache_stats.render(), ending="")
+                return
+        self.stdout.write(f"Cache metrics are {options['action']}, processes pick it up within the flush interval")
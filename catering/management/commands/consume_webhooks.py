@@ -0,0 +1,65 @@
+import logging
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from catering.webhooks import kfc_webhooks, process_kfc_webhooks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Consumes KFC webhooks from the Redis Stream and applies them in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consumer", default=f"{socket.gethostname()}-{os.getpid()}")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--block", type=int, default=1000, help="Wait for new events, ms")
+        parser.add_argument(
+            "--min-idle", type=int, default=30_000, help="Take over events pending longer than this, ms"
+        )
+
+    def handle(self, *args, **options):
+        stream = kfc_webhooks()
+        stream.ensure_group()
+        consumer = options["consumer"]
+        batch_size = options["batch_size"]
+
+        self.stdout.write(f"Consuming {stream.stream} as {consumer}")
+
+        while True:
+            # events of crashed consumers (or failed batches) first, then the new ones
+            events = stream.claim_pending(consumer, min_idle_ms=options["min_idle"], count=batch_size)
+            if not events:
+                events = stream.read(consumer, count=batch_size, block_ms=options["block"])
+            if not events:
+                continue
+
+            close_old_connections()
+            stream.ack(self.process(events))
+
+    def process(self, events: list[tuple[str, dict[str, str]]]) -> list[str]:
+        """
+        Processes the batch and returns the ids of the events to acknowledge.
+
+        If the batch fails, its events are retried one by one, so a single broken
+        event stays pending without blocking the rest of the batch.
+        """
+        try:
+            process_kfc_webhooks([event for _, event in events])
+            return [event_id for event_id, _ in events]
+        except Exception:
+            logger.exception(f"Failed to process a batch of {len(events)} KFC webhooks")
+
+        processed = []
+        for event_id, event in events:
+            try:
+                process_kfc_webhooks([event])
+            except Exception:
+                logger.exception(f"Failed to process KFC webhook {event_id}: {event}")
+            else:
+                processed.append(event_id)
+
+        return processed
@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from catering.loadtest import LoadTest, LoadTestConfig
+
+# command option -> environment variable of the mocks (testproviders/mock_config.py)
+MOCK_OPTIONS = {
+    "cooking_time": "MOCK_COOKING_TIME",
+    "driver_lookup_time": "MOCK_DRIVER_LOOKUP_TIME",
+    "delivery_time": "MOCK_DELIVERY_TIME",
+    "error_rate": "MOCK_ERROR_RATE",
+    "webhook_duplicate_rate": "MOCK_WEBHOOK_DUPLICATE_RATE",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs an end-to-end load test: starts the mock providers (and optionally the API and workers), "
+        "creates orders concurrently and reports the time to COOKED and DELIVERED"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=100, help="create_order requests in flight")
+        parser.add_argument("--rate", type=float, default=0, help="New orders per second, 0 for as fast as possible")
+        parser.add_argument("--api-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--mock-host", default="127.0.0.1")
+        parser.add_argument("--no-mocks", action="store_true", help="The mock providers are already running")
+        parser.add_argument(
+            "--start-stack",
+            action="store_true",
+            help="Also start gunicorn, a Celery worker, Celery beat and the webhook consumer",
+        )
+        parser.add_argument("--api-workers", type=int, default=4)
+        parser.add_argument("--celery-concurrency", type=int, default=50)
+        parser.add_argument("--cooking-time", help='Distribution of every cooking step, e.g. "uniform:1,2"')
+        parser.add_argument("--driver-lookup-time", help='e.g. "exp:1.5"')
+        parser.add_argument("--delivery-time", help='Distribution of every delivery stop, e.g. "normal:3,0.5"')
+        parser.add_argument("--error-rate", help="Share of provider orders failing with 503, e.g. 0.05")
+        parser.add_argument("--webhook-duplicate-rate", help="Share of webhooks the providers send twice")
+        parser.add_argument("--timeout", type=float, default=600, help="Give up on unfinished orders after, s")
+        parser.add_argument("--log-dir", type=Path, default=Path("loadtest-logs"))
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--json", type=Path, help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        config = LoadTestConfig(
+            orders=options["orders"],
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            api_url=options["api_url"].rstrip("/"),
+            mock_host=options["mock_host"],
+            start_mocks=not options["no_mocks"],
+            start_stack=options["start_stack"],
+            api_workers=options["api_workers"],
+            celery_concurrency=options["celery_concurrency"],
+            mock_env={env: str(options[option]) for option, env in MOCK_OPTIONS.items() if options[option]},
+            timeout=options["timeout"],
+            log_dir=options["log_dir"],
+            seed=options["seed"],
+        )
+        report = LoadTest(config, stdout=self.stdout).run()
+
+        self.print_report(report)
+        if options["json"]:
+            options["json"].write_text(json.dumps(report, indent=2))
+
+    def print_report(self, report: dict):
+        orders = report["orders"]
+        self.stdout.write(
+            f"\nOrders: {orders['created']}/{orders['requested']} created ({orders['create_errors']} errors), "
+            f"{orders['cooked']} cooked, {orders['delivered']} delivered, "
+            f"{orders['failed']} failed, {orders['unfinished']} unfinished"
+        )
+
+        for title, key, unit, scale in (
+            ("create_order latency", "create_order_latency", "ms", 1000),
+            ("Time to COOKED", "time_to_cooked", "s", 1),
+            ("Time to DELIVERED", "time_to_delivered", "s", 1),
+        ):
+            values = ", ".join(
+                f"{name} {value * scale:.2f}{unit}" if value is not None else f"{name} -"
+                for name, value in report[key].items()
+            )
+            self.stdout.write(f"{title}: {values}")
+
+        throughput = report["throughput"]
+        self.stdout.write(
+            f"Throughput: {throughput['created_per_second']:.1f} orders/s created, "
+            f"{throughput['delivered_per_second']:.1f} orders/s delivered"
+        )
+
+        utilization = report["worker_utilization"]
+        if utilization["samples"]:
+            self.stdout.write(
+                f"Worker utilization: mean {utilization['mean']:.0%}, max {utilization['max']:.0%} "
+                f"({utilization['samples']} samples)"
+            )
+        else:
+            self.stdout.write("Worker utilization: no Celery workers answered")
@@ -0,0 +1,18 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from catering.order_index import ExternalOrderIndex
+
+
+class Command(BaseCommand):
+    help = "Loads the external order index from the database into Redis, e.g. after a Redis restart"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", help="Only load this provider")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        loaded = ExternalOrderIndex().warm_up(provider=options["provider"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} external orders in {perf_counter() - started:.2f}s"))
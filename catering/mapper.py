@@ -1,13 +1,16 @@
 from .enums import OrderStatus
-from .providers import silpo, kfc, uber
+from providers import silpo, kfc, uber
 
 RESTAURANT_EXTERNAL_TO_INTERNAL: dict[str, dict[str, OrderStatus]] = {
     "silpo": {
         silpo.OrderStatus.NOT_STARTED: OrderStatus.NOT_STARTED,
         silpo.OrderStatus.COOKING: OrderStatus.COOKING,
         silpo.OrderStatus.COOKED: OrderStatus.COOKED,        
+        # handed over to the courier, may be polled instead of "cooked"
+        silpo.OrderStatus.COMPLETED: OrderStatus.COOKED,
     },
     "kfc": {
+        kfc.OrderStatus.NOT_STARTED: OrderStatus.NOT_STARTED,
         kfc.OrderStatus.PENDING: OrderStatus.NOT_STARTED,
         kfc.OrderStatus.COOKING: OrderStatus.COOKING,
         kfc.OrderStatus.COOKED: OrderStatus.COOKED,        
@@ -24,3 +27,23 @@ DELIVERY_EXTERNAL_TO_INTERNAL: dict[str, dict[str, OrderStatus]] = {
         uber.DeliveryStatus.CANCELED: OrderStatus.NOT_DELIVERED, # Let's map this to a more generic "not delivered" status
     }
 }
+
+
+# The order in which provider statuses follow each other. A webhook ranked
+# below an already seen status of the same order arrived out of order.
+WEBHOOK_STATUS_RANK: dict[str, dict[str, int]] = {
+    "kfc": {
+        kfc.OrderStatus.NOT_STARTED: 0,
+        kfc.OrderStatus.PENDING: 0,
+        kfc.OrderStatus.COOKING: 1,
+        kfc.OrderStatus.COOKED: 2,
+        kfc.OrderStatus.COMPLETED: 3,
+    },
+    "uber": {
+        uber.DeliveryStatus.PENDING: 0,
+        uber.DeliveryStatus.PICKING_UP: 1,
+        uber.DeliveryStatus.IN_PROGRESS: 2,
+        uber.DeliveryStatus.DELIVERED: 3,
+        uber.DeliveryStatus.CANCELED: 3,
+    },
+}
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from providers import kfc, silpo
+from shared.cache import CacheService
+from .models import Dish, Restaurant
+
+logger = logging.getLogger(__name__)
+
+# provider -> (restaurant name, client with `get_menu()`)
+MENU_PROVIDERS = {
+    "silpo": ("Silpo", silpo.Client),
+    "kfc": ("KFC", kfc.Client),
+}
+
+
+@dataclass
+class MenuDiff:
+    created: int = 0
+    updated: int = 0
+    removed: int = 0
+    # items left out because their id or name is taken by another item or dish
+    skipped: int = 0
+    unchanged: bool = False
+
+
+def dish_hash(name: str, price: int) -> str:
+    return hashlib.md5(json.dumps([name, price]).encode()).hexdigest()
+
+
+def menu_hash(items: list[silpo.MenuItem | kfc.MenuItem]) -> str:
+    """The hash of the whole menu, independent of the order of the items."""
+    content = sorted([item.id, item.name, item.price] for item in items)
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def sync_menu(restaurant: Restaurant, items: list[silpo.MenuItem | kfc.MenuItem]) -> MenuDiff:
+    """
+    Applies the provider menu to the dishes of the restaurant.
+
+    A menu with the hash of the last synced one is skipped. Otherwise the
+    dishes are matched by external id and only the new and the changed ones
+    (by `Dish.content_hash`) are written, in bulk. New dishes adopt a dish
+    added by hand with the same name. Dishes removed from the menu are marked
+    unavailable, they are kept for the past orders.
+
+    An item whose id or name is already taken by an earlier item, or whose
+    name belongs to another dish still in the menu, is skipped and logged
+    instead of failing the whole sync on the unique constraints.
+
+    Args:
+        restaurant: The restaurant of the provider.
+        items: The menu from the provider API.
+
+    Returns:
+        The numbers of the created, updated, removed and skipped dishes.
+    """
+    digest = menu_hash(items)
+    if restaurant.menu_hash == digest:
+        return MenuDiff(unchanged=True)
+
+    # external id -> (pk, content hash, available)
+    current = {
+        external_id: (pk, content_hash, available)
+        for external_id, pk, content_hash, available in Dish.objects.filter(
+            restaurant=restaurant, external_id__isnull=False
+        ).values_list("external_id", "pk", "content_hash", "available")
+    }
+
+    # name -> (pk, external id) of all the dishes of the restaurant
+    owners = {
+        name: (pk, external_id)
+        for name, pk, external_id in Dish.objects.filter(restaurant=restaurant).values_list(
+            "name", "pk", "external_id"
+        )
+    }
+    menu_ids = {item.id for item in items}
+
+    created, updated, skipped = [], [], []
+    claimed_ids, claimed_names = set(), set()
+    for item in items:
+        content_hash = dish_hash(item.name, item.price)
+        pk, current_hash, available = current.pop(item.id, (None, None, None))
+        owner_pk, owner_external_id = owners.get(item.name, (None, None))
+        if item.id in claimed_ids or item.name in claimed_names:
+            skipped.append(item)
+            continue
+        if pk is None:
+            # the upsert adopts a dish added by hand or removed from the menu, not one of another item
+            if owner_external_id is not None and owner_external_id in menu_ids:
+                skipped.append(item)
+                continue
+            created.append(
+                Dish(
+                    restaurant=restaurant,
+                    external_id=item.id,
+                    name=item.name,
+                    price=item.price,
+                    content_hash=content_hash,
+                )
+            )
+        elif owner_pk is not None and owner_pk != pk:
+            # renamed onto another dish, the dish is left as it is
+            skipped.append(item)
+            continue
+        elif current_hash != content_hash or not available:
+            updated.append(Dish(pk=pk, name=item.name, price=item.price, content_hash=content_hash, available=True))
+        claimed_ids.add(item.id)
+        claimed_names.add(item.name)
+    adopted = {owners[dish.name][0] for dish in created if dish.name in owners}
+    removed = [pk for pk, _, available in current.values() if available and pk not in adopted]
+    if skipped:
+        logger.warning(f"Skipped {len(skipped)} items of the {restaurant} menu, their id or name is taken: {skipped}")
+
+    with transaction.atomic():
+        Dish.objects.bulk_create(
+            created,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["restaurant", "name"],
+            update_fields=["external_id", "price", "content_hash", "available"],
+        )
+        Dish.objects.bulk_update(updated, ["name", "price", "content_hash", "available"], batch_size=1000)
+        Dish.objects.filter(pk__in=removed).update(available=False)
+        Restaurant.objects.filter(pk=restaurant.pk).update(menu_hash=digest)
+    restaurant.menu_hash = digest
+
+    # bulk writes send no signals
+    if created or updated or removed:
+        CacheService().delete(namespace="menu", key="restaurants")
+    return MenuDiff(created=len(created), updated=len(updated), removed=len(removed), skipped=len(skipped))
+
+
+def sync_provider_menu(provider: str) -> MenuDiff | None:
+    """Pulls the menu of the provider and syncs it, None if its restaurant does not exist."""
+    name, client = MENU_PROVIDERS[provider]
+    restaurant = Restaurant.objects.filter(name=name).first()
+    if restaurant is None:
+        logger.warning(f"No {name} restaurant to sync the {provider} menu to")
+        return None
+
+    diff = sync_menu(restaurant, client.get_menu())
+    logger.info(f"Synced the {provider} menu: {diff}")
+    return diff
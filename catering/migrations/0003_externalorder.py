@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catering', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=20)),
+                ('external_id', models.CharField(max_length=100)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_orders', to='catering.order')),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='catering.restaurant')),
+            ],
+            options={
+                'db_table': 'external_orders',
+                'constraints': [models.UniqueConstraint(fields=('provider', 'external_id'), name='external_orders_provider_external_id_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catering', '0003_externalorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='tracking',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:52
+
+import catering.enums
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_dishes(apps, schema_editor):
+    """Renames all but the first dish of a (restaurant, name) to "name (#pk)", the pair becomes unique."""
+    Dish = apps.get_model('catering', 'Dish')
+    duplicates = (
+        Dish.objects.values('restaurant_id', 'name').annotate(count=Count('pk')).filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        dishes = Dish.objects.filter(restaurant_id=duplicate['restaurant_id'], name=duplicate['name']).order_by('pk')
+        for dish in dishes[1:]:
+            suffix = f' (#{dish.pk})'
+            dish.name = dish.name[:Dish._meta.get_field('name').max_length - len(suffix)] + suffix
+            dish.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catering', '0004_order_tracking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/dishes/')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default=catering.enums.ImportStatus['PENDING'], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('position', models.PositiveBigIntegerField(default=0)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'db_table': 'dish_imports',
+            },
+        ),
+        migrations.RunPython(rename_duplicate_dishes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dish',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'name'), name='dishes_restaurant_name_uniq'),
+        ),
+        migrations.AddField(
+            model_name='dishimport',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catering', '0005_dish_import'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='available',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='menu_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='dish',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'external_id'), name='dishes_restaurant_external_id_uniq'),
+        ),
+    ]
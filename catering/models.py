@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.db import models
 
-from .enums import OrderStatus
+from .enums import ImportStatus, OrderStatus
 
 
 class Restaurant(models.Model):
@@ -10,6 +10,8 @@ class Restaurant(models.Model):
 
     name = models.CharField(max_length=255, null=False)
     address = models.TextField(null=False)
+    # hash of the last menu synced from the provider (`menu_sync.sync_menu`)
+    menu_hash = models.CharField(max_length=64, blank=True)
 
     def __str__(self) -> str:
         return self.name
@@ -18,12 +20,22 @@ class Restaurant(models.Model):
 class Dish(models.Model):
     class Meta:
         db_table = "dishes"
+        constraints = [
+            # the key of the CSV imports (`importers.DishImporter`)
+            models.UniqueConstraint(fields=["restaurant", "name"], name="dishes_restaurant_name_uniq"),
+            models.UniqueConstraint(fields=["restaurant", "external_id"], name="dishes_restaurant_external_id_uniq"),
+        ]
 
     name = models.CharField(max_length=255)
     price = models.IntegerField()
     restaurant = models.ForeignKey(
         "Restaurant", on_delete=models.CASCADE, related_name="dishes"
     )
+    # the id in the provider menu and the hash of the synced name and price, empty for dishes added by hand
+    external_id = models.CharField(max_length=100, null=True, blank=True)
+    content_hash = models.CharField(max_length=32, blank=True)
+    # dishes removed from the provider menu are kept for the past orders
+    available = models.BooleanField(default=True)
 
     def __str__(self) -> str:
         return self.name
@@ -32,6 +44,11 @@ class Dish(models.Model):
 class Order(models.Model):
     class Meta:
         db_table = "orders"
+        indexes = [
+            # the admin changelist filters
+            models.Index(fields=["status"], name="orders_status_idx"),
+            models.Index(fields=["eta"], name="orders_eta_idx"),
+        ]
 
     status = models.CharField(
         max_length=50, choices=OrderStatus.choices(), default=OrderStatus.NOT_STARTED
@@ -40,6 +57,8 @@ class Order(models.Model):
     eta = models.DateField()
     total = models.PositiveIntegerField(null=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # the provider tracking (`data_classes.TrackingOrder`), moved here from the cache once the order is finished
+    tracking = models.JSONField(null=True, blank=True)
 
     def __str__(self) -> str:
         return f"[{self.pk}] {self.status} for {self.user.email}"
@@ -72,6 +91,54 @@ class Order(models.Model):
             )
 
 
+class ExternalOrder(models.Model):
+    """Maps an order at a provider to the internal order and restaurant."""
+
+    class Meta:
+        db_table = "external_orders"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["provider", "external_id"], name="external_orders_provider_external_id_uniq"
+            ),
+        ]
+
+    provider = models.CharField(max_length=20)
+    external_id = models.CharField(max_length=100)
+    order = models.ForeignKey("Order", on_delete=models.CASCADE, related_name="external_orders")
+    restaurant = models.ForeignKey("Restaurant", on_delete=models.CASCADE, null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"[{self.provider}] {self.external_id} -> {self.order_id}"
+
+
+class DishImport(models.Model):
+    """A CSV file of dishes (name,price,restaurant) upserted by `tasks.import_dishes`."""
+
+    class Meta:
+        db_table = "dish_imports"
+
+    file = models.FileField(upload_to="imports/dishes/")
+    status = models.CharField(max_length=20, choices=ImportStatus.choices(), default=ImportStatus.PENDING)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # progress: bytes of the file parsed, and rows
+    size = models.PositiveBigIntegerField(default=0)
+    position = models.PositiveBigIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # [[line, message], ...] of the first `importers.MAX_ERRORS` failed rows
+    errors = models.JSONField(default=list, blank=True)
+
+    def __str__(self) -> str:
+        return f"[{self.pk}] {self.file.name}: {self.status}"
+
+    @property
+    def progress(self) -> float:
+        return min(1.0, self.position / self.size) if self.size else 0.0
+
+
 class OrderItem(models.Model):
     class Meta:
         db_table = "order_items"
@@ -0,0 +1,141 @@
+import logging
+
+from django_redis import get_redis_connection
+
+from .models import ExternalOrder
+
+logger = logging.getLogger(__name__)
+
+
+class ExternalOrderIndex:
+    """
+    Index of provider orders: (provider, external_id) -> (order_id, restaurant_id).
+
+    The `external_orders` table is the source of truth, a Redis hash per provider
+    (`external_orders:<provider>`, external_id -> "order_id:restaurant_id") serves
+    the lookups. Entries missing in Redis (eviction, restart) are read from the
+    table and written back, `warm_up` reloads whole providers at once.
+    """
+
+    def __init__(self):
+        self.connection = get_redis_connection("default")
+
+    @staticmethod
+    def key(provider: str) -> str:
+        return f"external_orders:{provider}"
+
+    def register(self, provider: str, external_id: str, order_id: int, restaurant_id: int | None = None):
+        """
+        Stores the mapping of the provider order.
+
+        Args:
+            provider: The provider name, e.g. "kfc".
+            external_id: The order id at the provider.
+            order_id: The internal order id.
+            restaurant_id: The internal restaurant id the provider order was placed in.
+        """
+        ExternalOrder.objects.update_or_create(
+            provider=provider,
+            external_id=external_id,
+            defaults={"order_id": order_id, "restaurant_id": restaurant_id},
+        )
+        self.connection.hset(self.key(provider), external_id, self._encode(order_id, restaurant_id))
+
+    def resolve(self, provider: str, external_id: str) -> tuple[int, int | None] | None:
+        """Returns the (order_id, restaurant_id) of the provider order, or None if it is unknown."""
+        return self.resolve_many(provider, [external_id]).get(external_id)
+
+    def resolve_many(self, provider: str, external_ids: list[str]) -> dict[str, tuple[int, int | None]]:
+        """
+        Resolves many provider orders with one HMGET.
+
+        Args:
+            provider: The provider name, e.g. "kfc".
+            external_ids: The order ids at the provider.
+
+        Returns:
+            (order_id, restaurant_id) by external id, unknown ids are left out.
+        """
+        external_ids = list(dict.fromkeys(external_ids))
+        if not external_ids:
+            return {}
+
+        values = self.connection.hmget(self.key(provider), external_ids)
+        results = {
+            external_id: self._decode(value)
+            for external_id, value in zip(external_ids, values)
+            if value is not None
+        }
+
+        missing = [external_id for external_id in external_ids if external_id not in results]
+        if missing:
+            rows = ExternalOrder.objects.filter(provider=provider, external_id__in=missing).values_list(
+                "external_id", "order_id", "restaurant_id"
+            )
+            found = {external_id: (order_id, restaurant_id) for external_id, order_id, restaurant_id in rows}
+            if found:
+                logger.info(f"Restoring {len(found)} {provider} orders in the external order index")
+                self.connection.hset(
+                    self.key(provider), mapping={k: self._encode(*value) for k, value in found.items()}
+                )
+            results |= found
+
+        return results
+
+    def forget(self, order_ids: list[int]) -> int:
+        """
+        Drops the provider orders of finished orders from Redis, with one pipelined HDEL per provider.
+
+        They stay in the table, a late webhook of one is still resolved from it.
+
+        Returns:
+            The number of dropped entries.
+        """
+        external_ids: dict[str, list[str]] = {}
+        for provider, external_id in ExternalOrder.objects.filter(order_id__in=order_ids).values_list(
+            "provider", "external_id"
+        ):
+            external_ids.setdefault(provider, []).append(external_id)
+        if not external_ids:
+            return 0
+
+        pipeline = self.connection.pipeline(transaction=False)
+        for provider, ids in external_ids.items():
+            pipeline.hdel(self.key(provider), *ids)
+        return sum(pipeline.execute())
+
+    def warm_up(self, provider: str | None = None, batch_size: int = 1000) -> int:
+        """
+        Loads the index from the database into Redis, e.g. after a Redis restart.
+
+        Args:
+            provider: Only load this provider, all providers by default.
+            batch_size: The number of entries per DB fetch and per pipelined HSET.
+
+        Returns:
+            The number of loaded entries.
+        """
+        queryset = ExternalOrder.objects.order_by().values_list("provider", "external_id", "order_id", "restaurant_id")
+        if provider is not None:
+            queryset = queryset.filter(provider=provider)
+
+        loaded = 0
+        pipeline = self.connection.pipeline(transaction=False)
+
+        for row_provider, external_id, order_id, restaurant_id in queryset.iterator(chunk_size=batch_size):
+            pipeline.hset(self.key(row_provider), external_id, self._encode(order_id, restaurant_id))
+            loaded += 1
+            if loaded % batch_size == 0:
+                pipeline.execute()
+
+        pipeline.execute()
+        return loaded
+
+    @staticmethod
+    def _encode(order_id: int, restaurant_id: int | None) -> str:
+        return f"{order_id}:{restaurant_id or ''}"
+
+    @staticmethod
+    def _decode(value: bytes) -> tuple[int, int | None]:
+        order_id, _, restaurant_id = value.decode().partition(":")
+        return int(order_id), int(restaurant_id) if restaurant_id else None
@@ -1,7 +0,0 @@
-from enum import Enum
-
-
-class OrderStatus(str, Enum):
-    PENDING = "pending"
-    COOKING = "cooking"
-    COOKED = "cooked"
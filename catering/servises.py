@@ -1,51 +1,130 @@
+from typing import Iterable
 
-from dataclasses import dataclass, asdict, field
-from time import sleep
-from typing import Any
+import httpx
+from django.conf import settings
+from django.db import connection, transaction
 
 from config.celery import app as celery_app
 from providers import uklon, silpo, kfc
 
 from shared.cache import CacheService
-from .data_classes import TrackingOrder
-from .enums import OrderStatus
+from shared.http import get_concurrently
+from .data_classes import DeliveryTracking, RestaurantTracking, TrackingOrder
+from .enums import ADMIN_ORDER_TRANSITIONS, TERMINAL_ORDER_STATUSES, OrderStatus
 from .mapper import RESTAURANT_EXTERNAL_TO_INTERNAL
-from .models import Order, OrderItem, Restaurant
+from .models import ExternalOrder, Order, OrderItem, Restaurant
+from .order_index import ExternalOrderIndex
 from django.db.models import QuerySet
 
 
-@dataclass
-class TrackingOrder:
+def invalidate_order_details(order_ids: list[int]):
     """
-    {
-        17: {  // internal Order.id
-            "restaurant": {
-                "1": {  // internal restaurant id
-                      status: NOT_STARTED, // internal
-                      external_id: 13,
-                      request_body: {...},
-                },
-                2: { // internal restaurant id
-                    status: NOT_STARTED, // internal
-                    external_id: 14,
-                    request_body: {...},
-                },
-            },
-            delivery: {
-                status: NOT_STARTED, DELIVERY, DELIVERED 
-                location: (..., ....)}
-        },
-        18: ...
-    }
-                
+    Drops the cached order details (`views.order_details`) of the orders.
+
+    Must be called after the queryset `update()`s of orders, they do not send `post_save`.
     """
-    
-    restaurants: dict = field(default_factory=dict)
-    delivery_providers: dict = field(default_factory=dict)
+    CacheService().delete_many("order_details", [str(order_id) for order_id in order_ids])
+
+
+# provider -> the client cancelling its orders (`cancel_order(external_id)`)
+CANCEL_CLIENTS = {"silpo": silpo.Client, "kfc": kfc.Client}
+
+
+def transition_orders(order_ids: list[int], status: OrderStatus) -> list[int]:
+    """
+    Moves the orders to a status of `ADMIN_ORDER_TRANSITIONS` with one UPDATE.
+
+    Orders in a status the new one can not follow (e.g. delivered ones) are
+    left as they are. The status is checked and changed by the same
+    `UPDATE ... RETURNING` statement, so an order changed concurrently is
+    not overwritten once it left the allowed statuses.
+
+    Args:
+        order_ids: The orders to move.
+        status: The new status.
+
+    Returns:
+        The ids of the moved orders.
+    """
+    moved = update_status(order_ids, status, ADMIN_ORDER_TRANSITIONS[status])
+    invalidate_order_details(moved)
+    return moved
+
+
+def update_status(order_ids: list[int], status: OrderStatus, previous: Iterable[OrderStatus]) -> list[int]:
+    """
+    Moves the orders that are in one of the `previous` statuses to `status`.
+
+    The status is checked and changed by one `UPDATE ... RETURNING`
+    statement, so an order that a concurrent change already moved on is left
+    as it is.
+
+    Returns:
+        The ids of the moved orders.
+    """
+    allowed = sorted(previous_status.value for previous_status in previous)
+    if not order_ids or not allowed:
+        return []
+
+    quote_name = connection.ops.quote_name
+    table, pk = quote_name(Order._meta.db_table), quote_name(Order._meta.pk.column)
+    ids_placeholders, statuses_placeholders = ", ".join(["%s"] * len(order_ids)), ", ".join(["%s"] * len(allowed))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = %s WHERE {pk} IN ({ids_placeholders}) AND status IN ({statuses_placeholders})"
+            f" RETURNING {pk}",
+            [status.value, *order_ids, *allowed],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def mark_orders_cooked(order_ids: list[int]) -> list[int]:
+    """
+    Moves the orders still in cooking to COOKED and puts them into the delivery batching.
+
+    An order a late or repeated status update reports again (e.g. already in
+    DELIVERY) is not moved back, so its delivery is not booked twice.
+
+    Returns:
+        The ids of the orders moved to COOKED.
+    """
+    cooked = update_status(order_ids, OrderStatus.COOKED, (OrderStatus.NOT_STARTED, OrderStatus.COOKING))
+    invalidate_order_details(cooked)
+    for order_id in cooked:
+        schedule_delivery(order_id)
+    return cooked
+
+
+def cancel_provider_orders(order_ids: list[int]) -> list[tuple[str, str]]:
+    """
+    Cancels the restaurant orders of the orders, with concurrent requests to the providers.
+
+    Returns:
+        The (provider, external id) of the orders the providers did not cancel.
+    """
+    external_orders = list(
+        ExternalOrder.objects.filter(order_id__in=order_ids, provider__in=CANCEL_CLIENTS).values_list(
+            "provider", "external_id"
+        )
+    )
+
+    def cancel(external_order: tuple[str, str]) -> bool:
+        provider, external_id = external_order
+        try:
+            CANCEL_CLIENTS[provider].cancel_order(external_id)
+        except Exception as e:
+            # any failure is reported, it must not abort the cancellations of the other orders
+            print(f"Could not cancel the {provider} order {external_id}: {e!r}")
+            return False
+        return True
+
+    cancelled = get_concurrently(cancel, external_orders)
+    return [external_order for external_order, ok in cancelled.items() if not ok]
 
 
 def build_request_body(restaurant: Restaurant, items: QuerySet[OrderItem]) -> dict:
     """Builds a request body based on the restaurant."""
+    items = items.select_related("dish")
     if restaurant.name.lower() == "silpo":
         return {
             "items": [
@@ -68,265 +147,467 @@ def all_orders_cooked(order_id: int):
     Checks if all parts of an order are cooked.
     If so, updates the main order status and triggers delivery.
     """
-    from .models import Order  # Local import to prevent circular dependency
-
     cache = CacheService()
-    tracking_order_data = cache.get(namespace="orders", key=str(order_id))
+    tracking_order: TrackingOrder | None = cache.get(namespace="orders", key=str(order_id))
 
-    if not tracking_order_data:
+    if not tracking_order:
         print(f"No tracking order data found in cache for order_id: {order_id}")
         return
 
-    tracking_order = TrackingOrder(**tracking_order_data)
     all_cooked = all(
-        info["status"] == OrderStatus.COOKED.value
+        info.status == OrderStatus.COOKED.value
         for info in tracking_order.restaurants.values()
     )
 
     if all_cooked:
         print(f"All parts of order {order_id} are cooked. Updating status and starting delivery.")
-        Order.objects.filter(pk=order_id).update(status=OrderStatus.COOKED)
-        track_delivery.delay(order_id)
+        mark_orders_cooked([order_id])
     else:
         print(f"Order {order_id} is not fully cooked yet. Current statuses: {tracking_order.restaurants}")
 
 
+def delivery_batch_key(order: Order) -> str:
+    """
+    Builds the key of the delivery batch the order belongs to.
+
+    Orders are batched when they have the same `eta` (time slot) and are
+    cooked in the same set of restaurants, so one courier can pick them all up.
+    Expects `items__dish` to be prefetched when called for many orders.
+    """
+    restaurant_ids = sorted({item.dish.restaurant_id for item in order.items.all()})
+    return f"{order.eta.isoformat()}:{','.join(str(pk) for pk in restaurant_ids)}"
+
+
+def schedule_delivery(order_id: int):
+    """
+    Puts a cooked order into the delivery batching window.
+
+    The first order of a batch opens the window and schedules the dispatch,
+    every order cooked before the window closes is picked up by the same dispatch.
+    """
+    cache = CacheService()
+    order = Order.objects.prefetch_related("items__dish").get(pk=order_id)
+    batch_key = delivery_batch_key(order)
+
+    window_opened = cache.add(
+        namespace="delivery_batches",
+        key=batch_key,
+        value=order_id,
+        timeout=settings.DELIVERY_BATCH_WINDOW,
+    )
+    if window_opened:
+        print(f"Opened delivery batch {batch_key} for {settings.DELIVERY_BATCH_WINDOW}s")
+        dispatch_delivery_batch.apply_async(args=[batch_key], countdown=settings.DELIVERY_BATCH_WINDOW)
+    else:
+        print(f"Order {order_id} joined delivery batch {batch_key}")
+
+
+@celery_app.task(queue='high_priority')
+def dispatch_delivery_batch(batch_key: str):
+    """
+    Books one multi-stop delivery per group of cooked orders in the batch.
+
+    Cooked orders are locked and moved to DELIVERY_LOOKUP in one UPDATE, so an
+    order can never be booked twice, even if the windows of two batches overlap.
+
+    Args:
+        batch_key (str): The key built by `delivery_batch_key`.
+    """
+    eta, _, _ = batch_key.partition(":")
+
+    with transaction.atomic():
+        orders = (
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status=OrderStatus.COOKED, eta=eta)
+            .prefetch_related("items__dish")
+            .order_by("pk")
+        )
+        order_ids = [order.pk for order in orders if delivery_batch_key(order) == batch_key]
+        Order.objects.filter(pk__in=order_ids).update(status=OrderStatus.DELIVERY_LOOKUP)
+    invalidate_order_details(order_ids)
+
+    size = settings.DELIVERY_BATCH_MAX_ORDERS
+    for start in range(0, len(order_ids), size):
+        order_delivery.delay(order_ids[start:start + size])
+
+    print(f"Dispatched delivery batch {batch_key}: {order_ids}")
+
+
+def update_delivery_tracking(order_ids: list[int], delivery: DeliveryTracking):
+    """Updates the Uklon delivery info of every tracked order in the batch, one MGET and one pipelined SET."""
+    cache = CacheService()
+    tracking_orders = cache.get_many("orders", [str(order_id) for order_id in order_ids])
+
+    changed = {}
+    for order_id in order_ids:
+        tracking_order = tracking_orders.get(str(order_id))
+        if not tracking_order:
+            print(f"No tracking order data found in cache for order_id: {order_id}")
+            continue
+
+        tracking_order.delivery_providers["uklon"] = delivery
+        changed[str(order_id)] = tracking_order
+
+    cache.set_many("orders", changed)
+
+
+def archive_tracking(order_ids: list[int]):
+    """
+    Moves the tracking of finished orders from the cache to `Order.tracking`.
+
+    One MGET, one UPDATE and one DEL for the whole list, so Redis only keeps
+    the orders in processing. Their provider orders are dropped from the Redis
+    part of the `ExternalOrderIndex` too.
+    """
+    cache = CacheService()
+    keys = [str(order_id) for order_id in order_ids]
+    tracking_orders = cache.get_many("orders", keys)
+
+    Order.objects.bulk_update(
+        [Order(pk=int(key), tracking=tracking_order.to_dict()) for key, tracking_order in tracking_orders.items()],
+        ["tracking"],
+    )
+    cache.delete_many("orders", keys)
+    ExternalOrderIndex().forget(order_ids)
+
+
+def sweep_tracking(batch_size: int, max_batches: int) -> int:
+    """
+    Removes the tracking entries Redis should not keep anymore.
+
+    Entries of finished orders are archived, entries of deleted orders are
+    dropped. The keys are scanned in batches of `batch_size`, at most
+    `max_batches` per call, the scan continues from the same cursor next time.
+
+    Returns:
+        The number of removed entries.
+    """
+    cache = CacheService()
+    cursor = cache.get(namespace="sweeps", key="orders") or 0
+    removed = 0
+
+    for _ in range(max_batches):
+        cursor, keys = cache.scan("orders", cursor, count=batch_size)
+        order_ids = [int(key) for key in keys if key.isdigit()]
+        statuses = dict(Order.objects.filter(pk__in=order_ids).values_list("pk", "status"))
+
+        finished = [order_id for order_id, status in statuses.items() if status in TERMINAL_ORDER_STATUSES]
+        orphaned = [key for key in keys if not key.isdigit() or int(key) not in statuses]
+        archive_tracking(finished)
+        cache.delete_many("orders", orphaned)
+        removed += len(finished) + len(orphaned)
+
+        if cursor == 0:
+            break
+
+    cache.set(namespace="sweeps", key="orders", value=cursor)
+    print(f"Swept {removed} tracking orders")
+    return removed
+
+
 @celery_app.task(queue='default')
-def order_delivery(order_id: int):
+def order_delivery(order_ids: list[int]):
     '''
-    Long polling requests to the delivery API
-    get order from cache
-    is external id
-       no: make order
-       yes: get order
+    Books the delivery of a batch of orders delivered by one courier
+       make one multi-stop order
+       its progress is polled with all other deliveries by `poll_deliveries`
     '''
-    print(f"Starting delivery processing")
+    print(f"Starting delivery processing for orders {order_ids}")
 
     provider = uklon.Client()
-    cache = CasheService()
-    order = Order.objects.get(pk=order_id)
+    orders = Order.objects.filter(pk__in=order_ids)
 
-    order_status = OrderStatus.DELIVERY_LOOKUP
-    order.save()
-
-    # prepare data for the first request
+    # prepare data for the first request, every restaurant is a single stop
     addresses: list[str] = []
     comments: list[str] = []
 
-    for rest_name, address in order.delivery_meta():
+    restaurants = (
+        OrderItem.objects.filter(order__in=order_ids)
+        .values_list("dish__restaurant__name", "dish__restaurant__address")
+        .distinct()
+    )
+    for rest_name, address in restaurants:
         addresses.append(f"{rest_name}, {address}")
-        comments.append(f"Please deliver to {rest_name}")  
-   
-    #  NOTE: Only UKLON is currently supported so no selection in here
-    order.status = Order.DELIVERY
-    order.save()
+        comments.append(f"Please pick up orders {order_ids} in {rest_name}")
 
-    response: uklon.OrderResponse = provider.create_order(
-        uklon.OrderRequestBody(
-            adress=addresses,
-            comment=comments,
+    #  NOTE: Only UKLON is currently supported so no selection in here
+    try:
+        response: uklon.OrderResponse = provider.create_order(
+            uklon.OrderRequestBody(
+                adress=addresses,
+                comment=comments,
+                )
             )
-        )
-    
-    tracking_order = TrackingOrder(**cache.get(namespace="orders", key=str(order.pk)))
-    tracking_order.delivery["status"] = OrderStatus.DELIVERY
-    tracking_order.delivery["location"] = response.location
-
-    current_status: uklon.OrderStaus = response.status
+    except httpx.HTTPError as e:
+        # nothing is booked yet, so the whole task can be retried
+        raise order_delivery.retry(exc=e, countdown=2 ** order_delivery.request.retries, max_retries=5)
 
-    while current_status != uklon.OrderStatus.DELIVERED:
-        response = provider.get_order(response.id)
+    orders.update(status=OrderStatus.DELIVERY, delivery_provider="uklon")
+    invalidate_order_details(order_ids)
 
-        print(f"Uklon [{response.status}]: {response.location}")
-
-        if current_status == response.status:
-            sleep(1)
-            continue
+    delivery = DeliveryTracking(
+        external_id=response.id,
+        status=OrderStatus.DELIVERY,
+        location=response.location,
+    )
+    update_delivery_tracking(order_ids, delivery)
 
-        current_status = response.status  # DELIVERY, DELIVERED
+    print(f"Booked Uklon delivery {response.id} for orders {order_ids}")
 
-        tracking_order.delivery["location"] = response.location
 
-        # UPDATE CACHE WITH NEW STATUS
-        cache.set("orders", str(order_id), asdict(tracking_order))
-        print(f"Uklon [{response.status}]: {response.location}")
+def poll_deliveries() -> int:
+    """
+    Refreshes every Uklon delivery in progress with one bulk lookup (`uklon.Client.get_orders`).
 
-        # UPDETУ STORAGE
-        order.objects.filter(pk=order_id).update(status=OrderStatus.DELIVERED)
+    The locations are written to the tracking with one MGET and one SET,
+    delivered orders are finished with one UPDATE and archived together.
 
-        # update the cache
-        tracking_order.delivery["status"] = OrderStatus.DELIVERED
-        cache.set("orders", str(order_id), asdict(tracking_order))
+    Returns:
+        The number of polled deliveries.
+    """
+    cache = CacheService()
+    order_ids = Order.objects.filter(status=OrderStatus.DELIVERY, delivery_provider="uklon").values_list(
+        "pk", flat=True
+    )
+    tracking_orders = cache.get_many("orders", [str(order_id) for order_id in order_ids])
+
+    # external id -> the keys of the orders it delivers
+    deliveries: dict[str, list[str]] = {}
+    for key, tracking_order in tracking_orders.items():
+        delivery = tracking_order.delivery_providers.get("uklon")
+        if delivery and delivery.external_id:
+            deliveries.setdefault(delivery.external_id, []).append(key)
+    if not deliveries:
+        return 0
+
+    changed, delivered = {}, []
+    for external_id, response in uklon.Client.get_orders(list(deliveries)).items():
+        status = OrderStatus.DELIVERED if response.status == uklon.OrderStatus.DELIVERED else OrderStatus.DELIVERY
+        for key in deliveries[external_id]:
+            delivery = tracking_orders[key].delivery_providers["uklon"]
+            if (delivery.status, delivery.location) != (status, response.location):
+                delivery.status, delivery.location = status, response.location
+                changed[key] = tracking_orders[key]
+            if status == OrderStatus.DELIVERED:
+                delivered.append(int(key))
+
+    cache.set_many("orders", changed)
+    if delivered:
+        Order.objects.filter(pk__in=delivered).update(status=OrderStatus.DELIVERED)
+        invalidate_order_details(delivered)
+        archive_tracking(delivered)
+        print(f"DONE with delivery of orders {delivered}")
+    return len(deliveries)
+
+
+def restaurant_items(order_id: int, restaurant: Restaurant) -> QuerySet[OrderItem]:
+    """The items of the order cooked in the restaurant."""
+    return OrderItem.objects.filter(order_id=order_id, dish__restaurant=restaurant).select_related("dish")
+
+
+def get_tracking_order(order_id: int) -> TrackingOrder:
+    """
+    Returns the tracking of the order from the cache, rebuilt if the entry expired.
 
-        print("DONE with delivery")
-        
+    The rebuilt tracking has a part per restaurant of the order, with the
+    external ids of the provider orders already placed (`ExternalOrder`).
+    """
+    tracking_order: TrackingOrder | None = CacheService().get(namespace="orders", key=str(order_id))
+    if tracking_order is not None:
+        return tracking_order
+
+    print(f"No tracking order data found in cache for order_id: {order_id}, rebuilding it")
+    external_ids = dict(
+        ExternalOrder.objects.filter(order_id=order_id, restaurant__isnull=False).values_list(
+            "restaurant_id", "external_id"
+        )
+    )
+    restaurant_ids = OrderItem.objects.filter(order_id=order_id).values_list("dish__restaurant_id", flat=True)
+    return TrackingOrder(
+        restaurants={
+            str(restaurant_id): RestaurantTracking(
+                external_id=external_ids.get(restaurant_id), status=OrderStatus.NOT_STARTED
+            )
+            for restaurant_id in set(restaurant_ids)
+        }
+    )
 
 
-@celery_app.task(queue='high_priority')
-def order_in_silpo(order_id: int, items: QuerySet[OrderItem] = None):
-    """Processes and tracks an order for the Silpo restaurant using short polling.
+# provider errors (e.g. 503 when overloaded) are retried, the tracking in the cache lets the task resume
+@celery_app.task(queue='high_priority', autoretry_for=(httpx.HTTPError,), retry_backoff=True, max_retries=5)
+def order_in_silpo(order_id: int):
+    """Places the Silpo part of an order.
 
-    This Celery task communicates with the Silpo API to manage a part of a larger order.
-    It first checks the cache for an existing external order ID. If one is not found,
-    it creates a new order with the provided items. It then repeatedly polls the
-    Silpo API to get status updates. When the status changes, it updates the
-    order's state in the cache. Once the order status becomes 'COOKED', it stops
-    polling and calls `all_orders_cooked` to check if the entire multi-restaurant
-    order is ready for the next stage (e.g., delivery).
+    A retried task does not order twice: it stops if the tracking or
+    `ExternalOrder` already has the Silpo order, and the order is created with
+    an idempotency key, so Silpo returns the first order if only the response
+    of the create was lost. Its status is then polled together with all other
+    Silpo orders in cooking by `poll_silpo_orders`.
 
     Args:
         order_id (int): The primary key of the internal `Order` being processed.
-        items (QuerySet[OrderItem], optional): A QuerySet of `OrderItem` instances
-            that belong to the Silpo portion of the order. This is used when
-            creating the order for the first time. Defaults to None.
 
     Returns:
         None
     """
     client = silpo.Client()
-    cache = CasheService()
+    cache = CacheService()
     restaurant = Restaurant.objects.get(name="Silpo")
-    order = Order.objects.get(pk=order_id)
-    
-    def get_internal_status(status: silpo.OrderStatus) -> OrderStatus:
-        return RESTAURANT_EXTERNAL_TO_INTERNAL["silpo"][status]
-
-    cooked = False
-    while not cooked:
-        sleep(1)
-                
-        tracking_order = TrackingOrder(
-            **cache.get(namespace="order", key=str(order.pk))
-        )
-        silpo_order = tracking_order.restaurants.get(str(restaurant.pk))
-        
-        if not silpo_order:
-            raise ValueError("No Silpo in order processing")
-
-        # PRINT CURRENT STATUS
-        print(f"CURRENT SILPO ORDER STATUS: {silpo_order['status']}")
-        
-        if not silpo_order["external_id"]:
-            #  Make thу first request if not started
-            response: silpo.OrderResponse = client.create_order(
-                silpo.OrderRequestBody(
-                    order=[
-                        silpo.OrderItem(dish=item.dish.name, quantity=item.quantity)
-                        for item in items
-                    ]
-                    )
-            )
-            internal_status: OrderStatus = get_internal_status(response.status)
-
-            tracking_order.restaurants[str(restaurant.pk)] = {
-                "external_id": response.id,
-                "status": internal_status
-            }
-
-        # Update cache
-            cache.set(
-                namespace="order", 
-                key=str(order.pk), 
-                value=asdict(tracking_order)
-                )
-        else:
-            # IF ALREADY HAVE EXTERNAL ID - JUST RETRIVE THE ORER
-            # PASS EXTERNAL SILPO ORDER
-            response = client.get_order(silpo_order["external_id"])
-            internal_status = get_internal_status(response.status)
-            print("Tracking for Silpo Order with HTTP GET /orders")
-            
-            if silpo_order["status"] != internal_status:
-                tracking_order.restaurants[str(restaurant.pk)]["status"] = internal_status
-                cache.set(
-                    namespace="orders", 
-                    key=str(order_id), 
-                    value=asdict(tracking_order)
-                )
-            if internal_status == OrderStatus.COOKED:
-                cooked = True
-                all_orders_cooked(order.pk)
 
+    tracking_order = get_tracking_order(order_id)
+    silpo_order = tracking_order.restaurants.get(str(restaurant.pk))
+    if not silpo_order:
+        raise ValueError("No Silpo in order processing")
+    if silpo_order.external_id or ExternalOrder.objects.filter(
+        provider="silpo", order_id=order_id, restaurant=restaurant
+    ).exists():
+        return
 
-@celery_app.task(queue='high_priority')
-def order_in_kfc(order_id: int, items):
+    response: silpo.OrderResponse = client.create_order(
+        silpo.OrderRequestBody(
+            order=[
+                silpo.OrderItem(dish=item.dish.name, quantity=item.quantity)
+                for item in restaurant_items(order_id, restaurant)
+            ]
+        ),
+        idempotency_key=f"order-{order_id}-{restaurant.pk}",
+    )
+    ExternalOrderIndex().register("silpo", response.id, order_id, restaurant.pk)
+
+    silpo_order.external_id = response.id
+    silpo_order.status = RESTAURANT_EXTERNAL_TO_INTERNAL["silpo"][response.status]
+    print(f"Created Silpo Order. External ID: {response.id}, Status: {silpo_order.status}")
+    cache.set(namespace="orders", key=str(order_id), value=tracking_order)
+
+
+def poll_silpo_orders() -> int:
+    """
+    Refreshes the status of every Silpo order in cooking with one bulk lookup (`silpo.Client.get_orders`).
+
+    The tracking is read with one MGET and the changes written with one SET,
+    orders whose Silpo part got cooked go on with `all_orders_cooked`.
+
+    Returns:
+        The number of polled Silpo orders.
+    """
+    cache = CacheService()
+    in_cooking = list(
+        ExternalOrder.objects.filter(
+            provider="silpo", order__status__in=(OrderStatus.NOT_STARTED, OrderStatus.COOKING)
+        ).values_list("external_id", "order_id", "restaurant_id")
+    )
+    tracking_orders = cache.get_many("orders", [str(order_id) for _, order_id, _ in in_cooking])
+
+    # external id -> (order key, the Silpo part of its tracking)
+    polled: dict[str, tuple[str, RestaurantTracking]] = {}
+    for external_id, order_id, restaurant_id in in_cooking:
+        tracking_order = tracking_orders.get(str(order_id))
+        silpo_order = tracking_order.restaurants.get(str(restaurant_id)) if tracking_order else None
+        if silpo_order and silpo_order.status != OrderStatus.COOKED:
+            polled[external_id] = (str(order_id), silpo_order)
+    if not polled:
+        return 0
+
+    changed, cooked = {}, []
+    for external_id, response in silpo.Client.get_orders(list(polled)).items():
+        key, silpo_order = polled[external_id]
+        if response.status == silpo.OrderStatus.CANCELLED:
+            print(f"Silpo order {external_id} was cancelled")
+            continue
+
+        status = RESTAURANT_EXTERNAL_TO_INTERNAL["silpo"][response.status]
+        if silpo_order.status != status:
+            silpo_order.status = status
+            changed[key] = tracking_orders[key]
+            if status == OrderStatus.COOKED:
+                cooked.append(int(key))
+
+    cache.set_many("orders", changed)
+    for order_id in cooked:
+        all_orders_cooked(order_id)
+    return len(polled)
+
+
+# provider errors (e.g. 503 when overloaded) are retried, the tracking in the cache lets the task resume
+@celery_app.task(queue='high_priority', autoretry_for=(httpx.HTTPError,), retry_backoff=True, max_retries=5)
+def order_in_kfc(order_id: int):
+    """Places the KFC part of an order, its status then comes with the KFC webhooks.
+
+    A retried task does not order twice: it stops if the tracking or
+    `ExternalOrder` already has the KFC order, and the order is created with
+    an idempotency key, so KFC returns the first order if only the response
+    of the create was lost.
+
+    Args:
+        order_id (int): The primary key of the internal `Order` being processed.
+    """
     client = kfc.Client()
-    cache = CasheService()
+    cache = CacheService()
     restaurant = Restaurant.objects.get(name="KFC")
 
     def get_internal_status(status: kfc.OrderStatus) -> OrderStatus:
         return RESTAURANT_EXTERNAL_TO_INTERNAL["kfc"][status]
 
     # GER TRACKING ORDER FROM CACHE
-    tracking_order = TrackingOrder(
-        **cache.get(namespace="orders", key=str(order_id))
-    )
+    tracking_order = get_tracking_order(order_id)
+    kfc_order = tracking_order.restaurants.setdefault(str(restaurant.pk), RestaurantTracking())
+    if kfc_order.external_id or ExternalOrder.objects.filter(
+        provider="kfc", order_id=order_id, restaurant=restaurant
+    ).exists():
+        return
 
     response: kfc.OrderResponse = client.create_order(
         kfc.OrderRequestBody(
             order=[
                 kfc.OrderItem(dish=item.dish.name, quantity=item.quantity)
-                for item in items
+                for item in restaurant_items(order_id, restaurant)
             ]
-        )
+        ),
+        idempotency_key=f"order-{order_id}-{restaurant.pk}",
     )
     internal_status = get_internal_status(response.status)
 
     #  UPDATE CACHE WITH EXTERNAL ID AND STATE
-    tracking_order.restaurants[str(restaurant.pk)] = {
-        "external_id": response.id,
-        "status": internal_status,
-    }
+    kfc_order.external_id = response.id
+    kfc_order.status = internal_status
 
     print(f"Created KFC Order. External ID: {response.id}, Status: {internal_status}") 
     cache.set(
         namespace="orders", 
         key=str(order_id), 
-        value=asdict(tracking_order)
-    )
-    # SAVE ANOTHER ITEM FORM MAPPING TO THE INTERNAL ORDER
-
-    cache.set(
-        namespace="kfc_orders",
-        key=str(response.id),
-        value={
-            "internal_order_id": order_id,            
-        }
+        value=tracking_order
     )
+    # SAVE THE MAPPING TO THE INTERNAL ORDER FOR THE WEBHOOKS
+    ExternalOrderIndex().register("kfc", response.id, order_id, restaurant.pk)
 
     
-def build_request_body(restaurant, items):
-    # Logic to build the request body for the specific restaurant
-    pass
-
-
 def schedule_order(order: Order):
     # Logic to schedule order processing
-    cache = CasheService()
+    cache = CacheService()
     tracking_order = TrackingOrder()
     
     items_by_restaurant = order.items_by_restaurant()
     for restaurant, items in items_by_restaurant.items():
-        tracking_order.restaurants[str(restaurant.pk)] = {
-            "external_id": None,
-            "status": OrderStatus.NOT_STARTED,
-            "request_body": build_request_body(restaurant, items)
-        }
+        tracking_order.restaurants[str(restaurant.pk)] = RestaurantTracking(
+            external_id=None,
+            status=OrderStatus.NOT_STARTED,
+            request_body=build_request_body(restaurant, items),
+        )
 
 
 
-    cache.set(namespace="order", 
+    cache.set(namespace="orders", 
               key=str(order.pk), 
-              value=asdict(tracking_order))
+              value=tracking_order)
 
     
     for restaurant, items in items_by_restaurant.items():
         match restaurant.name.lower():
             case "silpo":
-                order_in_silpo.delay(order.pk, items)
+                order_in_silpo.delay(order.pk)
                 # order_in_silpo.apply_async()
             case "kfc":
-                order_in_kfc.delay(order.pk, items)
+                order_in_kfc.delay(order.pk)
             case _:
                 # It's good practice to have a default case
                 print(f"Unknown restaurant: {restaurant.name}")
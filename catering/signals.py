@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shared.cache import CacheService
+from .models import Dish, Order, Restaurant
+from .servises import invalidate_order_details
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+@receiver([post_save, post_delete], sender=Dish)
+def invalidate_menu(sender, **kwargs):
+    """Drops the cached menu (`views.restaurants_menu`) in Redis and in the L1 caches of all processes."""
+    CacheService().delete(namespace="menu", key="restaurants")
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order(sender, instance: Order, **kwargs):
+    invalidate_order_details([instance.pk])
@@ -1,11 +1,11 @@
 import logging
-import json
 from celery import shared_task
-from shared.cache import CacheService
-from .servises import all_orders_cooked
-from .mapper import RESTAURANT_EXTERNAL_TO_INTERNAL
-from .data_classes import TrackingOrder
+from .webhooks import parse_kfc_webhook, process_kfc_webhooks
 from .enums import OrderStatus
+from .importers import DishImporter
+from .menu_sync import MENU_PROVIDERS, sync_provider_menu
+from .models import DishImport, Order
+from . import servises
 
 
 logger = logging.getLogger(__name__)
@@ -14,52 +14,19 @@ logger = logging.getLogger(__name__)
 @shared_task(queue='high_priority')
 def process_kfc_webhook_data(data: dict):
     """
-    Processes webhook data from KFC, updates order status in cache,
-    and checks if the entire order is ready for delivery.
+    Processes a single KFC webhook.
+
+    Webhooks are consumed from the Redis Stream in batches (`manage.py consume_webhooks`),
+    this task only drains the webhooks that were queued before the switch.
     """
     logger.info(f"Processing KFC webhook data: {data}")
-    cache = CacheService()
-    
-    external_order_id = data.get("id")
-    external_status = data.get("status")
 
-    if not external_order_id or not external_status:
+    event = parse_kfc_webhook(data)
+    if event is None:
         logger.error(f"Invalid data received in KFC webhook: {data}")
         return
 
-    # --- Optimized search ---
-    # Get internal order ID directly from cache
-    order_info_json = cache.get("external_to_internal_map", str(external_order_id))
-    if not order_info_json:
-        logger.warning(f"Could not find internal order for KFC external_id: {external_order_id}")
-        return
-
-    order_info = json.loads(order_info_json)
-    internal_order_id = order_info.get("order_id")
-    internal_restaurant_id = order_info.get("restaurant_id")
-    # --- End of optimized search ---
-            
-    if not internal_order_id:
-        logger.warning(f"Could not find internal order for KFC external_id: {external_order_id}")
-        return
-
-    # Update the status in the cache
-    tracking_order_dict = cache.get("orders", str(internal_order_id))
-    if not tracking_order_dict:
-        logger.error(f"Tracking data for order {internal_order_id} not found in cache.")
-        return
-        
-    tracking_order = TrackingOrder(**tracking_order_dict)
-
-    internal_status = RESTAURANT_EXTERNAL_TO_INTERNAL["kfc"][external_status]
-    # Ensure restaurant_id is a string, as in TrackingOrder
-    tracking_order.restaurants[str(internal_restaurant_id)]["status"] = internal_status
-    
-    cache.set("orders", str(internal_order_id), tracking_order.to_dict())
-    logger.info(f"Updated order {internal_order_id} for restaurant {internal_restaurant_id} to status {internal_status}")
-
-    # Check if all parts of the order are cooked
-    all_orders_cooked(internal_order_id)
+    process_kfc_webhooks([event])
 
 
 @shared_task(queue='high_priority')
@@ -73,10 +40,51 @@ def process_order(order_id):
     logger.info(f"Order {order.id} processed successfully")
 
 
-# You can add other tasks like schedule_order here if they exist
-@shared_task
+@shared_task(queue='high_priority')
 def schedule_order(order_id: int):
-    # Placeholder for schedule_order logic if needed
+    """Starts cooking the order in every restaurant it has dishes from."""
     logger.info(f"Scheduling order {order_id}")
-    pass
+    servises.schedule_order(Order.objects.get(pk=order_id))
+
+
+@shared_task(queue='high_priority')
+def poll_silpo_orders():
+    """Refreshes all Silpo orders in cooking with one request, run every few seconds by Celery beat."""
+    servises.poll_silpo_orders()
+
+
+@shared_task(queue='default')
+def poll_deliveries():
+    """Refreshes all Uklon deliveries in progress with one request, run every few seconds by Celery beat."""
+    servises.poll_deliveries()
+
+
+@shared_task(queue='low_priority')
+def sweep_tracking(batch_size: int = 500, max_batches: int = 20):
+    """Archives or drops the tracking entries of finished and deleted orders, run periodically by Celery beat."""
+    servises.sweep_tracking(batch_size=batch_size, max_batches=max_batches)
+
+
+@shared_task(queue='low_priority')
+def import_dishes(import_id: int):
+    """Upserts the dishes of a CSV file uploaded in the admin."""
+    DishImporter(DishImport.objects.get(pk=import_id)).run()
+
+
+@shared_task(queue='low_priority')
+def sync_menus():
+    """Pulls the menus of the restaurant providers, run periodically by Celery beat."""
+    for provider in MENU_PROVIDERS:
+        try:
+            sync_provider_menu(provider)
+        except Exception as e:
+            logger.error(f"Could not sync the {provider} menu: {e}")
+
 
+@shared_task(queue='default')
+def finish_orders(order_ids: list[int]):
+    """Cancels the restaurant orders of orders cancelled or failed in the admin and archives their tracking."""
+    failed = servises.cancel_provider_orders(order_ids)
+    if failed:
+        logger.error(f"Could not cancel the provider orders {failed} of orders {order_ids}")
+    servises.archive_tracking(order_ids)
@@ -1,19 +1,46 @@
 import asyncio
+import os
 import uuid
 import random
 import httpx
 
+from contextlib import asynccontextmanager
 from typing import Literal
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Header, HTTPException
 from pydantic import BaseModel
 
+from mock_config import chance, duration
 
-OrderStatus = Literal["not_started", "cooking", "cooked", "completed"]
+
+OrderStatus = Literal["not_started", "cooking", "cooked", "completed", "cancelled"]
 STORAGE: dict[str, OrderStatus] = {}
-CATERING_API_WEBHOOK_URL = "https://localhost:8000/webhooks/kfc/635179a5-caaa-41f8-84cc-ca5a40ee7044/"
+# Idempotency-Key header -> the order created with it
+IDEMPOTENCY_KEYS: dict[str, str] = {}
+# the menu synced by catering.menu_sync, MOCK_MENU_SIZE adds generated dishes
+MENU = [
+    {"id": "kfc-1", "name": "Burger", "price": 12},
+    {"id": "kfc-2", "name": "Wings", "price": 11},
+    {"id": "kfc-3", "name": "Fries", "price": 5},
+    {"id": "kfc-4", "name": "Bucket", "price": 25},
+]
+MENU += [
+    {"id": f"kfc-{i}", "name": f"Dish {i}", "price": 10 + i % 20}
+    for i in range(len(MENU) + 1, int(os.getenv("MOCK_MENU_SIZE", 0)) + 1)
+]
+CATERING_API_WEBHOOK_URL = os.getenv(
+    "KFC_WEBHOOK_URL", "http://localhost:8000/api/v1/catering/webhooks/kfc/"
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one keep-alive connection pool for all webhook notifications
+    app.state.http_client = httpx.AsyncClient(timeout=5.0)
+    yield
+    await app.state.http_client.aclose()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 class OrderItem(BaseModel):
@@ -27,34 +54,65 @@ class OrderRequestBody(BaseModel):
 async def update_order_status(order_id: str):
     ORDER_STATUSES: tuple[OrderStatus,...] = ("cooking", "cooked", "completed")
     for status in ORDER_STATUSES:
-        await asyncio.sleep(random.uniform(1,2))
+        await asyncio.sleep(duration("MOCK_COOKING_TIME", "uniform:1,2"))
+        if STORAGE[order_id] == "cancelled":
+            return
         STORAGE[order_id] = status
         
-        async with httpx.AsyncClient() as client:
+        # webhooks are retried by the provider, the API has to drop the duplicates
+        for _ in range(2 if chance("MOCK_WEBHOOK_DUPLICATE_RATE") else 1):
             try:
-                await client.post(
+                await app.state.http_client.post(
                     CATERING_API_WEBHOOK_URL, data={"id": order_id, "status": status}
                 )
-            except httpx.ConnectError as e:
-                print("API connection failed")
+            except httpx.RequestError as e:
+                print(f"API connection failed: {e}")
             else:
                 print(f"KFC: {CATERING_API_WEBHOOK_URL} notified about {status}")
 
 
 @app.post("/api/orders")
-async def make_order(body: OrderRequestBody, background_tasks: BackgroundTasks):
+async def make_order(
+    body: OrderRequestBody, background_tasks: BackgroundTasks, idempotency_key: str | None = Header(default=None)
+):
     print(body)
-    
+    if idempotency_key in IDEMPOTENCY_KEYS:
+        order_id = IDEMPOTENCY_KEYS[idempotency_key]
+        return {"id": order_id, "status": STORAGE[order_id]}
+    if chance("MOCK_ERROR_RATE"):
+        raise HTTPException(status_code=503, detail="KFC is overloaded")
+
     order_id = str(uuid.uuid4())
     STORAGE[order_id] = "not_started"
+    if idempotency_key:
+        IDEMPOTENCY_KEYS[idempotency_key] = order_id
     background_tasks.add_task(update_order_status, order_id)
     
-    return {
-        "order_id": order_id,
-        "status": STORAGE[order_id],
-        "message": "Order has been placed and is being processed."
-    }
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+@app.get("/api/orders")
+async def get_orders_bulk(ids: str):
+    """Bulk status lookup: GET /api/orders?ids=<id>,<id>,... Unknown ids are skipped."""
+    return [{"id": order_id, "status": STORAGE[order_id]} for order_id in ids.split(",") if order_id in STORAGE]
 
 @app.get("/api/orders/{order_id}")
 async def get_orders(order_id: str):
-    return STORAGE.get(order_id, {"error": "No such order found"})
\ No newline at end of file
+    if order_id not in STORAGE:
+        raise HTTPException(status_code=404, detail="No such order found")
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+
+@app.post("/api/orders/{order_id}/cancel")
+async def cancel_order(order_id: str):
+    if order_id not in STORAGE:
+        raise HTTPException(status_code=404, detail="No such order found")
+    if STORAGE[order_id] == "completed":
+        raise HTTPException(status_code=409, detail="The order is already completed")
+
+    STORAGE[order_id] = "cancelled"
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+
+@app.get("/api/menu")
+async def get_menu():
+    return {"items": MENU}
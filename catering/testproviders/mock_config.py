@@ -0,0 +1,45 @@
+"""
+Behaviour of the mock providers, configured with environment variables.
+
+Durations are drawn from a distribution given as "<kind>:<args>":
+
+    MOCK_COOKING_TIME="uniform:1,2"    # every cooking step (silpo, kfc)
+    MOCK_DRIVER_LOOKUP_TIME="uniform:1,2"  # before the delivery starts (uklon)
+    MOCK_DELIVERY_TIME="normal:3,0.5"  # every delivery stop (uklon), whole delivery (uber)
+    MOCK_COOKING_TIME="exp:1.5"        # exponential with the mean of 1.5s
+    MOCK_COOKING_TIME="const:0.2"
+
+    MOCK_ERROR_RATE=0.05               # share of order creations answered with 503
+    MOCK_WEBHOOK_DUPLICATE_RATE=0.1    # share of webhooks sent twice (kfc, uber)
+    MOCK_MENU_SIZE=5000                # dishes in the menu (silpo, kfc), at least the fixed ones
+
+`manage.py loadtest` starts the mocks with these variables.
+"""
+
+import os
+import random
+from functools import cache
+
+DISTRIBUTIONS = {
+    "const": lambda value: value,
+    "uniform": random.uniform,
+    "normal": random.gauss,
+    "exp": lambda mean: random.expovariate(1 / mean),
+}
+
+
+@cache
+def _distribution(spec: str):
+    kind, _, args = spec.rpartition(":")
+    return DISTRIBUTIONS[kind or "uniform"], [float(arg) for arg in args.split(",")]
+
+
+def duration(name: str, default: str) -> float:
+    """Draws a duration in seconds from the distribution in the environment variable `name`."""
+    function, args = _distribution(os.getenv(name, default))
+    return max(function(*args), 0.0)
+
+
+def chance(name: str) -> bool:
+    """Returns True with the probability in the environment variable `name` (0 by default)."""
+    return random.random() < float(os.getenv(name, 0))
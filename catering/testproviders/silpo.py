@@ -1,14 +1,30 @@
 import asyncio
+import os
 import uuid
 import random
 
 from typing import Literal
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Header, HTTPException
 from pydantic import BaseModel
 
+from mock_config import chance, duration
 
-OrderStatus = Literal["not_started", "cooking", "cooked", "completed"]
+
+OrderStatus = Literal["not_started", "cooking", "cooked", "completed", "cancelled"]
 STORAGE: dict[str, OrderStatus] = {}
+# Idempotency-Key header -> the order created with it
+IDEMPOTENCY_KEYS: dict[str, str] = {}
+# the menu synced by catering.menu_sync, MOCK_MENU_SIZE adds generated dishes
+MENU = [
+    {"id": "silpo-1", "name": "Salad", "price": 10},
+    {"id": "silpo-2", "name": "Borscht", "price": 12},
+    {"id": "silpo-3", "name": "Varenyky", "price": 9},
+    {"id": "silpo-4", "name": "Syrnyky", "price": 8},
+]
+MENU += [
+    {"id": f"silpo-{i}", "name": f"Dish {i}", "price": 10 + i % 20}
+    for i in range(len(MENU) + 1, int(os.getenv("MOCK_MENU_SIZE", 0)) + 1)
+]
 
 
 app = FastAPI()
@@ -25,24 +41,54 @@ class OrderRequestBody(BaseModel):
 async def update_order_status(order_id: str):
     ORDER_STATUSES: tuple[OrderStatus,...] = ("cooking", "cooked", "completed")
     for status in ORDER_STATUSES:
-        await asyncio.sleep(random.uniform(1,2))
+        await asyncio.sleep(duration("MOCK_COOKING_TIME", "uniform:1,2"))
+        if STORAGE[order_id] == "cancelled":
+            return
         STORAGE[order_id] = status
 
 
 @app.post("/api/orders")
-async def make_order(body: OrderRequestBody, background_tasks: BackgroundTasks):
+async def make_order(
+    body: OrderRequestBody, background_tasks: BackgroundTasks, idempotency_key: str | None = Header(default=None)
+):
     print(body)
-    
+    if idempotency_key in IDEMPOTENCY_KEYS:
+        order_id = IDEMPOTENCY_KEYS[idempotency_key]
+        return {"id": order_id, "status": STORAGE[order_id]}
+    if chance("MOCK_ERROR_RATE"):
+        raise HTTPException(status_code=503, detail="Silpo is overloaded")
+
     order_id = str(uuid.uuid4())
     STORAGE[order_id] = "not_started"
+    if idempotency_key:
+        IDEMPOTENCY_KEYS[idempotency_key] = order_id
     background_tasks.add_task(update_order_status, order_id)
     
-    return {
-        "order_id": order_id,
-        "status": STORAGE[order_id],
-        "message": "Order has been placed and is being processed."
-    }
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+@app.get("/api/orders")
+async def get_orders_bulk(ids: str):
+    """Bulk status lookup: GET /api/orders?ids=<id>,<id>,... Unknown ids are skipped."""
+    return [{"id": order_id, "status": STORAGE[order_id]} for order_id in ids.split(",") if order_id in STORAGE]
 
 @app.get("/api/orders/{order_id}")
 async def get_orders(order_id: str):
-    return {"id": order_id, "status": STORAGE.get(order_id)}
\ No newline at end of file
+    if order_id not in STORAGE:
+        raise HTTPException(status_code=404, detail="No such order found")
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+
+@app.post("/api/orders/{order_id}/cancel")
+async def cancel_order(order_id: str):
+    if order_id not in STORAGE:
+        raise HTTPException(status_code=404, detail="No such order found")
+    if STORAGE[order_id] == "completed":
+        raise HTTPException(status_code=409, detail="The order is already completed")
+
+    STORAGE[order_id] = "cancelled"
+    return {"id": order_id, "status": STORAGE[order_id]}
+
+
+@app.get("/api/menu")
+async def get_menu():
+    return {"items": MENU}
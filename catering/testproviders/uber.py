@@ -1,11 +1,23 @@
 import asyncio
 import random
+from contextlib import asynccontextmanager
 
 import httpx
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException
 from pydantic import BaseModel, HttpUrl
 
-app = FastAPI()
+from mock_config import chance, duration
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one keep-alive connection pool for all location updates
+    app.state.http_client = httpx.AsyncClient(timeout=5.0)
+    yield
+    await app.state.http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class DeliveryRequest(BaseModel):
@@ -15,34 +27,34 @@ class DeliveryRequest(BaseModel):
 
 async def send_location_updates(order_id: str, webhook_url: str):
     """
-    Simulates sending location updates every second.
+    Simulates sending location updates during the delivery.
     """
     print(f"Uber Provider: Starting to send updates for order {order_id} to {webhook_url}")
+    step_time = duration("MOCK_DELIVERY_TIME", "const:10") / 10
 
     # Simulate 10 delivery steps
     for _ in range(10):
-        await asyncio.sleep(1)
+        await asyncio.sleep(step_time)
         location = {
             "lat": round(random.uniform(49.83, 49.85), 6),
             "lon": round(random.uniform(24.01, 24.03), 6),
         }
         payload = {"order_id": order_id, "location": location, "status": "in_progress"}
         try:
-            async with httpx.AsyncClient() as client:
-                await client.post(webhook_url, json=payload, timeout=5.0)
+            await app.state.http_client.post(webhook_url, json=payload)
             print(f"Uber Provider: Update sent for order {order_id}")
         except httpx.RequestError as e:
             print(f"Uber Provider: Error sending update for order {order_id}: {e}")
 
-    # Send final status after completion
-    await asyncio.sleep(1)
-    try:
-        async with httpx.AsyncClient() as client:
+    # Send final status after completion, retried sometimes like a real provider does
+    await asyncio.sleep(step_time)
+    for _ in range(2 if chance("MOCK_WEBHOOK_DUPLICATE_RATE") else 1):
+        try:
             payload = {"order_id": order_id, "status": "delivered"}
-            await client.post(webhook_url, json=payload, timeout=5.0)
-        print(f"Uber Provider: Delivery for order {order_id} completed.")
-    except httpx.RequestError as e:
-        print(f"Uber Provider: Error sending final status for order {order_id}: {e}")
+            await app.state.http_client.post(webhook_url, json=payload)
+            print(f"Uber Provider: Delivery for order {order_id} completed.")
+        except httpx.RequestError as e:
+            print(f"Uber Provider: Error sending final status for order {order_id}: {e}")
 
 
 @app.post("/deliveries")
@@ -53,6 +65,9 @@ async def create_delivery(
     API endpoint to start delivery simulation.
     Accepts order ID and webhook URL.
     """
+    if chance("MOCK_ERROR_RATE"):
+        raise HTTPException(status_code=503, detail="No drivers available")
+
     external_id = f"uber-{random.randint(1000, 9999)}"
     print(f"Uber Provider: Received delivery request for order {delivery_request.order_id}. External ID: {external_id}")
 
@@ -2,9 +2,11 @@ import asyncio
 import uuid
 import random
 
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException
 from pydantic import BaseModel, Field
 
+from mock_config import chance, duration
+
 
 ORDER_STATUSES = ("not_started", "delivery", "delivered")
 STORAGE: dict[str, dict] = {}
@@ -23,10 +25,11 @@ async def delivery(order_id: str):
         STORAGE[order_id]["location"] = (random.random(), random.random())
         
     for address in STORAGE[order_id]["address"]:
-        await asyncio.sleep(1)
+        # the courier reports 5 locations on the way to every stop
+        stop_time = duration("MOCK_DELIVERY_TIME", "const:3.5")
         for _ in range(5):
             STORAGE[order_id]["location"] = (random.random(), random.random())
-            await asyncio.sleep(0.5)
+            await asyncio.sleep(stop_time / 5)
             
         print(f"Delivered to {address}")
         
@@ -35,7 +38,7 @@ async def update_order_status(order_id: str):
 
     for status in ORDER_STATUSES[1:]:
         STORAGE[order_id]["location"] = (random.random(), random.random())
-        await asyncio.sleep(random.uniform(1,2))
+        await asyncio.sleep(duration("MOCK_DRIVER_LOOKUP_TIME", "uniform:1,2"))
         
         
         if status == "delivery":
@@ -48,6 +51,9 @@ async def update_order_status(order_id: str):
 @app.post("/driver/orders")
 async def make_order(body: OrderRequestBody, background_tasks: BackgroundTasks):
     print(body)
+    if chance("MOCK_ERROR_RATE"):
+        raise HTTPException(status_code=503, detail="No drivers available")
+
     order_id = str(uuid.uuid4())
     STORAGE[order_id] = {
         "id": order_id,
@@ -60,6 +66,13 @@ async def make_order(body: OrderRequestBody, background_tasks: BackgroundTasks):
 
     return STORAGE.get(order_id, {"error": "No such order found"})
 
+@app.get("/driver/orders")
+async def get_orders_bulk(ids: str):
+    """Bulk status lookup: GET /driver/orders?ids=<id>,<id>,... Unknown ids are skipped."""
+    return [STORAGE[order_id] for order_id in ids.split(",") if order_id in STORAGE]
+
 @app.get("/driver/orders/{order_id}")
 async def get_orders(order_id: str):
-    return STORAGE.get(order_id, {"error": "No such order found"})
\ No newline at end of file
+    if order_id not in STORAGE:
+        raise HTTPException(status_code=404, detail="No such order found")
+    return STORAGE[order_id]
\ No newline at end of file
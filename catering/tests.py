@@ -1,3 +1,754 @@
-from django.test import TestCase
-
-# Create your tests here.
+import datetime
+import json
+import tempfile
+from unittest import mock
+
+import fakeredis
+import httpx
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from shared.cache import CacheService, cache_stats
+from shared.local_cache import local_caches
+from providers import kfc, silpo, uklon
+from users.models import User
+from .data_classes import DeliveryTracking, RestaurantTracking, TrackingOrder, tracking_order_codec
+from .enums import ImportStatus, OrderStatus
+from .loadtest import OrderTimings, OrderTracker, percentiles
+from .menu_sync import MenuDiff, menu_hash, sync_menu, sync_provider_menu
+from .models import Dish, DishImport, ExternalOrder, Order, OrderItem, Restaurant
+from .order_index import ExternalOrderIndex
+from .servises import (
+    all_orders_cooked,
+    archive_tracking,
+    cancel_provider_orders,
+    dispatch_delivery_batch,
+    invalidate_order_details,
+    order_in_kfc,
+    order_in_silpo,
+    poll_deliveries,
+    poll_silpo_orders,
+    schedule_delivery,
+    schedule_order,
+    sweep_tracking,
+)
+from .tasks import finish_orders, import_dishes
+from .webhooks import accept_webhook, process_kfc_webhooks, publish_kfc_webhook
+
+
+class CateringTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_caches.clear()
+        cache_stats.reset()
+        self.redis = fakeredis.FakeRedis()
+        for module in ("catering.order_index", "shared.streams"):
+            patcher = mock.patch(f"{module}.get_redis_connection", return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email="customer@example.com", password="testpassword")
+        self.silpo = Restaurant.objects.create(name="Silpo", address="Silpo street 1")
+        self.kfc = Restaurant.objects.create(name="KFC", address="KFC street 2")
+        self.salad = Dish.objects.create(name="Salad", price=10, restaurant=self.silpo)
+        self.burger = Dish.objects.create(name="Burger", price=12, restaurant=self.kfc)
+
+    def create_order(self, *dishes: Dish, status=OrderStatus.COOKED, eta=datetime.date(2025, 7, 10)) -> Order:
+        order = Order.objects.create(user=self.user, status=status, eta=eta)
+        OrderItem.objects.bulk_create([OrderItem(order=order, dish=dish, quantity=1) for dish in dishes])
+        return order
+
+
+class CreateOrderTest(CateringTestCase):
+    @mock.patch("catering.views.schedule_order.delay")
+    def test_order_is_created_and_scheduled(self, delay):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(
+            reverse("food-create-order"),
+            {
+                "items": [{"dish": self.salad.pk, "quantity": 2}, {"dish": self.burger.pk, "quantity": 1}],
+                "eta": "2025-07-10",
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total, 32)
+        delay.assert_called_once_with(order.pk)
+
+    @mock.patch("catering.servises.order_in_kfc.delay")
+    @mock.patch("catering.servises.order_in_silpo.delay")
+    def test_restaurant_tasks_get_only_the_order_id(self, silpo_delay, kfc_delay):
+        order = self.create_order(self.salad, self.burger, status=OrderStatus.NOT_STARTED)
+
+        schedule_order(order)
+
+        silpo_delay.assert_called_once_with(order.pk)
+        kfc_delay.assert_called_once_with(order.pk)
+        tracking_order = CacheService().get("orders", str(order.pk))
+        self.assertEqual(set(tracking_order.restaurants), {str(self.silpo.pk), str(self.kfc.pk)})
+
+    @mock.patch("providers.kfc.Client.create_order", return_value=kfc.OrderResponse("kfc-1", "not_started"))
+    def test_retried_kfc_task_does_not_order_twice(self, create_order):
+        order = self.create_order(self.burger, status=OrderStatus.NOT_STARTED)
+        with mock.patch("catering.servises.order_in_kfc.delay"):
+            schedule_order(order)
+
+        order_in_kfc(order.pk)
+        order_in_kfc(order.pk)
+        # the tracking is lost, the order is still known
+        CacheService().set("orders", str(order.pk), TrackingOrder({str(self.kfc.pk): RestaurantTracking()}))
+        order_in_kfc(order.pk)
+
+        create_order.assert_called_once_with(mock.ANY, idempotency_key=f"order-{order.pk}-{self.kfc.pk}")
+        self.assertEqual(ExternalOrder.objects.get(order=order).external_id, "kfc-1")
+
+    @mock.patch("providers.silpo.Client.create_order", return_value=silpo.OrderResponse("silpo-1", "not_started"))
+    def test_silpo_task_rebuilds_an_expired_tracking_and_does_not_order_twice(self, create_order):
+        order = self.create_order(self.salad, self.burger, status=OrderStatus.NOT_STARTED)
+        ExternalOrderIndex().register("kfc", "kfc-1", order.pk, self.kfc.pk)
+
+        # no tracking in the cache
+        order_in_silpo(order.pk)
+
+        tracking_order = CacheService().get("orders", str(order.pk))
+        self.assertEqual(
+            {key: part.external_id for key, part in tracking_order.restaurants.items()},
+            {str(self.silpo.pk): "silpo-1", str(self.kfc.pk): "kfc-1"},
+        )
+
+        # the tracking expired again, the order is still known
+        CacheService().delete("orders", str(order.pk))
+        order_in_silpo(order.pk)
+        create_order.assert_called_once_with(mock.ANY, idempotency_key=f"order-{order.pk}-{self.silpo.pk}")
+
+
+class MenuTest(CateringTestCase):
+    def test_menu_is_cached_until_a_dish_changes(self):
+        response = self.client.get(reverse("food-all-restaurants"))
+        self.assertEqual(response.json()["count"], 2)
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse("food-all-restaurants"))  # from Redis
+            response = self.client.get(reverse("food-all-restaurants"))  # from the process memory
+        self.assertEqual(response.json()["results"][0]["dishes"], [{"id": self.salad.pk, "name": "Salad", "price": 10}])
+
+        self.salad.price = 11
+        self.salad.save()
+
+        response = self.client.get(reverse("food-all-restaurants"))
+        self.assertEqual(response.json()["results"][0]["dishes"][0]["price"], 11)
+        self.assertEqual(CacheService.stats()["menu"]["l1_hits"], 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DishImportTest(CateringTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.client.force_login(admin)
+        # the queued import runs in the test, without a broker
+        patcher = mock.patch("catering.admin.import_dishes.delay", side_effect=import_dishes.run)
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_import_in_background(self):
+        self.assertContains(self.client.get(reverse("admin:catering_dish_changelist")), "Import CSV")
+        self.assertContains(self.client.get(reverse("admin:catering_dish_import_csv")), "csv_file")
+        self.client.get(reverse("food-all-restaurants"))  # the menu is cached
+        csv_file = SimpleUploadedFile(
+            "dishes.csv",
+            b"name,price,restaurant\n"
+            b"Salad,14,Silpo\n"
+            b"Soup,8,Silpo\n"
+            b"Wings,9,Unknown\n"
+            b"Fries,cheap,KFC\n"
+            b"Soup,9,Silpo\n",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:catering_dish_import_csv"), {"csv_file": csv_file})
+        dish_import = DishImport.objects.get()
+        self.assertRedirects(response, reverse("admin:catering_dish_import_progress", args=[dish_import.pk]))
+        self.delay.assert_called_once_with(dish_import.pk)
+
+        self.salad.refresh_from_db()
+        self.assertEqual(self.salad.price, 14)
+        self.assertEqual(Dish.objects.get(restaurant=self.silpo, name="Soup").price, 9)
+        progress = self.client.get(response.url, HTTP_ACCEPT="application/json").json()
+        self.assertEqual(
+            progress,
+            {
+                "status": "done",
+                "progress": 1.0,
+                "imported": 2,
+                "failed": 2,
+                "errors": [[4, "unknown restaurant 'Unknown'"], [5, "invalid price 'cheap'"]],
+            },
+        )
+        # bulk_create sends no signals, the import drops the menu itself
+        response = self.client.get(reverse("food-all-restaurants"))
+        self.assertEqual(response.json()["results"][0]["dishes"][0]["price"], 14)
+
+    def test_missing_column_fails_the_import(self):
+        csv_file = SimpleUploadedFile("dishes.csv", b"name,price\nSalad,14\n")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:catering_dish_import_csv"), {"csv_file": csv_file})
+
+        dish_import = DishImport.objects.get()
+        self.assertEqual(dish_import.status, ImportStatus.FAILED)
+        self.assertEqual(dish_import.errors, [[None, "The file has no restaurant column"]])
+
+
+class ExportTest(CateringTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, table: str, file_format: str) -> str:
+        response = self.client.get(reverse("food-export", args=[table]), {"file_format": file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_dishes(self):
+        self.assertEqual(
+            self.export("dishes", "csv").splitlines(),
+            [
+                "id,name,price,restaurant_id,restaurant",
+                f"{self.salad.pk},Salad,10,{self.silpo.pk},Silpo",
+                f"{self.burger.pk},Burger,12,{self.kfc.pk},KFC",
+            ],
+        )
+        self.assertEqual(
+            json.loads(self.export("dishes", "json"))[0],
+            {"id": self.salad.pk, "name": "Salad", "price": 10, "restaurant_id": self.silpo.pk, "restaurant": "Silpo"},
+        )
+
+    def test_orders_with_items(self):
+        order = self.create_order(self.salad, self.burger)
+        empty = Order.objects.create(user=self.user, status=OrderStatus.NOT_STARTED, eta=datetime.date(2025, 7, 11))
+
+        lines = self.export("orders", "csv").splitlines()
+        self.assertEqual(lines[0], "id,status,eta,total,user,dish,restaurant,quantity")
+        self.assertEqual(lines[1], f"{order.pk},cooked,2025-07-10,,customer@example.com,Salad,Silpo,1")
+        self.assertEqual(len(lines), 4)
+
+        orders = json.loads(self.export("orders", "json"))
+        self.assertEqual([item["dish"] for item in orders[0]["items"]], ["Salad", "Burger"])
+        self.assertEqual(orders[1]["id"], empty.pk)
+        self.assertEqual(orders[1]["items"], [])
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("food-export", args=["dishes"]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_site_export(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin:catering_order_export", args=["csv"]))
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="orders.csv"')
+
+
+class AdminChangelistTest(CateringTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(email="admin@example.com", password="adminpassword"))
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        urls = [
+            reverse("admin:catering_order_changelist"),
+            reverse("admin:catering_orderitem_changelist"),
+            reverse("admin:catering_dish_changelist"),
+        ]
+        self.create_order(self.salad, self.burger)
+        before = [self.count_queries(url) for url in urls]
+
+        for index in range(10):
+            user = User.objects.create_user(email=f"customer{index}@example.com", password="testpassword")
+            order = Order.objects.create(user=user, status=OrderStatus.NOT_STARTED, eta=datetime.date(2025, 7, 11))
+            dish = Dish.objects.create(name=f"Dish {index}", price=index, restaurant=self.silpo)
+            OrderItem.objects.create(order=order, dish=dish, quantity=1)
+
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+
+
+class OrderAdminActionsTest(CateringTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(email="admin@example.com", password="adminpassword"))
+
+    @mock.patch("catering.admin.finish_orders.delay")
+    def test_cancel_only_moves_orders_from_the_valid_statuses(self, delay):
+        cooking = self.create_order(self.salad, status=OrderStatus.COOKING)
+        delivery = self.create_order(self.salad, status=OrderStatus.DELIVERY)
+        delivered = self.create_order(self.salad, status=OrderStatus.DELIVERED)
+        CacheService().set("order_details", str(cooking.pk), {"status": OrderStatus.COOKING})
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("admin:catering_order_changelist"),
+                {"action": "cancel_orders", "_selected_action": [cooking.pk, delivery.pk, delivered.pk]},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("UPDATE")]), 1)
+
+        statuses = dict(Order.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[cooking.pk], OrderStatus.CANCELLED_BY_ADMIN)
+        self.assertEqual(statuses[delivery.pk], OrderStatus.DELIVERY)
+        self.assertEqual(statuses[delivered.pk], OrderStatus.DELIVERED)
+        self.assertIsNone(CacheService().get("order_details", str(cooking.pk)))
+        delay.assert_called_once_with([cooking.pk])
+
+    @mock.patch("catering.admin.finish_orders.delay")
+    def test_mark_failed(self, delay):
+        delivery = self.create_order(self.salad, status=OrderStatus.DELIVERY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("admin:catering_order_changelist"),
+                {"action": "mark_orders_failed", "_selected_action": [delivery.pk]},
+            )
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, OrderStatus.FAILED)
+        delay.assert_called_once_with([delivery.pk])
+
+    @mock.patch("providers.kfc.Client.cancel_order", side_effect=httpx.ConnectError("KFC is down"))
+    @mock.patch("providers.silpo.Client.cancel_order")
+    def test_finish_orders_cancels_provider_orders_and_archives_tracking(self, silpo_cancel, kfc_cancel):
+        order = self.create_order(self.salad, self.burger, status=OrderStatus.CANCELLED_BY_ADMIN)
+        ExternalOrder.objects.create(provider="silpo", external_id="silpo-13", order=order, restaurant=self.silpo)
+        ExternalOrder.objects.create(provider="kfc", external_id="kfc-13", order=order, restaurant=self.kfc)
+        CacheService().set("orders", str(order.pk), TrackingOrder({str(self.silpo.pk): RestaurantTracking("silpo-13")}))
+
+        self.assertEqual(cancel_provider_orders([order.pk]), [("kfc", "kfc-13")])
+        silpo_cancel.assert_called_once_with("silpo-13")
+
+        finish_orders([order.pk])
+        order.refresh_from_db()
+        self.assertEqual(order.tracking["restaurants"][str(self.silpo.pk)]["external_id"], "silpo-13")
+        self.assertIsNone(CacheService().get("orders", str(order.pk)))
+
+    @mock.patch("providers.kfc.Client.cancel_order", side_effect=ValueError("unexpected answer"))
+    @mock.patch("providers.silpo.Client.cancel_order")
+    def test_any_cancel_failure_is_reported(self, silpo_cancel, kfc_cancel):
+        order = self.create_order(self.salad, self.burger, status=OrderStatus.CANCELLED_BY_ADMIN)
+        ExternalOrder.objects.create(provider="silpo", external_id="silpo-13", order=order, restaurant=self.silpo)
+        ExternalOrder.objects.create(provider="kfc", external_id="kfc-13", order=order, restaurant=self.kfc)
+
+        self.assertEqual(cancel_provider_orders([order.pk]), [("kfc", "kfc-13")])
+        silpo_cancel.assert_called_once_with("silpo-13")
+
+
+class MenuSyncTest(CateringTestCase):
+    def sync(self, *items: tuple[str, str, int]):
+        menu = [silpo.MenuItem(id=external_id, name=name, price=price) for external_id, name, price in items]
+        with mock.patch.object(silpo.Client, "get_menu", return_value=menu):
+            return sync_provider_menu("silpo")
+
+    def test_sync(self):
+        diff = self.sync(("silpo-1", "Salad", 11), ("silpo-2", "Borscht", 12))
+
+        self.assertEqual(diff, MenuDiff(created=2))
+        self.salad.refresh_from_db()
+        # the dish added by hand is adopted
+        self.assertEqual((self.salad.external_id, self.salad.price), ("silpo-1", 11))
+        self.assertEqual(self.silpo.dishes.count(), 2)
+
+    def test_unchanged_menu_is_skipped(self):
+        self.sync(("silpo-1", "Salad", 11), ("silpo-2", "Borscht", 12))
+        self.silpo.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            menu = [silpo.MenuItem("silpo-2", "Borscht", 12), silpo.MenuItem("silpo-1", "Salad", 11)]
+            diff = sync_menu(self.silpo, menu)
+        self.assertEqual(diff, MenuDiff(unchanged=True))
+
+    def test_only_changes_are_applied(self):
+        self.sync(("silpo-1", "Salad", 11), ("silpo-2", "Borscht", 12))
+        order = self.create_order(self.salad)
+        self.client.get(reverse("food-all-restaurants"))  # the menu is cached
+
+        diff = self.sync(("silpo-2", "Borscht", 13), ("silpo-3", "Varenyky", 9))
+
+        self.assertEqual(diff, MenuDiff(created=1, updated=1, removed=1))
+        self.salad.refresh_from_db()
+        self.assertFalse(self.salad.available)
+        self.assertTrue(order.items.exists())
+        dishes = self.client.get(reverse("food-all-restaurants")).json()["results"][0]["dishes"]
+        self.assertEqual([(dish["name"], dish["price"]) for dish in dishes], [("Borscht", 13), ("Varenyky", 9)])
+
+        # back in the menu
+        diff = self.sync(("silpo-1", "Salad", 11), ("silpo-2", "Borscht", 13), ("silpo-3", "Varenyky", 9))
+        self.assertEqual(diff, MenuDiff(updated=1))
+
+    def test_colliding_items_are_skipped(self):
+        diff = self.sync(("silpo-1", "Salad", 11), ("silpo-2", "Borscht", 12), ("silpo-3", "Borscht", 13))
+        self.assertEqual(diff, MenuDiff(created=2, skipped=1))
+
+        # renamed onto a dish still in the menu, and a new item with the name of another one
+        menu = [("silpo-1", "Borscht", 11), ("silpo-2", "Borscht", 12), ("silpo-4", "Salad", 9)]
+        diff = self.sync(*menu)
+
+        self.assertEqual(diff, MenuDiff(skipped=2))
+        self.assertEqual(
+            set(self.silpo.dishes.values_list("external_id", "name", "price", "available")),
+            {("silpo-1", "Salad", 11, True), ("silpo-2", "Borscht", 12, True)},
+        )
+        self.silpo.refresh_from_db()
+        # not retried on every run
+        self.assertEqual(self.silpo.menu_hash, menu_hash([silpo.MenuItem(*item) for item in menu]))
+
+    def test_new_item_adopts_the_dish_of_a_removed_one(self):
+        self.sync(("silpo-1", "Salad", 11))
+
+        diff = self.sync(("silpo-9", "Salad", 12))
+
+        self.assertEqual(diff, MenuDiff(created=1))
+        self.salad.refresh_from_db()
+        self.assertEqual((self.salad.external_id, self.salad.price, self.salad.available), ("silpo-9", 12, True))
+
+
+class OrderDetailsTest(CateringTestCase):
+    def test_order_details_are_cached_until_the_order_changes(self):
+        order = self.create_order(self.salad, status=OrderStatus.COOKING)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("food-get-order", args=[order.pk])
+
+        self.assertEqual(client.get(url).json()["status"], "cooking")
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).json()["status"], "cooking")
+
+        Order.objects.filter(pk=order.pk).update(status=OrderStatus.COOKED)
+        invalidate_order_details([order.pk])
+        self.assertEqual(client.get(url).json()["status"], "cooked")
+
+        client.force_authenticate(User.objects.create_user(email="other@example.com", password="testpassword"))
+        self.assertEqual(client.get(url).status_code, 404)
+
+
+@override_settings(DELIVERY_BATCH_WINDOW=30, DELIVERY_BATCH_MAX_ORDERS=2)
+class DeliveryBatchingTest(CateringTestCase):
+    @mock.patch("catering.servises.dispatch_delivery_batch.apply_async")
+    def test_batch_window_is_opened_once(self, apply_async):
+        first = self.create_order(self.salad, self.burger)
+        second = self.create_order(self.burger, self.salad)
+
+        schedule_delivery(first.pk)
+        schedule_delivery(second.pk)
+
+        apply_async.assert_called_once_with(args=[f"2025-07-10:{self.silpo.pk},{self.kfc.pk}"], countdown=30)
+
+    @mock.patch("catering.servises.order_delivery.delay")
+    def test_dispatch_groups_orders_by_restaurants_and_eta(self, delay):
+        batched = [self.create_order(self.salad, self.burger) for _ in range(3)]
+        other_restaurants = self.create_order(self.salad)
+        other_eta = self.create_order(self.salad, self.burger, eta=datetime.date(2025, 7, 11))
+        not_cooked = self.create_order(self.salad, self.burger, status=OrderStatus.COOKING)
+
+        dispatch_delivery_batch(f"2025-07-10:{self.silpo.pk},{self.kfc.pk}")
+
+        self.assertEqual(
+            delay.call_args_list,
+            [mock.call([batched[0].pk, batched[1].pk]), mock.call([batched[2].pk])],
+        )
+        self.assertEqual(
+            set(Order.objects.filter(status=OrderStatus.DELIVERY_LOOKUP).values_list("pk", flat=True)),
+            {order.pk for order in batched},
+        )
+        for order in (other_restaurants, other_eta, not_cooked):
+            order.refresh_from_db()
+            self.assertNotEqual(order.status, OrderStatus.DELIVERY_LOOKUP)
+
+
+class KFCWebhooksTest(CateringTestCase):
+    def track(self, order: Order, *restaurants: Restaurant, external_ids: dict | None = None):
+        CacheService().set(
+            "orders",
+            str(order.pk),
+            TrackingOrder(restaurants={str(r.pk): RestaurantTracking(status=OrderStatus.COOKING) for r in restaurants}),
+        )
+        for external_id, restaurant in (external_ids or {}).items():
+            ExternalOrderIndex().register("kfc", external_id, order.pk, restaurant.pk)
+
+    @mock.patch("catering.webhooks.StreamService")
+    def test_webhook_is_only_appended_to_the_stream(self, stream_service):
+        response = self.client.post(reverse("kfc-webhook"), {"id": "kfc-1", "status": "cooked"})
+
+        self.assertEqual(response.status_code, 200)
+        stream_service.return_value.publish.assert_called_once_with({"id": "kfc-1", "status": "cooked"})
+
+    @mock.patch("catering.webhooks.StreamService")
+    def test_retried_and_reordered_webhooks_are_dropped(self, stream_service):
+        for status in ("cooking", "cooked", "cooked", "cooking", "completed"):
+            response = self.client.post(reverse("kfc-webhook"), {"id": "kfc-1", "status": status})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            [call.args[0]["status"] for call in stream_service.return_value.publish.call_args_list],
+            ["cooking", "cooked", "completed"],
+        )
+
+    @mock.patch("catering.webhooks.StreamService")
+    def test_webhook_that_failed_to_publish_is_accepted_again(self, stream_service):
+        stream_service.return_value.publish.side_effect = [ConnectionError("Redis is down"), None]
+
+        with self.assertRaises(ConnectionError):
+            publish_kfc_webhook({"id": "kfc-1", "status": "cooked"})
+        # the retry of the provider
+        self.assertTrue(publish_kfc_webhook({"id": "kfc-1", "status": "cooked"}))
+
+        self.assertEqual(stream_service.return_value.publish.call_count, 2)
+        self.assertFalse(accept_webhook("kfc", "kfc-1", "cooked"))
+
+    def test_repeated_statuses_are_accepted_without_dedupe(self):
+        self.assertTrue(accept_webhook("uber", "1", "in_progress", dedupe=False))
+        self.assertTrue(accept_webhook("uber", "1", "in_progress", dedupe=False))
+        self.assertTrue(accept_webhook("uber", "1", "delivered"))
+        self.assertFalse(accept_webhook("uber", "1", "in_progress", dedupe=False))
+
+    @mock.patch("catering.webhooks.StreamService")
+    def test_invalid_webhook_is_rejected(self, stream_service):
+        response = self.client.post(reverse("kfc-webhook"), {"status": "cooked"})
+
+        self.assertEqual(response.status_code, 400)
+        stream_service.return_value.publish.assert_not_called()
+
+    @mock.patch("catering.servises.schedule_delivery")
+    def test_batch_updates_tracking_and_cooked_orders(self, schedule_delivery):
+        kfc_only = self.create_order(self.burger, status=OrderStatus.COOKING)
+        both = self.create_order(self.salad, self.burger, status=OrderStatus.COOKING)
+        delivering = self.create_order(self.burger, status=OrderStatus.DELIVERY)
+        self.track(kfc_only, self.kfc, external_ids={"kfc-1": self.kfc})
+        self.track(both, self.silpo, self.kfc, external_ids={"kfc-2": self.kfc})
+        self.track(delivering, self.kfc, external_ids={"kfc-3": self.kfc})
+
+        # the index lookup of the unknown id and the UPDATE of the cooked order
+        with self.assertNumQueries(2):
+            process_kfc_webhooks(
+                [
+                    {"id": "kfc-1", "status": "cooking"},
+                    {"id": "kfc-1", "status": "cooked"},
+                    {"id": "kfc-2", "status": "cooked"},
+                    # redelivered
+                    {"id": "kfc-3", "status": "cooked"},
+                    {"id": "unknown", "status": "cooked"},
+                ]
+            )
+
+        tracking_orders = CacheService().get_many("orders", [str(kfc_only.pk), str(both.pk)])
+        self.assertEqual(tracking_orders[str(kfc_only.pk)].restaurants[str(self.kfc.pk)].status, "cooked")
+        self.assertEqual(tracking_orders[str(both.pk)].restaurants[str(self.kfc.pk)].status, "cooked")
+        self.assertEqual(tracking_orders[str(both.pk)].restaurants[str(self.silpo.pk)].status, "cooking")
+        kfc_only.refresh_from_db()
+        both.refresh_from_db()
+        self.assertEqual(kfc_only.status, OrderStatus.COOKED)
+        self.assertEqual(both.status, OrderStatus.COOKING)
+        delivering.refresh_from_db()
+        self.assertEqual(delivering.status, OrderStatus.DELIVERY)
+        schedule_delivery.assert_called_once_with(kfc_only.pk)
+
+
+class PollingTest(CateringTestCase):
+    @mock.patch("catering.servises.schedule_delivery")
+    @mock.patch("providers.silpo.Client.get_orders")
+    def test_silpo_orders_are_polled_in_one_lookup(self, get_orders, schedule_delivery):
+        cooking, cooked = self.create_order(self.salad), self.create_order(self.salad)
+        for order, external_id in ((cooking, "silpo-1"), (cooked, "silpo-2")):
+            ExternalOrderIndex().register("silpo", external_id, order.pk, self.silpo.pk)
+            tracking_order = TrackingOrder({str(self.silpo.pk): RestaurantTracking(external_id, OrderStatus.COOKING)})
+            CacheService().set("orders", str(order.pk), tracking_order)
+        Order.objects.update(status=OrderStatus.NOT_STARTED)
+        get_orders.return_value = {
+            "silpo-1": silpo.OrderResponse("silpo-1", silpo.OrderStatus.COOKING),
+            "silpo-2": silpo.OrderResponse("silpo-2", silpo.OrderStatus.COOKED),
+        }
+
+        self.assertEqual(poll_silpo_orders(), 2)
+
+        get_orders.assert_called_once_with(["silpo-1", "silpo-2"])
+        schedule_delivery.assert_called_once_with(cooked.pk)
+        tracking_order = CacheService().get("orders", str(cooked.pk))
+        self.assertEqual(tracking_order.restaurants[str(self.silpo.pk)].status, OrderStatus.COOKED)
+
+        # cooked parts are not polled again
+        get_orders.reset_mock()
+        get_orders.return_value = {"silpo-1": silpo.OrderResponse("silpo-1", silpo.OrderStatus.COOKING)}
+        self.assertEqual(poll_silpo_orders(), 1)
+        get_orders.assert_called_once_with(["silpo-1"])
+
+    @mock.patch("catering.servises.schedule_delivery")
+    def test_cooked_update_does_not_move_a_delivering_order_back(self, schedule_delivery):
+        cooking = self.create_order(self.salad, status=OrderStatus.COOKING)
+        delivering = self.create_order(self.salad, status=OrderStatus.DELIVERY)
+        for order in (cooking, delivering):
+            tracking_order = TrackingOrder({str(self.silpo.pk): RestaurantTracking("silpo-1", OrderStatus.COOKED)})
+            CacheService().set("orders", str(order.pk), tracking_order)
+
+        all_orders_cooked(cooking.pk)
+        all_orders_cooked(delivering.pk)
+
+        statuses = dict(Order.objects.values_list("pk", "status"))
+        self.assertEqual(statuses, {cooking.pk: OrderStatus.COOKED, delivering.pk: OrderStatus.DELIVERY})
+        schedule_delivery.assert_called_once_with(cooking.pk)
+
+    @mock.patch("providers.uklon.Client.get_orders")
+    def test_deliveries_are_polled_in_one_lookup(self, get_orders):
+        orders = [self.create_order(self.salad, status=OrderStatus.DELIVERY) for _ in range(3)]
+        Order.objects.update(delivery_provider="uklon")
+        for order, external_id in zip(orders, ("u-1", "u-1", "u-2")):
+            tracking_order = TrackingOrder()
+            tracking_order.delivery_providers["uklon"] = DeliveryTracking(external_id, OrderStatus.DELIVERY, [0, 0])
+            CacheService().set("orders", str(order.pk), tracking_order)
+        get_orders.return_value = {
+            "u-1": uklon.OrderResponse("u-1", uklon.OrderStatus.DELIVERED, [1, 1], [], []),
+            "u-2": uklon.OrderResponse("u-2", uklon.OrderStatus.DELIVRY, [2, 2], [], []),
+        }
+
+        self.assertEqual(poll_deliveries(), 2)
+
+        get_orders.assert_called_once_with(["u-1", "u-2"])
+        statuses = list(Order.objects.order_by("pk").values_list("status", flat=True))
+        self.assertEqual(statuses, [OrderStatus.DELIVERED, OrderStatus.DELIVERED, OrderStatus.DELIVERY])
+        orders[0].refresh_from_db()
+        self.assertEqual(orders[0].tracking["delivery_providers"]["uklon"]["status"], OrderStatus.DELIVERED)
+        in_delivery = CacheService().get("orders", str(orders[2].pk))
+        self.assertEqual(in_delivery.delivery_providers["uklon"].location, [2, 2])
+
+
+class TrackingOrderCodecTest(CateringTestCase):
+    def test_round_trip(self):
+        tracking_order = TrackingOrder(
+            restaurants={
+                str(self.silpo.pk): RestaurantTracking("13", OrderStatus.COOKING, {"items": [{"id": 1, "quantity": 2}]})
+            },
+        )
+        tracking_order.delivery_providers["uklon"] = DeliveryTracking("u-1", OrderStatus.DELIVERY, [50.45, 30.52])
+
+        self.assertEqual(tracking_order_codec.decode(tracking_order_codec.encode(tracking_order)), tracking_order)
+
+    def test_entries_cached_before_the_codec_are_still_read(self):
+        cache.set(
+            "orders:1",
+            {"restaurants": {"1": {"external_id": "13", "status": "cooked"}}, "delivery_providers": {}},
+        )
+
+        tracking_order = CacheService().get("orders", "1")
+
+        self.assertEqual(tracking_order, TrackingOrder(restaurants={"1": RestaurantTracking("13", "cooked")}))
+
+
+class TrackingRetentionTest(CateringTestCase):
+    def track(self, order: Order):
+        tracking_order = TrackingOrder({str(self.silpo.pk): RestaurantTracking("13", "cooked")})
+        CacheService().set("orders", str(order.pk), tracking_order)
+
+    def test_finished_tracking_is_archived(self):
+        order = self.create_order(self.salad, status=OrderStatus.DELIVERED)
+        self.track(order)
+        ExternalOrderIndex().register("silpo", "13", order.pk, self.silpo.pk)
+
+        archive_tracking([order.pk])
+
+        order.refresh_from_db()
+        self.assertEqual(
+            order.tracking,
+            {
+                "restaurants": {str(self.silpo.pk): {"external_id": "13", "status": "cooked", "request_body": None}},
+                "delivery_providers": {},
+            },
+        )
+        self.assertIsNone(CacheService().get("orders", str(order.pk)))
+        # the index entry is dropped from Redis but still resolved from the table
+        self.assertEqual(self.redis.hlen(ExternalOrderIndex.key("silpo")), 0)
+        self.assertEqual(ExternalOrderIndex().resolve("silpo", "13"), (order.pk, self.silpo.pk))
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://localhost:6379/0",
+                "OPTIONS": {"CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeConnection}},
+            }
+        }
+    )
+    def test_sweep_archives_finished_and_drops_orphaned_tracking(self):
+        cache.clear()
+        cooking, delivered, deleted = (
+            self.create_order(self.salad, status=status)
+            for status in (OrderStatus.COOKING, OrderStatus.DELIVERED, OrderStatus.CANCELLED_BY_CUSTOMER)
+        )
+        for order in (cooking, delivered, deleted):
+            self.track(order)
+        deleted.delete()
+
+        self.assertTrue(0 < cache.ttl(f"orders:{cooking.pk}") <= 60 * 60 * 24 * 2)
+        self.assertEqual(sweep_tracking(batch_size=100, max_batches=10), 2)
+
+        tracking_orders = CacheService().get_many("orders", [str(cooking.pk), str(delivered.pk)])
+        self.assertEqual(list(tracking_orders), [str(cooking.pk)])
+        delivered.refresh_from_db()
+        self.assertIsNotNone(delivered.tracking)
+
+
+class ExternalOrderIndexTest(CateringTestCase):
+    def test_lookups_survive_redis_data_loss(self):
+        order = self.create_order(self.burger)
+        index = ExternalOrderIndex()
+        index.register("kfc", "kfc-1", order.pk, self.kfc.pk)
+        index.register("silpo", "silpo-1", order.pk)
+
+        self.assertEqual(index.resolve("kfc", "kfc-1"), (order.pk, self.kfc.pk))
+
+        self.redis.flushall()
+        with self.assertNumQueries(1):
+            self.assertEqual(index.resolve_many("kfc", ["kfc-1", "unknown"]), {"kfc-1": (order.pk, self.kfc.pk)})
+        with self.assertNumQueries(0):
+            self.assertEqual(index.resolve("kfc", "kfc-1"), (order.pk, self.kfc.pk))
+
+        self.redis.flushall()
+        self.assertEqual(index.warm_up(batch_size=1), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.resolve("silpo", "silpo-1"), (order.pk, None))
+
+
+class LoadTestTest(CateringTestCase):
+    def test_percentiles(self):
+        self.assertEqual(percentiles([]), {"p50": None, "p95": None, "p99": None})
+        self.assertEqual(percentiles([1.0, 2.0, 3.0])["p50"], 2.0)
+        self.assertAlmostEqual(percentiles([float(value) for value in range(101)])["p99"], 99.0)
+
+    def test_tracker_records_cooked_and_delivered_times(self):
+        cooking = self.create_order(self.salad, status=OrderStatus.COOKING)
+        delivery = self.create_order(self.salad, status=OrderStatus.DELIVERY)
+        delivered = self.create_order(self.salad, status=OrderStatus.DELIVERED)
+        orders = {order.pk: OrderTimings(started=0) for order in (cooking, delivery, delivered)}
+        tracker = OrderTracker(orders, started_at=0)
+
+        with self.assertNumQueries(1):
+            tracker.poll()
+
+        self.assertIsNone(orders[cooking.pk].cooked)
+        self.assertIsNotNone(orders[delivery.pk].cooked)
+        self.assertIsNone(orders[delivery.pk].delivered)
+        self.assertIsNotNone(orders[delivered.pk].delivered)
+        self.assertEqual(tracker.unfinished(), [cooking.pk, delivery.pk])
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import include, path
 from . import views
 
 urlpatterns = [
@@ -7,4 +7,6 @@ urlpatterns = [
     path("active_orders/", views.active_orders, name="active_orders"),
     path("ship/<str:provider>/<uuid:order_id>/", views.ship, name="ship"),
     path('webhooks/uber/', views.UberWebhook.as_view(), name='uber-webhook'),
+    path('webhooks/kfc/', views.kfc_webhook, name='kfc-webhook'),
+    path("", include(views.router.urls)),
 ]
@@ -39,12 +39,12 @@ CREATE ORDER FLOW
 import logging
 import json
 from datetime import datetime
-from dataclasses import asdict
 from typing import Any
 from rest_framework.views import APIView
 
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets, routers, pagination, permissions, serializers
 from rest_framework.decorators import action, api_view, permission_classes
@@ -60,7 +60,8 @@ from django.db.models import Prefetch
 from celery import shared_task
 
 from users.models import Role, User
-from .enums import OrderStatus
+from .enums import TERMINAL_ORDER_STATUSES, OrderStatus
+from .exports import CONTENT_TYPES, export_response
 from .models import Restaurant, Dish, Order, OrderItem
 from .pagination import DishesPagination
 from .serializers import (
@@ -69,11 +70,14 @@ from .serializers import (
     OrderCreateSerializer,
     OrderSerializer,
 )
-from .tasks import schedule_order, process_kfc_webhook_data
+from .servises import archive_tracking
+from .tasks import schedule_order
+from .webhooks import accept_webhook, forget_webhook, publish_kfc_webhook
 from shared.cache import CacheService
-from .data_classes import TrackingOrder
+from shared.rate_limit import TokenBucketThrottle, rate_limit
+from .data_classes import DeliveryTracking, TrackingOrder
 from .mapper import DELIVERY_EXTERNAL_TO_INTERNAL
-from .providers import uber
+from providers import uber
 
 
 logger = logging.getLogger(__name__)
@@ -93,7 +97,6 @@ class DishesPagination(pagination.LimitOffsetPagination):
 class DishSerializer(serializers.ModelSerializer):
     class Meta:
         model = Dish
-        exclude = ["restaurant"]
         fields = ["id", "name", "price"]
 
 
@@ -108,11 +111,11 @@ class RestaurantSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Restaurant
-        fields = "__all__"
+        fields = ["id", "name", "address", "dishes"]
 
 
 class OrderItemSerializer(serializers.Serializer):
-    dish = serializers.PrimaryKeyRelatedField(queryset=Dish.objects.all())
+    dish = serializers.PrimaryKeyRelatedField(queryset=Dish.objects.filter(available=True))
     quantity = serializers.IntegerField(min_value=1, max_value=20)
     
 
@@ -138,6 +141,7 @@ class UberWebhookSerializer(serializers.Serializer):
 class UberWebhook(APIView):
     permission_classes = [permissions.AllowAny]
     authentication_classes = []
+    throttle_classes = [TokenBucketThrottle.scoped("uber_webhook")]
 
     def post(self, request, *args, **kwargs):
         serializer = UberWebhookSerializer(data=request.data)
@@ -148,6 +152,10 @@ class UberWebhook(APIView):
         external_status = validated_data.get("status")
         location = validated_data.get("location")
 
+        # location updates repeat the status on purpose, only stale ones are dropped
+        if not accept_webhook("uber", str(order_id), external_status, dedupe=location is None):
+            return Response(status=status.HTTP_200_OK)
+
         try:
             internal_status = DELIVERY_EXTERNAL_TO_INTERNAL["uber"][external_status]
             
@@ -157,11 +165,12 @@ class UberWebhook(APIView):
 
             # Update cache
             cache = CacheService()
-            tracking_order_data = cache.get(namespace="orders", key=str(order.pk))
-            if tracking_order_data:
-                tracking_order = TrackingOrder(**tracking_order_data)
-                tracking_order.delivery["status"] = internal_status
-                cache.set("orders", str(order.pk), asdict(tracking_order))
+            tracking_order: TrackingOrder | None = cache.get(namespace="orders", key=str(order.pk))
+            if tracking_order:
+                tracking_order.delivery_providers.setdefault("uber", DeliveryTracking()).status = internal_status
+                cache.set("orders", str(order.pk), tracking_order)
+            if internal_status in TERMINAL_ORDER_STATUSES:
+                archive_tracking([order.pk])
 
             logger.info(f"Uber webhook: Order {order_id} status updated to {internal_status}")
             return Response(status=status.HTTP_200_OK)
@@ -169,6 +178,40 @@ class UberWebhook(APIView):
         except (Order.DoesNotExist, KeyError) as e:
             logger.error(f"Error processing Uber webhook for order {order_id}: {e}")
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            # let the retry of the provider through
+            forget_webhook("uber", str(order_id), external_status)
+            raise
+
+
+def restaurants_menu() -> list[dict]:
+    """
+    All restaurants with their dishes, cached in the "menu" namespace.
+
+    The entry is dropped when a restaurant or a dish changes (see `signals.py`).
+    """
+    def compute() -> list[dict]:
+        dishes = Prefetch("dishes", queryset=Dish.objects.filter(available=True).order_by("pk"))
+        queryset = Restaurant.objects.prefetch_related(dishes).order_by("pk")
+        return RestaurantSerializer(queryset, many=True).data
+
+    return CacheService().get_or_compute("menu", "restaurants", compute, timeout=settings.CACHE_TTL)
+
+
+def order_details(order_id: int) -> dict | None:
+    """
+    The order as served by `get_order`, with its owner, cached in the "order_details" namespace.
+
+    The entry is dropped when the order changes (see `servises.invalidate_order_details`).
+    """
+
+    def compute() -> dict | None:
+        order = Order.objects.filter(pk=order_id).first()
+        if order is None:
+            return None
+        return {"user": order.user_id, "order": OrderSerializer(order).data}
+
+    return CacheService().get_or_compute("order_details", str(order_id), compute)
 
 
 class FoodAPIViewSet(viewsets.ViewSet):
@@ -181,11 +224,9 @@ class FoodAPIViewSet(viewsets.ViewSet):
         """
         Get all restaurants with pagination.
         """
-        queryset = Restaurant.objects.all()
         paginator = DishesPagination()
-        page = paginator.paginate_queryset(queryset, request)
-        serializer = RestaurantSerializer(page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        page = paginator.paginate_queryset(restaurants_menu(), request)
+        return paginator.get_paginated_response(page)
 
     @action(methods=["get"], detail=False, permission_classes=[permissions.IsAdminUser])
     def dishes(self, request: Request) -> Response:
@@ -215,7 +256,22 @@ class FoodAPIViewSet(viewsets.ViewSet):
         serializer = RestaurantSerializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
-    @action(methods=["post"], detail=False, url_path="dishes", permission_classes=[IsAdminUser])
+    @action(
+        methods=["get"],
+        detail=False,
+        url_path=r"exports/(?P<table>dishes|orders)",
+        permission_classes=[permissions.IsAdminUser],
+    )
+    def export(self, request: Request, table: str) -> StreamingHttpResponse:
+        """
+        Export all dishes, or all orders with their items, as `?file_format=csv` (default) or `json`.
+        """
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in CONTENT_TYPES:
+            return Response({"error": "file_format must be csv or json."}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(table, file_format)
+
+    @dishes.mapping.post
     def create_dish(self, request: Request) -> Response:
         """
         Create a new dish. Only available for admin users.
@@ -276,12 +332,12 @@ class FoodAPIViewSet(viewsets.ViewSet):
         """
         Get a specific order by its ID.
         """
-        order = get_object_or_404(Order, pk=pk, user=request.user)
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        details = order_details(pk)
+        if details is None or details["user"] != request.user.pk:
+            raise Http404
+        return Response(details["order"])
 
-    @action(methods=["get"], detail=False, url_path="orders", 
-            permission_classes=[IsAuthenticated])
+    @create_order.mapping.get
     def list_orders(self, request: Request) -> Response:
         """
         List all orders for the authenticated user.
@@ -300,13 +356,18 @@ class FoodAPIViewSet(viewsets.ViewSet):
             # Handle GET request for retrieving an existing order
             return self.all_orders(request, id)
 
-    @action(methods=["post"], detail=False, url_path=r"webhooks/kfc/")
+    @action(
+        methods=["post"],
+        detail=False,
+        url_path=r"webhooks/kfc/",
+        throttle_classes=[TokenBucketThrottle.scoped("kfc_webhook")],
+    )
     def kfc_webhook(self, request: Request) -> Response:
         """
         Handle KFC webhook notifications.
         """
-        data = request.data
-        process_kfc_webhook_data.delay(data)
+        if not publish_kfc_webhook(request.data):
+            return Response({"error": "Invalid webhook data."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": "Webhook received"})
 
 
@@ -364,14 +425,6 @@ def process_order(order_id):
     order.save()
     logger.info(f"Order {order.id} processed successfully")
 
-@shared_task(queue='high_priority')
-def process_kfc_webhook_data(data):
-    
-    logger.info(f"Processing KFC webhook data: {data}")
-    # TODO: 
-    
-    pass
-
 @shared_task(queue='high_priority')
 def process_order_in_background(order_id):
     # Your order processing logic here
@@ -392,15 +445,11 @@ def kfc_webhook(request: Request):
     """
     This is a webhook for KFC provider
     """
-    process_kfc_webhook_data.delay(request.data)
+    if not publish_kfc_webhook(request.data):
+        return JsonResponse({"error": "Invalid webhook data."}, status=400)
     return JsonResponse({}, status=200)
 
 
-class FoodAPIViewSet(viewsets.ViewSet):
-    def dishes(self, request):
-        return Response({"message": "Dishes endpoint"})
-
-
 @api_view(['GET'])
 def active_deliveries(request):
     return JsonResponse({"message": "Active deliveries endpoint"})
@@ -422,42 +471,19 @@ def ship(request, provider, order_id):
 def providers(request):    
     return JsonResponse({"message": "Providers endpoint is active"})
 
-@csrf_exempt   
+@csrf_exempt
+@rate_limit("kfc_webhook")
 def kfc_webhook(request):
-    """Process KFC Order webhooks"""
-    data: dict = json.loads(json.dumps(request.POST))
-
-    cache = CacheService()
-    restaurant = Restaurant.objects.get(name="kfc")
-    kfc_cahe_order = cache.get("kfc_orders", key=data["id"])
-
-    # get internal order from mapping
-    # add logging if order wasn't found
-    order: Order = Order.objects.get(id=kfc_cahe_order["internal_order_id"])
-    tracking_order = TrackingOrder(**cache.get(namespace="orders", key=str(order.pk)))
-    tracking_order.restaurants[str(restaurant.pk)] |= {
-        "external_id": data["id"],
-        "status": OrderStatus.COOKED,
-    
-    }
-    
-    cache.set(
-        namespace="orders", 
-        key=str(order.pk), 
-        value=asdict(tracking_order)
-    )
-
-    all_orders_cooked(order.pk)
-    #     # because KFC return webhok only when order is cooked
-    #     order.status = OrderStatus.COOKED
-    #     order.save()
-    #     print("All orders are cooked")
-    # else:
-    #     print("Not all orders are cooked yet")
+    """
+    Process KFC Order webhooks
 
-    # print(f"KFC Webhook received data: {data}")
+    Only parses the webhook and appends it to the Redis Stream,
+    the consumers (`manage.py consume_webhooks`) apply it in batches.
+    """
+    if not publish_kfc_webhook(request.POST):
+        return JsonResponse({"error": "Invalid webhook data."}, status=400)
 
-    return JsonResponse({"message": "ok from GitHub Actions!"})
+    return JsonResponse({"message": "ok"})
 
 router = routers.DefaultRouter()
 router.register(r'food', FoodAPIViewSet, basename='food')
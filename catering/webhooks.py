@@ -0,0 +1,165 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+
+from shared.cache import CacheService
+from shared.streams import StreamService
+from .data_classes import RestaurantTracking, TrackingOrder
+from .enums import OrderStatus
+from .mapper import RESTAURANT_EXTERNAL_TO_INTERNAL, WEBHOOK_STATUS_RANK
+from .order_index import ExternalOrderIndex
+from .servises import mark_orders_cooked
+
+logger = logging.getLogger(__name__)
+
+KFC_WEBHOOKS_STREAM = "webhooks:kfc"
+KFC_WEBHOOKS_GROUP = "kfc_webhooks"
+
+
+def kfc_webhooks() -> StreamService:
+    """The stream KFC webhooks are appended to by the API and consumed from by workers."""
+    return StreamService(stream=KFC_WEBHOOKS_STREAM, group=KFC_WEBHOOKS_GROUP)
+
+
+def parse_kfc_webhook(data) -> dict[str, str] | None:
+    """
+    Extracts the KFC webhook event from the request data.
+
+    Returns:
+        The event with the external order id and status, or None if the data is invalid.
+    """
+    external_order_id = data.get("id")
+    external_status = data.get("status")
+
+    if not external_order_id or not external_status:
+        return None
+
+    return {"id": str(external_order_id), "status": str(external_status)}
+
+
+def accept_webhook(provider: str, external_id: str, status: str, dedupe: bool = True) -> bool:
+    """
+    Guards webhook ingestion against retried and reordered deliveries.
+
+    Every (provider, external id, status) that arrives is remembered for
+    `WEBHOOK_DEDUP_TTL` seconds. A webhook is dropped if the same status was
+    already seen (a retry), or if a status ranked after it in
+    `WEBHOOK_STATUS_RANK` was already seen (it arrived out of order).
+    Both checks cost one pipelined round-trip.
+
+    Args:
+        provider: The provider name, e.g. "kfc".
+        external_id: The order id at the provider.
+        status: The provider status from the webhook.
+        dedupe: False for webhooks that repeat a status on purpose, e.g. location updates.
+
+    Returns:
+        True if the webhook has to be processed.
+    """
+    seen_key = f"{provider}:{external_id}"
+    ranks = WEBHOOK_STATUS_RANK.get(provider, {})
+    rank = ranks.get(status)
+    later_keys = [
+        f"{seen_key}:{getattr(later_status, 'value', later_status)}"
+        for later_status, later_rank in ranks.items()
+        if rank is not None and later_rank > rank
+    ]
+
+    with CacheService().pipeline() as pipeline:
+        pipeline.get_many("webhooks_seen", later_keys)
+        pipeline.add("webhooks_seen", f"{seen_key}:{status}", 1, timeout=settings.WEBHOOK_DEDUP_TTL)
+    later_seen, first_time = pipeline.results
+
+    if later_seen:
+        logger.info(f"Dropping out of order {provider} webhook: {external_id} {status}")
+        return False
+
+    if dedupe and not first_time:
+        logger.info(f"Dropping duplicated {provider} webhook: {external_id} {status}")
+        return False
+
+    return True
+
+
+def forget_webhook(provider: str, external_id: str, status: str):
+    """Forgets a webhook `accept_webhook` let through but that failed, so the retry of the provider is not dropped."""
+    CacheService().delete("webhooks_seen", f"{provider}:{external_id}:{status}")
+
+
+def publish_kfc_webhook(data) -> bool:
+    """
+    Appends the KFC webhook to the stream, all processing is left to the consumers.
+
+    Retried and out of order webhooks are dropped before they reach the stream.
+
+    Returns:
+        False if the webhook data is invalid.
+    """
+    event = parse_kfc_webhook(data)
+    if event is None:
+        logger.error(f"Invalid data received in KFC webhook: {data}")
+        return False
+
+    if accept_webhook("kfc", event["id"], event["status"]):
+        try:
+            kfc_webhooks().publish(event)
+        except Exception:
+            forget_webhook("kfc", event["id"], event["status"])
+            raise
+    return True
+
+
+def process_kfc_webhooks(events: list[dict[str, str]]):
+    """
+    Applies a batch of KFC webhook events to the tracking orders.
+
+    The whole batch costs one HMGET for the external order index, one MGET and one
+    pipelined SET for the tracking orders and one UPDATE for the orders that got
+    fully cooked, no matter how many events it has.
+
+    Args:
+        events: The events built by `parse_kfc_webhook`, oldest first.
+    """
+    internal_ids = ExternalOrderIndex().resolve_many("kfc", [event["id"] for event in events])
+
+    # internal order id -> internal restaurant id -> the latest internal status
+    updates: dict[int, dict[str, OrderStatus]] = defaultdict(dict)
+
+    for event in events:
+        if event["id"] not in internal_ids:
+            logger.warning(f"Could not find internal order for KFC external_id: {event['id']}")
+            continue
+
+        internal_status = RESTAURANT_EXTERNAL_TO_INTERNAL["kfc"].get(event["status"])
+        if internal_status is None:
+            logger.info(f"Skipping KFC status {event['status']} for external_id: {event['id']}")
+            continue
+
+        order_id, restaurant_id = internal_ids[event["id"]]
+        updates[order_id][str(restaurant_id)] = internal_status
+
+    cache = CacheService()
+    tracking_orders = cache.get_many("orders", [str(order_id) for order_id in updates])
+
+    changed: dict[str, TrackingOrder] = {}
+    cooked_order_ids: list[int] = []
+
+    for order_id, statuses in updates.items():
+        tracking_order = tracking_orders.get(str(order_id))
+        if not tracking_order:
+            logger.error(f"Tracking data for order {order_id} not found in cache.")
+            continue
+
+        for restaurant_id, internal_status in statuses.items():
+            tracking_order.restaurants.setdefault(restaurant_id, RestaurantTracking()).status = internal_status
+
+        changed[str(order_id)] = tracking_order
+        if all(info.status == OrderStatus.COOKED for info in tracking_order.restaurants.values()):
+            cooked_order_ids.append(order_id)
+
+    cache.set_many("orders", changed)
+    logger.info(f"Applied {len(events)} KFC webhooks to {len(changed)} orders")
+
+    # a redelivered or reclaimed event does not move an order in delivery back to COOKED
+    mark_orders_cooked(cooked_order_ids)
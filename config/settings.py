@@ -138,6 +138,10 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# uploads, e.g. the CSV imports of dishes, shared by the API and the Celery workers
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -152,14 +156,47 @@ SILPO_PROVIDER_URL = os.getenv("SILPO_PROVIDER_URL", "http://silpo-provider:8002
 UBER_PROVIDER_URL = os.getenv("UBER_PROVIDER_URL", "http://uber-provider:8003")
 UKLON_PROVIDER_URL = os.getenv("UKLON_PROVIDER_URL", "http://uklon-provider:8004")
 
+# Pool limits and timeouts of the provider HTTP clients (shared.http).
+# Can be overridden per provider with query parameters of its *_PROVIDER_URL
+PROVIDER_HTTP = {
+    "TIMEOUT": float(os.getenv("PROVIDER_HTTP_TIMEOUT", default=10)),
+    "CONNECT_TIMEOUT": float(os.getenv("PROVIDER_HTTP_CONNECT_TIMEOUT", default=3)),
+    "MAX_CONNECTIONS": int(os.getenv("PROVIDER_HTTP_MAX_CONNECTIONS", default=20)),
+    "MAX_KEEPALIVE_CONNECTIONS": int(os.getenv("PROVIDER_HTTP_MAX_KEEPALIVE_CONNECTIONS", default=10)),
+    "KEEPALIVE_EXPIRY": float(os.getenv("PROVIDER_HTTP_KEEPALIVE_EXPIRY", default=30)),
+    # needs the h2 package (pip install httpx[http2]), without it HTTP/1.1 is used and a warning logged
+    "HTTP2": os.getenv("PROVIDER_HTTP2", default="false"),
+}
+
+# Cooked orders with the same eta and restaurants are delivered by one courier.
+# The window (seconds) to collect orders into one multi-stop delivery.
+DELIVERY_BATCH_WINDOW = int(os.getenv("DELIVERY_BATCH_WINDOW", default=30))
+DELIVERY_BATCH_MAX_ORDERS = int(os.getenv("DELIVERY_BATCH_MAX_ORDERS", default=10))
+
+# How long (seconds) delivered webhooks are remembered to drop retries and reordered ones
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", default=60 * 60 * 24))
+
 
 AUTH_USER_MODEL = "users.User"
 
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
+    ),
+    # orjson, the browsable API and the form posts of the provider webhooks are kept
+    "DEFAULT_RENDERER_CLASSES": (
+        "shared.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    "DEFAULT_PARSER_CLASSES": (
+        "shared.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # the reverse proxies in front of the API (nginx: 1). The client address of the rate limits is
+    # taken from X-Forwarded-For only behind them, otherwise the header could be forged.
+    "NUM_PROXIES": int(os.getenv("DJANGO_NUM_PROXIES", 0)),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,  # default page size for pagination    
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -182,7 +219,11 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=120),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
-    "UPDATE_LAST_LOGIN": True,
+    # last_login is written in batches by users.tasks.flush_last_logins, see users.logins
+    "UPDATE_LAST_LOGIN": False,
+    # the tokens carry the hash of the password, users.authentication rejects them once it changes
+    "CHECK_REVOKE_TOKEN": True,
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainPairSerializer",
     "ALGORITHM": "HS256",
     "SIGNING_KEY": DJANGO_SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer", ),
@@ -199,18 +240,66 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         },
-        'TIMEOUT': None,  # Записи в кэше живут вечно
+        # retention of the entries written without a timeout, see CACHE_NAMESPACES for the per-namespace TTLs
+        'TIMEOUT': int(os.getenv("DJANGO_CACHE_TIMEOUT", default=60 * 60 * 24)),
     }
 }
 
 # Optionally, configure cache timeout
 CACHE_TTL = 60 * 5  # 5 minutes
 
+# Per-namespace settings of shared.cache.CacheService.
+# CODEC: how the values are stored, by default they are pickled by django_redis
+# TTL: the retention (seconds) of the entries written without a timeout
+# L1: an in-process LRU in front of Redis for hot, rarely changing keys,
+#     MAX_SIZE entries per process, served for up to TTL seconds
+CACHE_NAMESPACES = {
+    # the tracking of orders in processing, archived to Order.tracking once they are finished
+    "orders": {"CODEC": "catering.data_classes.tracking_order_codec", "TTL": 60 * 60 * 24 * 2},
+    "menu": {"L1": {"MAX_SIZE": 100, "TTL": 60}},
+    "order_details": {"TTL": 60},
+    # the authenticated users (users.authentication), dropped on every save
+    "auth_users": {"TTL": 60 * 5, "L1": {"MAX_SIZE": 10000, "TTL": 30}},
+}
+
+# Instrumentation of shared.cache.CacheService, exposed at /metrics/cache in the Prometheus format.
+# Switched on and off at runtime with `manage.py cache_metrics on|off`.
+CACHE_METRICS = {
+    "ENABLED": os.getenv("CACHE_METRICS_ENABLED", default="true").lower() == "true",
+    # how often (seconds) every process adds its metrics to Redis
+    "FLUSH_INTERVAL": 10,
+    # share of the values without a codec pickled to measure their size
+    "SIZE_SAMPLE_RATE": 0.01,
+}
+# the bearer token the metrics scraper must send, the endpoint is open without it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Token buckets of the public endpoints (shared.rate_limit), over the limit they answer 429 with Retry-After.
+# RATE: "<count>/<s|m|h|d>" refill, BURST: bucket size (the count of RATE by default),
+# KEY: "ip", "user" or "global" (one bucket for all clients of the endpoint)
+RATE_LIMITS = {
+    "register": {"RATE": "5/m", "BURST": 10, "KEY": "ip"},
+    "activate": {"RATE": "10/m", "BURST": 20, "KEY": "ip"},
+    "resend_activation_email": {"RATE": "3/m", "BURST": 5, "KEY": "ip"},
+    "uber_webhook": {"RATE": "200/s", "BURST": 500, "KEY": "global"},
+    "kfc_webhook": {"RATE": "200/s", "BURST": 500, "KEY": "global"},
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = os.getenv("DJANGO_EMAIL_HOST", default="mailing")
 EMAIL_PORT = int(os.getenv("DJANGO_EMAIL_PORT", default=1025))
 DEFAULT_FROM_EMAIL = 'from@example.com'
 
+# The outbox of users.Email, sent by the users.tasks.send_emails task over one SMTP connection
+EMAIL_OUTBOX = {
+    "BATCH_SIZE": 100,
+    # rejected emails are retried after RETRY_DELAY, 2 * RETRY_DELAY, 4 * RETRY_DELAY ... seconds
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 60,
+    # a claimed batch is not claimed by another run for LEASE seconds, e.g. if the worker dies while sending it
+    "LEASE": 600,
+}
+
 
 # =====================================================================
 # CELERY SECTION
@@ -234,8 +323,42 @@ CELERY_TASK_QUEUES = (
     Queue('low_priority', routing_key='low_priority'),
 )
 
+CELERY_BEAT_SCHEDULE = {
+    # the restaurant orders and the deliveries in progress are polled in bulk, a run that
+    # could not start in time is dropped instead of piling up behind the next one
+    "poll-silpo-orders": {
+        "task": "catering.tasks.poll_silpo_orders",
+        "schedule": 2,
+        "options": {"expires": 2},
+    },
+    "poll-deliveries": {
+        "task": "catering.tasks.poll_deliveries",
+        "schedule": 2,
+        "options": {"expires": 2},
+    },
+    # archive the tracking of finished orders the processing did not archive (e.g. cancelled in the admin)
+    "sweep-tracking": {
+        "task": "catering.tasks.sweep_tracking",
+        "schedule": 60 * 10,
+    },
+    # retry the emails rejected by the SMTP server
+    "send-emails": {
+        "task": "users.tasks.send_emails",
+        "schedule": 60,
+    },
+    "flush-last-logins": {
+        "task": "users.tasks.flush_last_logins",
+        "schedule": 60,
+    },
+    # unchanged menus cost a request and a hash comparison
+    "sync-menus": {
+        "task": "catering.tasks.sync_menus",
+        "schedule": 60 * 15,
+    },
+}
+
 CELERY_TASK_ROUTES = {
-    'users.tasks.send_activation_email': {'queue': 'low_priority'},
+    'users.tasks.send_emails': {'queue': 'low_priority'},
     'catering.tasks.order_in_silpo': {'queue': 'high_priority'},
     'catering.tasks.order_in_kfc': {'queue': 'high_priority'},
 }
@@ -4,10 +4,13 @@ from django.conf.urls.static import static
 from django.conf import settings
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from shared.views import cache_metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/users/", include("users.urls")),
     path("api/v1/catering/", include("catering.urls")),
+    path("metrics/cache", cache_metrics, name="cache-metrics"),
     # Spectacular API endpoints:
     # path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     # Optional UI:
@@ -1,39 +1,75 @@
-from typing import Literal
-import httpx
-import os
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from enum import Enum
 
+from shared.http import BulkLookupMixin, transport
+
 
 class OrderStatus(str, Enum):
     NOT_STARTED = "not_started"
-    IN_PROGRESS = "in_progress"
-    DONE = "done"
+    PENDING = "pending"
+    COOKING = "cooking"
+    COOKED = "cooked"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
 
 
 @dataclass
 class OrderItem:
-    id: str
+    dish: str
     quantity: int
 
 
-OrderStatus = Literal["not_started", "cooking", "cooked", "completed"]
+@dataclass
+class OrderResponse:
+    id: str
+    status: str
+
+
+@dataclass
+class OrderRequestBody:
+    order: list[OrderItem]
+
+
+@dataclass
+class MenuItem:
+    id: str
+    name: str
+    price: int
+
+
+class Client(BulkLookupMixin):
+    PROVIDER = "kfc"
+    BASE_URL = "/api/orders"
 
+    @classmethod
+    def create_order(cls, order_body: OrderRequestBody, idempotency_key: str | None = None) -> OrderResponse:
+        """Creates the order, a repeated `idempotency_key` returns the order created with it instead."""
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response = transport.client(cls.PROVIDER).post(cls.BASE_URL, json=asdict(order_body), headers=headers)
+        response.raise_for_status()
+        return OrderResponse(**response.json())
 
-class KFC:
-    def __init__(self) -> None:
-        self.base_url = os.getenv("KFC_PROVIDER_URL")
+    @classmethod
+    def get_menu(cls) -> list[MenuItem]:
+        response = transport.client(cls.PROVIDER).get("/api/menu")
+        response.raise_for_status()
+        return [MenuItem(**item) for item in response.json()["items"]]
 
-    def make_order(self, order_items: list[OrderItem]) -> dict:
-        order_data = [item.__dict__ for item in order_items]
-        response = httpx.post(f"{self.base_url}/api/orders", json={"order": order_data})
+    @classmethod
+    def get_order(cls, order_id: str) -> OrderResponse:
+        response = transport.client(cls.PROVIDER).get(f"{cls.BASE_URL}/{order_id}")
         response.raise_for_status()
-        return response.json()
+        return cls._order_response(response.json())
 
-    def get_order(self, order_id: str) -> dict:
-        response = httpx.get(f"{self.base_url}/api/orders/{order_id}")
+    @classmethod
+    def cancel_order(cls, order_id: str) -> OrderResponse:
+        response = transport.client(cls.PROVIDER).post(f"{cls.BASE_URL}/{order_id}/cancel")
         response.raise_for_status()
-        return response.json()
+        return OrderResponse(**response.json())
+
+    @staticmethod
+    def _order_response(data: dict) -> OrderResponse:
+        return OrderResponse(id=data["id"], status=data["status"])
 
 
-kfc_provider = KFC()
\ No newline at end of file
+kfc_provider = Client()
@@ -3,12 +3,16 @@ from dataclasses import dataclass, asdict, field
 
 import httpx
 
+from shared.http import BulkLookupMixin, transport
+
 
 class OrderStatus:
     NOT_STARTED = "not_started"
     COOKING = "cooking"
     COOKED = "cooked"
     FINISHED = "finished"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
 
 
 @dataclass
@@ -28,23 +32,52 @@ class OrderRequestBody:
     order: list[OrderItem]
 
 
+@dataclass
+class MenuItem:
+    id: str
+    name: str
+    price: int
+
+
 
-class Client:
-    BASE_URL = "http://localhost:8001/api/orders"
+class Client(BulkLookupMixin):
+    PROVIDER = "silpo"
+    BASE_URL = "/api/orders"
     
     @classmethod
-    def create_order(cls, order_body: OrderRequestBody):
-        response: httpx.Response = httpx.post(
-            cls.BASE_URL, json=asdict(order_body)
+    def create_order(cls, order_body: OrderRequestBody, idempotency_key: str | None = None):
+        """Creates the order, a repeated `idempotency_key` returns the order created with it instead."""
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response: httpx.Response = transport.client(cls.PROVIDER).post(
+            cls.BASE_URL, json=asdict(order_body), headers=headers
         )
         response.raise_for_status()
         return OrderResponse(**response.json())
     
     
     
+    @classmethod
+    def get_menu(cls) -> list[MenuItem]:
+        response: httpx.Response = transport.client(cls.PROVIDER).get("/api/menu")
+        response.raise_for_status()
+        return [MenuItem(**item) for item in response.json()["items"]]
+
     @classmethod
     def get_order(cls, order_id: str) -> OrderResponse:
-        response: httpx.Response = httpx.get(          f"{cls.BASE_URL}/{order_id}"
+        response: httpx.Response = transport.client(cls.PROVIDER).get(
+            f"{cls.BASE_URL}/{order_id}"
         )
         response.raise_for_status()
-        return OrderResponse(**response.json())
\ No newline at end of file
+        return cls._order_response(response.json())
+
+    @classmethod
+    def cancel_order(cls, order_id: str) -> OrderResponse:
+        response: httpx.Response = transport.client(cls.PROVIDER).post(
+            f"{cls.BASE_URL}/{order_id}/cancel"
+        )
+        response.raise_for_status()
+        return OrderResponse(**response.json())
+
+    @staticmethod
+    def _order_response(data: dict) -> OrderResponse:
+        return OrderResponse(id=data["id"], status=data["status"])
@@ -3,6 +3,8 @@ from django.conf import settings
 import logging
 from enum import Enum
 
+from shared.http import transport
+
 
 class DeliveryStatus(str, Enum):
     """
@@ -21,7 +23,7 @@ class DeliveryStatus(str, Enum):
 
 logger = logging.getLogger(__name__)
 
-async def create_uber_delivery(order_id: str, webhook_url: str):
+def create_uber_delivery(order_id: str, webhook_url: str):
     """
     Calls the Uber mock provider to start a delivery simulation.
     """
@@ -30,20 +32,18 @@ async def create_uber_delivery(order_id: str, webhook_url: str):
         logger.error("UBER_PROVIDER_URL is not configured in settings.")
         return None
 
-    api_url = f"{uber_provider_url}/deliveries"
     payload = {
         "order_id": str(order_id),
         "webhook_url": webhook_url,
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(api_url, json=payload, timeout=10.0)
-            response.raise_for_status()  # Raise an error for bad responses
-            
-            response_data = response.json()
-            logger.info(f"Successfully created Uber delivery for order {order_id}. Response: {response_data}")
-            return response_data
+        response = transport.client("uber").post("/deliveries", json=payload)
+        response.raise_for_status()  # Raise an error for bad responses
+
+        response_data = response.json()
+        logger.info(f"Successfully created Uber delivery for order {order_id}. Response: {response_data}")
+        return response_data
 
     except httpx.RequestError as e:
         logger.error(f"Error calling Uber provider for order {order_id}: {e}")
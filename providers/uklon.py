@@ -1,6 +1,8 @@
 from dataclasses import dataclass, asdict
 import httpx
 
+from shared.http import BulkLookupMixin, transport
+
 
 class OrderStatus:
     NOT_STARTED = "not_started"
@@ -23,21 +25,34 @@ class OrderResponse:
 
 
 
-class Client:
-    BASE_URL = "http://localhost:8003/drivers/orders"
+class Client(BulkLookupMixin):
+    PROVIDER = "uklon"
+    BASE_URL = "/driver/orders"
     
     @classmethod
     def create_order(cls, order_body: OrderRequestBody):
-        response: httpx.Response = httpx.post(
-            cls.BASE_URL, json=asdict(order_body)
+        # the API names the fields `address` and `comments`
+        response: httpx.Response = transport.client(cls.PROVIDER).post(
+            cls.BASE_URL, json={"address": order_body.adress, "comments": order_body.comment}
         )
         response.raise_for_status()
-        return OrderResponse(**response.json())
+        return cls._order_response(response.json())
     
        
     @classmethod
     def get_order(cls, order_id: str) -> OrderResponse:
-        response: httpx.Response = httpx.get(          f"{cls.BASE_URL}/{order_id}"
+        response: httpx.Response = transport.client(cls.PROVIDER).get(
+            f"{cls.BASE_URL}/{order_id}"
         )
         response.raise_for_status()
-        return OrderResponse(**response.json())
\ No newline at end of file
+        return cls._order_response(response.json())
+
+    @staticmethod
+    def _order_response(data: dict) -> OrderResponse:
+        return OrderResponse(
+            id=data["id"],
+            status=data["status"],
+            location=data["location"],
+            adress=data["address"],
+            comment=data["comments"],
+        )
\ No newline at end of file
@@ -1,7 +1,272 @@
+import math
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache as memoize
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
 from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from .codecs import Codec
+from .local_cache import MISSING, local_caches
+from .metrics import cache_stats
+
+
+def _is_redis() -> bool:
+    """True if the default cache is django_redis, which can pipeline commands."""
+    return hasattr(cache, "client") and hasattr(cache.client, "get_client")
+
+
+def namespace_options(namespace: str) -> dict[str, Any]:
+    """The settings of the namespace in `settings.CACHE_NAMESPACES`."""
+    return getattr(settings, "CACHE_NAMESPACES", {}).get(namespace, {})
+
+
+@memoize
+def get_codec(namespace: str) -> Codec | None:
+    """
+    Returns the codec of the namespace from `settings.CACHE_NAMESPACES`.
+
+    Namespaces without a codec store the values as they are, serialized by
+    the cache backend (pickle for django_redis).
+    """
+    path = namespace_options(namespace).get("CODEC")
+    return import_string(path) if path else None
+
+
+def get_timeout(namespace: str, timeout):
+    """
+    The retention of an entry written without an explicit timeout.
+
+    It is the "TTL" of the namespace in `settings.CACHE_NAMESPACES`, or the
+    TIMEOUT of the cache backend for namespaces without one.
+    """
+    if timeout is not None:
+        return timeout
+    return namespace_options(namespace).get("TTL", DEFAULT_TIMEOUT)
+
+
+def _reset_codecs(setting, **kwargs):
+    if setting == "CACHE_NAMESPACES":
+        get_codec.cache_clear()
+
+
+setting_changed.connect(_reset_codecs)
+
+
+def encode(namespace: str, value):
+    codec = get_codec(namespace)
+    return value if codec is None else codec.encode(value)
+
+
+def decode(namespace: str, value):
+    codec = get_codec(namespace)
+    return value if codec is None or value is None else codec.decode(value)
+
+
+def decode_many(namespace: str, values: dict[str, Any]) -> dict[str, Any]:
+    """Decodes the values by key, entries unreadable by the codec are left out like misses."""
+    decoded = {key: decode(namespace, value) for key, value in values.items()}
+    return {key: value for key, value in decoded.items() if value is not None}
+
+
+@dataclass(slots=True)
+class Computed:
+    """A value cached by `CacheService.get_or_compute`, with what its early refresh needs."""
+
+    value: Any
+    # how long the computation took, in seconds
+    delta: float
+    # unix time the value becomes stale at
+    expires_at: float
+
+    def should_refresh(self, beta: float) -> bool:
+        """
+        XFetch: recompute before the expiry with a probability growing as it gets closer.
+
+        Slow computations start earlier, so a hot key is refreshed by one
+        caller before it expires for all of them.
+        """
+        return time.time() - self.delta * beta * math.log(1 - random.random()) >= self.expires_at
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.time()
+
+
+class CachePipeline:
+    """
+    Namespace-aware cache commands sent to Redis in one round-trip.
+
+    Commands are buffered and executed when the `CacheService.pipeline()` block
+    exits, their results are in `results` in the order of the calls:
+    the value for `get`, a dict for `get_many`, a bool for `add` and None for
+    the writes. With `transaction=True` Redis runs them inside MULTI/EXEC.
+
+    Other cache backends (e.g. locmem in tests) run the commands one by one,
+    without the atomicity.
+    """
+
+    def __init__(self, transaction: bool = True):
+        self.transaction = transaction
+        # (command, namespace, arguments with the namespaced keys and encoded values)
+        self.commands: list[tuple[str, str, tuple]] = []
+        self.results: list[Any] = []
+        # keys written by namespace, dropped from the L1 caches after the execution
+        self.written: defaultdict[str, list[str]] = defaultdict(list)
+
+    def get(self, namespace: str, key: str):
+        self.commands.append(("get", namespace, (f"{namespace}:{key}",)))
+
+    def get_many(self, namespace: str, keys: Iterable[str]):
+        self.commands.append(("get_many", namespace, ({f"{namespace}:{key}": key for key in keys},)))
+
+    def set(self, namespace: str, key: str, value, timeout=None):
+        args = (f"{namespace}:{key}", encode(namespace, value), get_timeout(namespace, timeout))
+        cache_stats.observe_size(namespace, args[1])
+        self.commands.append(("set", namespace, args))
+        self.written[namespace].append(key)
+
+    def set_many(self, namespace: str, data: dict[str, Any], timeout=None):
+        self.written[namespace].extend(data)
+        data = {f"{namespace}:{key}": encode(namespace, value) for key, value in data.items()}
+        for value in data.values():
+            cache_stats.observe_size(namespace, value)
+        self.commands.append(("set_many", namespace, (data, get_timeout(namespace, timeout))))
+
+    def add(self, namespace: str, key: str, value, timeout=None):
+        args = (f"{namespace}:{key}", encode(namespace, value), get_timeout(namespace, timeout))
+        cache_stats.observe_size(namespace, args[1])
+        self.commands.append(("add", namespace, args))
+        self.written[namespace].append(key)
+
+    def delete(self, namespace: str, key: str):
+        self.delete_many(namespace, [key])
+
+    def delete_many(self, namespace: str, keys: Iterable[str]):
+        keys = list(keys)
+        self.commands.append(("delete_many", namespace, ([f"{namespace}:{key}" for key in keys],)))
+        self.written[namespace].extend(keys)
+
+    def execute(self) -> list[Any]:
+        started = time.perf_counter()
+        results = self._execute_redis() if _is_redis() else self._execute_cache()
+        elapsed = time.perf_counter() - started
+        for namespace in {namespace for _, namespace, _ in self.commands}:
+            cache_stats.observe_latency(namespace, "pipeline", elapsed)
+
+        self.results = []
+        for (command, namespace, _), result in zip(self.commands, results):
+            if command == "get":
+                result = decode(namespace, result)
+            elif command == "get_many":
+                result = decode_many(namespace, result)
+            self.results.append(result)
+
+        for namespace, keys in self.written.items():
+            local_caches.invalidate(namespace, keys)
+
+        self.commands = []
+        self.written.clear()
+        return self.results
+
+    def _execute_cache(self) -> list[Any]:
+        results = []
+        for command, _, args in self.commands:
+            match command:
+                case "get":
+                    results.append(cache.get(*args))
+                case "get_many":
+                    keys = args[0]
+                    results.append({keys[key]: value for key, value in cache.get_many(list(keys)).items()})
+                case "set":
+                    key, value, timeout = args
+                    cache.set(key, value, timeout)
+                    results.append(None)
+                case "set_many":
+                    cache.set_many(*args)
+                    results.append(None)
+                case "add":
+                    key, value, timeout = args
+                    results.append(cache.add(key, value, timeout))
+                case "delete_many":
+                    cache.delete_many(*args)
+                    results.append(None)
+        return results
+
+    def _execute_redis(self) -> list[Any]:
+        client = cache.client
+        pipeline = client.get_client(write=True).pipeline(transaction=self.transaction)
+        # the number of Redis commands queued for every call and how to read their replies
+        readers: list[tuple[int, Any]] = []
+
+        def ttl(timeout) -> dict:
+            timeout = cache.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+            return {} if timeout is None else {"px": max(int(timeout * 1000), 1)}
+
+        for command, _, args in self.commands:
+            match command:
+                case "get":
+                    pipeline.get(client.make_key(args[0]))
+                    readers.append((1, lambda replies: None if replies[0] is None else client.decode(replies[0])))
+                case "get_many":
+                    keys = args[0]
+                    if keys:
+                        pipeline.mget([client.make_key(key) for key in keys])
+                    readers.append(
+                        (
+                            1 if keys else 0,
+                            lambda replies, keys=list(keys.values()): {
+                                key: client.decode(value)
+                                for key, value in zip(keys, replies[0] if replies else [])
+                                if value is not None
+                            },
+                        )
+                    )
+                case "set":
+                    key, value, timeout = args
+                    pipeline.set(client.make_key(key), client.encode(value), **ttl(timeout))
+                    readers.append((1, lambda replies: None))
+                case "set_many":
+                    data, timeout = args
+                    for key, value in data.items():
+                        pipeline.set(client.make_key(key), client.encode(value), **ttl(timeout))
+                    readers.append((len(data), lambda replies: None))
+                case "add":
+                    key, value, timeout = args
+                    pipeline.set(client.make_key(key), client.encode(value), nx=True, **ttl(timeout))
+                    readers.append((1, lambda replies: bool(replies[0])))
+                case "delete_many":
+                    keys = args[0]
+                    if keys:
+                        pipeline.delete(*[client.make_key(key) for key in keys])
+                    readers.append((1 if keys else 0, lambda replies: None))
+
+        replies = pipeline.execute()
+        results = []
+        for count, read in readers:
+            results.append(read(replies[:count]))
+            replies = replies[count:]
+        return results
 
 
 class CacheService:
+    """
+    Namespaced access to the cache.
+
+    Values are stored through the codec of their namespace, if it has one
+    (see `settings.CACHE_NAMESPACES`), e.g. `TrackingOrder` in "orders".
+    Namespaces with an L1 tier are also kept in the memory of the process
+    (see `shared.local_cache`), their values must not be mutated by callers.
+    Pipelines always read from Redis.
+    """
+
     def get(self, namespace: str, key: str):
         """
         Retrieves data from the cache.
@@ -13,8 +278,21 @@ class CacheService:
         Returns:
             The cached data, or None if it's not in the cache.
         """
+        local_cache = local_caches.get(namespace)
+        if local_cache is not None:
+            value = local_cache.get(key)
+            if value is not MISSING:
+                cache_stats.record(namespace, "l1_hits")
+                return value
+
         cache_key = f"{namespace}:{key}"
-        return cache.get(cache_key)
+        with cache_stats.timed(namespace, "get"):
+            value = decode(namespace, cache.get(cache_key))
+        cache_stats.record(namespace, "misses" if value is None else "l2_hits")
+
+        if local_cache is not None and value is not None:
+            local_cache.set(key, value)
+        return value
 
     def set(self, namespace: str, key: str, value, timeout=None):
         """
@@ -24,18 +302,266 @@ class CacheService:
             namespace: The namespace for the cache key.
             key: The key for the cache entry.
             value: The data to be cached.
-            timeout: The cache timeout in seconds. If None, uses the default timeout.
+            timeout: The cache timeout in seconds. If None, uses the TTL of the namespace or the default timeout.
         """
         cache_key = f"{namespace}:{key}"
-        cache.set(cache_key, value, timeout)
+        value = encode(namespace, value)
+        cache_stats.observe_size(namespace, value)
+        with cache_stats.timed(namespace, "set"):
+            cache.set(cache_key, value, get_timeout(namespace, timeout))
+        local_caches.invalidate(namespace, [key])
 
-    def delete(self, namespace: str, key: str):
+    def delete(self, namespace: str, key: str) -> bool:
         """
         Deletes data from the cache.
 
         Args:
             namespace: The namespace for the cache key.
             key: The key for the cache entry.
+
+        Returns:
+            True if the key was deleted, False if it did not exist (e.g. deleted by a concurrent caller).
+        """
+        cache_key = f"{namespace}:{key}"
+        with cache_stats.timed(namespace, "delete"):
+            deleted = cache.delete(cache_key)
+        local_caches.invalidate(namespace, [key])
+        return deleted
+
+    def add(self, namespace: str, key: str, value, timeout=None) -> bool:
+        """
+        Sets data in the cache only if the key is not already present.
+
+        Args:
+            namespace: The namespace for the cache key.
+            key: The key for the cache entry.
+            value: The data to be cached.
+            timeout: The cache timeout in seconds. If None, uses the TTL of the namespace or the default timeout.
+
+        Returns:
+            True if the value was stored, False if the key already existed.
         """
         cache_key = f"{namespace}:{key}"
-        cache.delete(cache_key)
+        value = encode(namespace, value)
+        cache_stats.observe_size(namespace, value)
+        with cache_stats.timed(namespace, "add"):
+            added = cache.add(cache_key, value, get_timeout(namespace, timeout))
+        if added:
+            local_caches.invalidate(namespace, [key])
+        return added
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> dict[str, Any]:
+        """
+        Retrieves many entries of the namespace in one round-trip.
+
+        Args:
+            namespace: The namespace for the cache keys.
+            keys: The keys of the cache entries.
+
+        Returns:
+            The cached data by key, keys not in the cache are left out.
+        """
+        found = {}
+        local_cache = local_caches.get(namespace)
+        if local_cache is not None:
+            keys = list(keys)
+            found = {key: value for key in keys if (value := local_cache.get(key)) is not MISSING}
+            cache_stats.record(namespace, "l1_hits", len(found))
+            keys = [key for key in keys if key not in found]
+
+        cache_keys = {f"{namespace}:{key}": key for key in keys}
+        with cache_stats.timed(namespace, "get_many"):
+            values = {cache_keys[cache_key]: value for cache_key, value in cache.get_many(list(cache_keys)).items()}
+            values = decode_many(namespace, values)
+        cache_stats.record(namespace, "l2_hits", len(values))
+        cache_stats.record(namespace, "misses", len(cache_keys) - len(values))
+
+        if local_cache is not None:
+            for key, value in values.items():
+                local_cache.set(key, value)
+        return found | values
+
+    def set_many(self, namespace: str, data: dict[str, Any], timeout=None):
+        """
+        Sets many entries of the namespace in one round-trip.
+
+        Args:
+            namespace: The namespace for the cache keys.
+            data: The data to be cached by key.
+            timeout: The cache timeout in seconds. If None, uses the TTL of the namespace or the default timeout.
+        """
+        if data:
+            encoded = {f"{namespace}:{key}": encode(namespace, value) for key, value in data.items()}
+            for value in encoded.values():
+                cache_stats.observe_size(namespace, value)
+            with cache_stats.timed(namespace, "set_many"):
+                cache.set_many(encoded, get_timeout(namespace, timeout))
+            local_caches.invalidate(namespace, data)
+
+    def delete_many(self, namespace: str, keys: Iterable[str]):
+        """
+        Deletes many entries of the namespace in one round-trip.
+
+        Args:
+            namespace: The namespace for the cache keys.
+            keys: The keys of the cache entries.
+        """
+        keys = list(keys)
+        if keys:
+            with cache_stats.timed(namespace, "delete_many"):
+                cache.delete_many([f"{namespace}:{key}" for key in keys])
+            local_caches.invalidate(namespace, keys)
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Any],
+        timeout: float | None = None,
+        stale_timeout: float | None = None,
+        lock_timeout: float = 10,
+        wait: float = 2,
+        beta: float = 1,
+    ):
+        """
+        Returns the cached value, or computes and caches it, protecting the source from stampedes.
+
+        Only the caller holding a short lock (`cache.add` in the "locks"
+        namespace) recomputes. The others are served the stale value if there
+        is one, or wait up to `wait` seconds for the new one. Values are
+        recomputed a bit before they expire (XFetch), so hot keys rarely expire.
+        Recomputes, early refreshes, lock contention and stale reads are
+        counted in `stats()`.
+
+        Args:
+            namespace: The namespace for the cache key, it must not have a codec.
+            key: The key for the cache entry.
+            compute: Computes the value, it may be None.
+            timeout: How long the value is fresh, in seconds. If None, uses the TTL of the namespace
+                or the default timeout.
+            stale_timeout: How long a stale value is kept to be served during the recompute,
+                in seconds. Defaults to `timeout`.
+            lock_timeout: When the lock of a crashed caller is released, in seconds.
+            wait: How long callers without a stale value wait for the recompute, in seconds.
+            beta: > 1 refreshes earlier, < 1 later, 0 disables the early refresh.
+
+        Returns:
+            The cached or computed value.
+        """
+        if get_codec(namespace) is not None:
+            raise ValueError(f"get_or_compute() does not support the codec of the {namespace!r} namespace")
+
+        timeout = get_timeout(namespace, timeout)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = cache.default_timeout
+
+        entry: Computed | None = self.get(namespace, key)
+        if entry is not None and not entry.should_refresh(beta):
+            return entry.value
+
+        lock_key = f"{namespace}:{key}"
+        if self.add("locks", lock_key, 1, timeout=lock_timeout):
+            return self._refresh(namespace, key, entry, compute, timeout, stale_timeout, lock_key)
+
+        cache_stats.record(namespace, "lock_contention")
+        if entry is not None:
+            if entry.expired:
+                cache_stats.record(namespace, "stale_served")
+            return entry.value
+        return self._wait_for_compute(namespace, key, compute, timeout, stale_timeout, wait)
+
+    def _refresh(
+        self,
+        namespace: str,
+        key: str,
+        entry: Computed | None,
+        compute: Callable[[], Any],
+        timeout,
+        stale_timeout,
+        lock_key: str,
+    ):
+        """Recomputes the value holding the lock, early (XFetch) if the entry is not expired yet."""
+        if entry is not None and not entry.expired:
+            cache_stats.record(namespace, "early_refreshes")
+        try:
+            return self._compute(namespace, key, compute, timeout, stale_timeout)
+        finally:
+            self.delete("locks", lock_key)
+
+    def _wait_for_compute(self, namespace: str, key: str, compute: Callable[[], Any], timeout, stale_timeout, wait):
+        """Waits up to `wait` seconds for the lock holder to cache the value, then computes it."""
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.get(namespace, key)
+            if entry is not None:
+                return entry.value
+
+        # the lock holder is too slow or has crashed
+        cache_stats.record(namespace, "lock_timeouts")
+        return self._compute(namespace, key, compute, timeout, stale_timeout)
+
+    def _compute(self, namespace: str, key: str, compute: Callable[[], Any], timeout, stale_timeout):
+        started_at = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started_at
+        cache_stats.record(namespace, "recomputes")
+
+        if timeout is None:
+            self.set(namespace, key, Computed(value, delta, math.inf), timeout=None)
+        else:
+            stale_timeout = timeout if stale_timeout is None else stale_timeout
+            self.set(namespace, key, Computed(value, delta, time.time() + timeout), timeout=timeout + stale_timeout)
+        return value
+
+    def scan(self, namespace: str, cursor: int = 0, count: int = 100) -> tuple[int, list[str]]:
+        """
+        Iterates over the keys of the namespace with Redis SCAN, a batch per call.
+
+        Other cache backends cannot be scanned and return no keys.
+
+        Args:
+            namespace: The namespace to scan.
+            cursor: 0 to start, then the cursor returned by the previous call.
+            count: A hint of the number of keys to look at per call.
+
+        Returns:
+            The cursor of the next call (0 when the scan is complete) and the keys of the batch.
+        """
+        if not _is_redis():
+            return 0, []
+
+        client = cache.client
+        cursor, cache_keys = client.get_client().scan(cursor, match=client.make_pattern(f"{namespace}:*"), count=count)
+        prefix = f"{namespace}:"
+        return cursor, [client.reverse_key(cache_key.decode()).removeprefix(prefix) for cache_key in cache_keys]
+
+    @staticmethod
+    def stats() -> dict[str, dict[str, float]]:
+        """
+        Reads of this process by namespace.
+
+        Returns:
+            The L1 hits, L2 (Redis) hits and misses, and the hit ratios, of every namespace.
+        """
+        return cache_stats.snapshot()
+
+    @contextmanager
+    def pipeline(self, transaction: bool = True):
+        """
+        Batches cache commands of any namespaces into one Redis round-trip.
+
+            with cache.pipeline() as pipeline:
+                pipeline.get_many("webhooks_seen", later_keys)
+                pipeline.add("webhooks_seen", key, 1, timeout=ttl)
+            seen, first_time = pipeline.results
+
+        Args:
+            transaction: Run the commands atomically (MULTI/EXEC).
+
+        Yields:
+            The `CachePipeline` collecting the commands, executed when the block exits.
+        """
+        pipeline = CachePipeline(transaction=transaction)
+        yield pipeline
+        pipeline.execute()
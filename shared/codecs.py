@@ -0,0 +1,120 @@
+import dataclasses
+import json
+import logging
+import pickle
+import zlib
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib json is slower but compatible
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED = 0x01
+
+
+class Codec:
+    """Turns cached values into bytes and back."""
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: Any) -> Any:
+        raise NotImplementedError
+
+
+class PickleCodec(Codec):
+    """What django-redis does by default, kept as the baseline for the benchmarks."""
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class JSONCodec(Codec):
+    """
+    orjson encoding (stdlib json if orjson is not installed) in a small frame.
+
+    The frame is a schema version byte, a flags byte and the payload. Payloads
+    of `compress_threshold` bytes or more are zlib-compressed when that makes
+    them smaller. Entries of another version are treated as cache misses.
+    """
+
+    def __init__(self, version: int = 1, compress_threshold: int = 1024, compress_level: int = 1):
+        """
+        Args:
+            version: The schema version written into every entry, 0-255.
+            compress_threshold: The payload size to try compression from, in bytes.
+            compress_level: The zlib level, 1 is the fastest.
+        """
+        self.version = version
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, value: Any) -> bytes:
+        payload = self.dumps(value)
+        flags = 0
+
+        if len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload, self.compress_level)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= COMPRESSED
+
+        return bytes((self.version, flags)) + payload
+
+    def decode(self, data: Any) -> Any:
+        if not isinstance(data, bytes):
+            # written before the codec was enabled, already unpickled by the cache backend
+            return self.from_primitive(data)
+
+        version, flags = data[0], data[1]
+        if version != self.version:
+            logger.info(f"Ignoring cached entry of schema version {version}, expected {self.version}")
+            return None
+
+        payload = data[2:]
+        if flags & COMPRESSED:
+            payload = zlib.decompress(payload)
+        return self.from_primitive(self.loads(payload))
+
+    def from_primitive(self, value: Any) -> Any:
+        return value
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(value)
+        return json.dumps(value, separators=(",", ":"), default=_dataclass_to_dict).encode()
+
+    @staticmethod
+    def loads(payload: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+
+class DataclassCodec(JSONCodec):
+    """
+    `JSONCodec` for a dataclass with a `from_dict()` class method.
+
+    Dataclasses (also with slots) are serialized by orjson natively and reads
+    return the dataclass, so callers do not rebuild it from a dict.
+    """
+
+    def __init__(self, cls: type, **kwargs):
+        super().__init__(**kwargs)
+        self.cls = cls
+
+    def from_primitive(self, value: Any) -> Any:
+        return self.cls.from_dict(value)
+
+
+def _dataclass_to_dict(value: Any) -> dict[str, Any]:
+    if dataclasses.is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,189 @@
+import importlib.util
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# provider name -> Django setting with its base URL
+PROVIDER_URL_SETTINGS = {
+    "kfc": "KFC_PROVIDER_URL",
+    "silpo": "SILPO_PROVIDER_URL",
+    "uber": "UBER_PROVIDER_URL",
+    "uklon": "UKLON_PROVIDER_URL",
+}
+
+# HTTP/2 is negotiated only if the optional `h2` package (httpx[http2]) is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ProviderTransport:
+    """
+    Long-lived, pooled HTTP clients for the provider integrations.
+
+    There is one client per provider and process, so connections are kept
+    alive between calls.
+    Pool limits and timeouts come from `settings.PROVIDER_HTTP` and can be
+    overridden per provider with query parameters of its `*_PROVIDER_URL`:
+
+        KFC_PROVIDER_URL=http://kfc-provider:8001?timeout=5&max_connections=50
+
+    Clients are dropped in a forked child (Celery prefork workers), because
+    sockets inherited from the parent must not be shared between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients: dict[str, httpx.Client] = {}
+
+    def options(self, provider: str) -> dict:
+        """
+        Builds the client options for the provider.
+
+        Args:
+            provider: The provider name, e.g. "kfc".
+
+        Returns:
+            Keyword arguments for `httpx.Client`.
+        """
+        url = getattr(settings, PROVIDER_URL_SETTINGS[provider])
+        parts = urlsplit(url)
+        config = settings.PROVIDER_HTTP | {key.upper(): value for key, value in parse_qsl(parts.query)}
+        http2 = str(config["HTTP2"]).lower() in ("1", "true")
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"HTTP/2 is enabled for {provider} but the h2 package is not installed, using HTTP/1.1")
+
+        return {
+            "base_url": urlunsplit(parts._replace(query="")),
+            "timeout": httpx.Timeout(
+                float(config["TIMEOUT"]), connect=float(config["CONNECT_TIMEOUT"])
+            ),
+            "limits": httpx.Limits(
+                max_connections=int(config["MAX_CONNECTIONS"]),
+                max_keepalive_connections=int(config["MAX_KEEPALIVE_CONNECTIONS"]),
+                keepalive_expiry=float(config["KEEPALIVE_EXPIRY"]),
+            ),
+            "http2": http2 and HTTP2_AVAILABLE,
+        }
+
+    def client(self, provider: str) -> httpx.Client:
+        """Returns the client of the provider, creating it on first use."""
+        self._check_pid()
+        client = self._clients.get(provider)
+
+        if client is None:
+            with self._lock:
+                client = self._clients.get(provider)
+                if client is None:
+                    client = httpx.Client(**self.options(provider))
+                    self._clients[provider] = client
+
+        return client
+
+    def reset(self):
+        """Forgets all clients without closing the sockets shared with the parent process."""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients = {}
+
+    def close(self):
+        """Closes the clients of this process."""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            logger.info("Process was forked, re-initializing provider HTTP clients")
+            self.reset()
+
+
+transport = ProviderTransport()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=transport.reset)
+
+
+def get_concurrently(get_one, ids: list[str], max_workers: int = 10) -> dict:
+    """
+    Fetches many resources with concurrent single requests.
+
+    Used by the provider clients when a provider has no bulk endpoint.
+    The threads share the pooled client of the provider.
+
+    Args:
+        get_one: The function fetching one resource by its id.
+        ids: The ids to fetch.
+        max_workers: The maximum number of requests in flight.
+
+    Returns:
+        The fetched resources by their ids.
+    """
+    if not ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ids))) as executor:
+        return dict(zip(ids, executor.map(get_one, ids)))
+
+
+class BulkLookupMixin:
+    """
+    `get_orders(ids)` of a provider client with `PROVIDER`, `BASE_URL`, `get_order(id)` and `_order_response(data)`.
+
+    Up to `BULK_SIZE` ids are sent per `GET {BASE_URL}?ids=...` request. If the
+    provider answers 404 or 405 (no bulk API, or not deployed yet) the orders
+    are fetched with concurrent single gets instead, and the bulk API is tried
+    again after `BULK_RETRY_AFTER` seconds. Unknown orders are left out.
+    """
+
+    BULK_SIZE = 100
+    BULK_RETRY_AFTER = 300
+    _bulk_disabled_until = 0.0
+
+    @classmethod
+    def get_orders(cls, order_ids: list[str]) -> dict:
+        order_ids = list(dict.fromkeys(order_ids))
+        results = {}
+        for start in range(0, len(order_ids), cls.BULK_SIZE):
+            if time.monotonic() < cls._bulk_disabled_until:
+                return results | cls._get_each(order_ids[start:])
+
+            response: httpx.Response = transport.client(cls.PROVIDER).get(
+                cls.BASE_URL, params={"ids": ",".join(order_ids[start:start + cls.BULK_SIZE])}
+            )
+            if response.status_code in (404, 405):
+                logger.warning(
+                    f"No bulk order lookup at {cls.PROVIDER} ({response.status_code}), "
+                    f"using single gets for {cls.BULK_RETRY_AFTER}s"
+                )
+                cls._bulk_disabled_until = time.monotonic() + cls.BULK_RETRY_AFTER
+                return results | cls._get_each(order_ids[start:])
+
+            response.raise_for_status()
+            results |= {item["id"]: cls._order_response(item) for item in response.json() if item.get("status")}
+
+        return results
+
+    @classmethod
+    def _get_each(cls, order_ids: list[str]) -> dict:
+        def get_one(order_id: str):
+            try:
+                return cls.get_order(order_id)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    return None
+                raise
+
+        return {
+            order_id: order
+            for order_id, order in get_concurrently(get_one, order_ids).items()
+            if order is not None and order.status
+        }
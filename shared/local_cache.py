@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded LRU of one cache namespace in the memory of the process.
+
+    Entries expire after `ttl` seconds, the least recently used entries are
+    evicted above `max_size`. Values are shared by all readers of the process,
+    so they must be treated as read-only.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Args:
+            max_size: The maximum number of entries.
+            ttl: How long an entry is served without asking Redis, in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Returns the value, or `MISSING` if it is not cached or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: float | None = None):
+        """Caches the value for the TTL, or for `timeout` seconds if that is shorter."""
+        ttl = self.ttl if timeout is None else min(self.ttl, timeout)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys: Iterable[str]):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class LocalCaches:
+    """
+    The L1 caches of the namespaces with an "L1" entry in `settings.CACHE_NAMESPACES`:
+
+        CACHE_NAMESPACES = {"menu": {"L1": {"MAX_SIZE": 100, "TTL": 60}}}
+
+    Writes publish the changed keys over Redis pub/sub, a daemon thread of
+    every process listening to the channel drops them from its own caches.
+    Messages are not persisted, so all L1 entries are dropped when the
+    listener reconnects, and the TTL bounds the staleness if one is lost.
+    """
+
+    def __init__(self):
+        self.caches: dict[str, LocalCache] | None = None
+        self.origin = uuid.uuid4().hex
+        self.listener_pid: int | None = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """(Re)reads the L1 settings, on first use and when the settings are overridden in tests."""
+        self.caches = {
+            namespace: LocalCache(options["L1"]["MAX_SIZE"], options["L1"]["TTL"])
+            for namespace, options in getattr(settings, "CACHE_NAMESPACES", {}).items()
+            if "L1" in options
+        }
+
+    def get(self, namespace: str) -> LocalCache | None:
+        """Returns the L1 cache of the namespace, or None if it has none."""
+        if self.caches is None:
+            self.load()
+        local_cache = self.caches.get(namespace)
+        if local_cache is not None and self.listener_pid != os.getpid():
+            self._start_listener()
+        return local_cache
+
+    def invalidate(self, namespace: str, keys: Iterable[str]):
+        """Drops the keys of the namespace here and in the other processes."""
+        local_cache = self.get(namespace)
+        keys = list(keys)
+        if local_cache is None or not keys:
+            return
+
+        local_cache.delete_many(keys)
+        connection = _redis_connection()
+        if connection is not None:
+            message = json.dumps({"origin": self.origin, "namespace": namespace, "keys": keys})
+            connection.publish(INVALIDATION_CHANNEL, message)
+
+    def handle(self, message: bytes | str):
+        """Applies an invalidation message of another process."""
+        data = json.loads(message)
+        local_cache = (self.caches or {}).get(data["namespace"])
+        if data["origin"] != self.origin and local_cache is not None:
+            local_cache.delete_many(data["keys"])
+
+    def clear(self):
+        for local_cache in (self.caches or {}).values():
+            local_cache.clear()
+
+    def _start_listener(self):
+        with self.lock:
+            # the thread of the parent does not survive a fork (gunicorn and Celery prefork workers)
+            if self.listener_pid == os.getpid():
+                return
+            self.listener_pid = os.getpid()
+            self.origin = uuid.uuid4().hex
+            self.clear()
+
+        if _redis_connection() is None:
+            return
+        threading.Thread(target=self._listen, name="cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                connection = _redis_connection()
+                if connection is None:
+                    return
+                pubsub = connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # invalidations published while disconnected are lost
+                self.clear()
+                for message in pubsub.listen():
+                    self.handle(message["data"])
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed, reconnecting: {e}")
+                time.sleep(1)
+
+
+def _redis_connection():
+    """The Redis connection of the default cache, None for other backends (e.g. locmem in tests)."""
+    from django_redis import get_redis_connection
+
+    from .cache import _is_redis
+
+    return get_redis_connection("default") if _is_redis() else None
+
+
+local_caches = LocalCaches()
+
+
+def _reload(setting, **kwargs):
+    if setting in ("CACHE_NAMESPACES", "CACHES"):
+        local_caches.load()
+        local_caches.listener_pid = None
+
+
+setting_changed.connect(_reload)
@@ -0,0 +1,258 @@
+import logging
+import pickle
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# the counters of reads, every other counter is an event (recomputes, lock_contention, ...)
+READS = {"l1_hits": "l1_hit", "l2_hits": "l2_hit", "misses": "miss"}
+
+# Redis hash the processes add their metrics to, so the endpoint shows all API and Celery processes
+METRICS_KEY = "cache_metrics"
+ENABLED_KEY = "cache_metrics:enabled"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class CacheMetrics:
+    """
+    Hits, misses, events, operation latencies and value sizes by cache namespace.
+
+    The counters are kept in the memory of the process (`snapshot()` for
+    `CacheService.stats()`) and added to a Redis hash every
+    `settings.CACHE_METRICS["FLUSH_INTERVAL"]` seconds, which `render()`
+    exposes in the Prometheus text format. Counters are not locked, so they
+    are approximate under concurrent threads.
+
+    Recording is switched on and off for all processes with `set_enabled()`,
+    every process reads the switch at most once per flush interval.
+    """
+
+    def __init__(self):
+        self.counters: defaultdict[str, Counter] = defaultdict(Counter)
+        # (metric, namespace, label) -> histogram
+        self.histograms: dict[tuple[str, str, str], Histogram] = {}
+        # what was already added to the Redis hash
+        self.flushed: Counter = Counter()
+        self.next_flush = 0.0
+        self._enabled: bool | None = None
+        # when the switch is read again, also while the recording is off
+        self._next_check = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def options(self) -> dict[str, Any]:
+        return getattr(settings, "CACHE_METRICS", {})
+
+    @property
+    def enabled(self) -> bool:
+        now = time.monotonic()
+        if self._enabled is None or now >= self._next_check:
+            self._next_check = now + self.options.get("FLUSH_INTERVAL", 10)
+            self.read_switch()
+        return self._enabled
+
+    def read_switch(self):
+        from django.core.cache import cache
+
+        enabled = cache.get(ENABLED_KEY)
+        self._enabled = self.options.get("ENABLED", True) if enabled is None else enabled
+
+    def set_enabled(self, enabled: bool):
+        """Switches the recording on or off in all processes."""
+        from django.core.cache import cache
+
+        cache.set(ENABLED_KEY, enabled, timeout=None)
+        self._enabled = enabled
+
+    def record(self, namespace: str, event: str, count: int = 1):
+        """Counts `l1_hits`, `l2_hits`, `misses` or another event of the namespace."""
+        if self.enabled:
+            self.counters[namespace][event] += count
+
+    def observe_latency(self, namespace: str, operation: str, seconds: float):
+        if self.enabled:
+            self._histogram("cache_operation_seconds", namespace, operation, LATENCY_BUCKETS).observe(seconds)
+            self.tick()
+
+    @contextmanager
+    def timed(self, namespace: str, operation: str):
+        """Records the latency of the cache operation in the block."""
+        started = time.perf_counter()
+        yield
+        self.observe_latency(namespace, operation, time.perf_counter() - started)
+
+    def observe_size(self, namespace: str, value: Any):
+        """
+        Records the size of a written value.
+
+        Values encoded by a codec are bytes already. Others are pickled for the
+        measure, so only a sample of `SIZE_SAMPLE_RATE` of them is measured.
+        """
+        if not self.enabled:
+            return
+        if isinstance(value, bytes):
+            size = len(value)
+        elif random.random() < self.options.get("SIZE_SAMPLE_RATE", 0.01):
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        else:
+            return
+        self._histogram("cache_value_bytes", namespace, "", SIZE_BUCKETS).observe(size)
+
+    def _histogram(self, metric: str, namespace: str, label: str, buckets: tuple[float, ...]) -> Histogram:
+        key = (metric, namespace, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def tick(self):
+        """Flushes to Redis once per flush interval."""
+        now = time.monotonic()
+        if now < self.next_flush:
+            return
+        self.next_flush = now + self.options.get("FLUSH_INTERVAL", 10)
+        self.flush()
+
+    def flush(self):
+        """Adds the metrics recorded since the last flush to the Redis hash."""
+        from .local_cache import _redis_connection
+
+        with self.lock:
+            connection = _redis_connection()
+            if connection is None:
+                return
+
+            fields = self.fields()
+            increments = {field: value - self.flushed[field] for field, value in fields.items()}
+            increments = {field: value for field, value in increments.items() if value}
+            if not increments:
+                return
+            try:
+                pipeline = connection.pipeline(transaction=False)
+                for field, value in increments.items():
+                    if isinstance(value, float):
+                        pipeline.hincrbyfloat(METRICS_KEY, field, value)
+                    else:
+                        pipeline.hincrby(METRICS_KEY, field, value)
+                pipeline.execute()
+                self.flushed.update(increments)
+            except Exception as e:
+                logger.warning(f"Could not flush the cache metrics: {e}")
+
+    def fields(self) -> dict[str, float]:
+        """The metrics of the process as flat "kind|metric|namespace|label|field" counters."""
+        fields = {}
+        for namespace, counter in list(self.counters.items()):
+            for event, count in list(counter.items()):
+                fields[f"c|{namespace}|{event}"] = count
+        for (metric, namespace, label), histogram in list(self.histograms.items()):
+            prefix = f"h|{metric}|{namespace}|{label}"
+            for index, count in enumerate(histogram.counts):
+                fields[f"{prefix}|{index}"] = count
+            fields[f"{prefix}|sum"] = histogram.sum
+        return fields
+
+    def render(self) -> str:
+        """The metrics of all processes in the Prometheus text format (of this process without Redis)."""
+        from .local_cache import _redis_connection
+
+        self.flush()
+        connection = _redis_connection()
+        if connection is None:
+            fields = self.fields()
+        else:
+            fields = {field.decode(): float(value) for field, value in connection.hgetall(METRICS_KEY).items()}
+
+        requests, events = [], []
+        histograms: defaultdict[tuple[str, str, str], dict[str, float]] = defaultdict(dict)
+        for field, value in sorted(fields.items()):
+            kind, rest = field.split("|", 1)
+            if kind == "c":
+                namespace, event = rest.split("|")
+                if event in READS:
+                    labels = f'namespace="{namespace}",result="{READS[event]}"'
+                    requests.append(f"cache_requests_total{{{labels}}} {_number(value)}")
+                else:
+                    events.append(f'cache_events_total{{namespace="{namespace}",event="{event}"}} {_number(value)}')
+            else:
+                metric, namespace, label, bucket = rest.split("|")
+                histograms[(metric, namespace, label)][bucket] = value
+
+        lines = [
+            "# HELP cache_requests_total Cache reads by namespace and tier.",
+            "# TYPE cache_requests_total counter",
+            *requests,
+            "# HELP cache_events_total get_or_compute recomputes, lock contention and stale reads by namespace.",
+            "# TYPE cache_events_total counter",
+            *events,
+        ]
+        for metric, help_text, buckets, label_name in (
+            ("cache_operation_seconds", "Cache operation latency by namespace.", LATENCY_BUCKETS, "operation"),
+            ("cache_value_bytes", "Size of the written cache values by namespace.", SIZE_BUCKETS, None),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for (name, namespace, label), values in histograms.items():
+                if name != metric:
+                    continue
+                labels = f'namespace="{namespace}"' + (f',{label_name}="{label}"' if label_name else "")
+                cumulative = 0
+                for index, bound in enumerate((*buckets, "+Inf")):
+                    cumulative += values.get(str(index), 0)
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {_number(cumulative)}')
+                lines.append(f"{metric}_sum{{{labels}}} {_number(values.get('sum', 0))}")
+                lines.append(f"{metric}_count{{{labels}}} {_number(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """The counters and the hit ratios of every namespace read in this process."""
+        result = {}
+        for namespace, counter in self.counters.items():
+            l1_hits, l2_hits, misses = counter["l1_hits"], counter["l2_hits"], counter["misses"]
+            reads = l1_hits + l2_hits + misses
+            result[namespace] = {
+                **counter,
+                "l1_hits": l1_hits,
+                "l2_hits": l2_hits,
+                "misses": misses,
+                "l1_hit_ratio": l1_hits / reads if reads else 0.0,
+                "hit_ratio": (l1_hits + l2_hits) / reads if reads else 0.0,
+            }
+        return result
+
+    def reset(self):
+        """Forgets the metrics of this process, the ones already in Redis stay."""
+        self.counters.clear()
+        self.histograms.clear()
+        self.flushed.clear()
+        self._enabled = None
+        self._next_check = 0.0
+        self.next_flush = 0.0
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+cache_stats = CacheMetrics()
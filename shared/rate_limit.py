@@ -0,0 +1,152 @@
+import logging
+import math
+import time
+from functools import wraps
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .local_cache import _redis_connection
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+# KEYS[1]: the bucket, ARGV: tokens per second, capacity.
+# Returns {1, 0} if a token was taken, else {0, seconds until the next token} (as a string, numbers are truncated).
+TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+local allowed, retry_after = 0, (1 - tokens) / rate
+if tokens >= 1 then
+    allowed, retry_after, tokens = 1, 0, tokens - 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+def parse_rate(rate: str) -> float:
+    """Tokens per second of a "<count>/<s|m|h|d>" rate, e.g. "5/m"."""
+    count, period = rate.split("/")
+    return int(count) / PERIODS[period[0]]
+
+
+class RateLimiter:
+    """
+    Token buckets of the scopes in `settings.RATE_LIMITS`:
+
+        RATE_LIMITS = {"register": {"RATE": "5/m", "BURST": 10, "KEY": "ip"}}
+
+    Every scope has a bucket per key ("ip", "user" - the IP for anonymous
+    requests - or "global" for one bucket of the endpoint, e.g. of a provider
+    webhook) holding up to BURST tokens, refilled at RATE. A request takes a
+    token in one Lua script, so the check is atomic across all processes.
+    Without Redis the buckets are kept in the cache without the atomicity.
+    If the check fails the request is let through.
+    """
+
+    def __init__(self):
+        self.script = None
+
+    def check(self, scope: str, request: HttpRequest) -> float | None:
+        """
+        Takes a token of the bucket of the request.
+
+        Args:
+            scope: The scope in `settings.RATE_LIMITS`.
+            request: The Django or DRF request.
+
+        Returns:
+            None if the request is allowed, else the seconds until it would be.
+        """
+        options = getattr(settings, "RATE_LIMITS", {}).get(scope)
+        if options is None:
+            return None
+
+        rate = parse_rate(options["RATE"])
+        capacity = options.get("BURST", int(options["RATE"].split("/")[0]))
+        key = f"rate_limit:{scope}:{self.ident(request, options.get('KEY', 'ip'))}"
+        try:
+            connection = _redis_connection()
+            if connection is None:
+                return self._take_from_cache(key, rate, capacity)
+            if self.script is None:
+                self.script = connection.register_script(TOKEN_BUCKET)
+            allowed, retry_after = self.script(keys=[key], args=[rate, capacity], client=connection)
+        except Exception as e:
+            logger.warning(f"Could not check the rate limit of {scope}: {e}")
+            return None
+        return None if allowed else float(retry_after)
+
+    @staticmethod
+    def ident(request: HttpRequest, key: str) -> str:
+        if key == "global":
+            return "all"
+        user = getattr(request, "user", None)
+        if key == "user" and user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return BaseThrottle().get_ident(request)
+
+    @staticmethod
+    def _take_from_cache(key: str, rate: float, capacity: float) -> float | None:
+        now = time.time()
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+        retry_after = None if tokens >= 1 else (1 - tokens) / rate
+        cache.set(key, (tokens - 1 if retry_after is None else tokens, now), timeout=math.ceil(capacity / rate))
+        return retry_after
+
+
+rate_limiter = RateLimiter()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle of a `settings.RATE_LIMITS` scope, answered with 429 and Retry-After:
+
+        throttle_classes = [TokenBucketThrottle.scoped("register")]
+    """
+
+    scope: str = ""
+
+    @classmethod
+    def scoped(cls, scope: str) -> type["TokenBucketThrottle"]:
+        return type(f"{cls.__name__}({scope})", (cls,), {"scope": scope})
+
+    def allow_request(self, request, view) -> bool:
+        self.retry_after = rate_limiter.check(self.scope, request)
+        return self.retry_after is None
+
+    def wait(self) -> float | None:
+        return self.retry_after
+
+
+def rate_limit(scope: str):
+    """Rate limits a plain Django view like `TokenBucketThrottle` limits the DRF ones."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args: Any, **kwargs: Any):
+            retry_after = rate_limiter.check(scope, request)
+            if retry_after is not None:
+                response = JsonResponse({"error": "Too many requests."}, status=429)
+                response["Retry-After"] = str(math.ceil(retry_after))
+                return response
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,33 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - DRF renders with the stdlib json then
+    orjson = None
+
+# dates, times, UUIDs, dataclasses and enums (`OrderStatus`) are native to orjson,
+# the rest (Decimal, lazy strings, querysets...) is converted like DRF does
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z) if orjson is not None else 0
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson, the output matches the DRF one.
+
+    Requests for an indented response (e.g. `Accept: application/json; indent=4`
+    of the browsable API) are rendered by DRF, orjson only indents by 2.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # like DRF, escape the line separators that are valid JSON but not valid JavaScript
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return content
@@ -0,0 +1,131 @@
+import logging
+
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+
+class StreamService:
+    """
+    A Redis Stream consumed by a consumer group.
+
+    Producers append events with `publish`, consumers read them in batches with
+    `read` and acknowledge them with `ack` once they are processed. Events of a
+    crashed consumer stay pending and are taken over with `claim_pending`.
+    Events delivered more than `max_deliveries` times (they fail every time)
+    are moved to the `<stream>:dead` stream instead of being retried forever.
+    """
+
+    def __init__(self, stream: str, group: str, maxlen: int = 100_000, max_deliveries: int = 5):
+        """
+        Args:
+            stream: The stream key.
+            group: The consumer group name.
+            maxlen: The approximate number of events kept in the stream.
+            max_deliveries: The deliveries of an event before it is dead-lettered.
+        """
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+        self.max_deliveries = max_deliveries
+        self.dead_letter_stream = f"{stream}:dead"
+        self.connection = get_redis_connection("default")
+
+    def publish(self, event: dict[str, str]) -> str:
+        """
+        Appends an event to the stream.
+
+        Args:
+            event: Flat mapping of string fields.
+
+        Returns:
+            The id of the event in the stream.
+        """
+        event_id = self.connection.xadd(self.stream, event, maxlen=self.maxlen, approximate=True)
+        return event_id.decode()
+
+    def ensure_group(self):
+        """Creates the stream and the consumer group if they do not exist yet."""
+        try:
+            self.connection.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict[str, str]]]:
+        """
+        Reads a batch of new events for the consumer.
+
+        Args:
+            consumer: The consumer name inside the group.
+            count: The maximum number of events in the batch.
+            block_ms: How long to wait for new events.
+
+        Returns:
+            The events as (event id, fields) pairs.
+        """
+        response = self.connection.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=block_ms
+        )
+        if not response:
+            return []
+
+        _, events = response[0]
+        return [self._decode(event_id, fields) for event_id, fields in events]
+
+    def claim_pending(self, consumer: str, min_idle_ms: int, count: int) -> list[tuple[str, dict[str, str]]]:
+        """
+        Takes over events that were read but not acknowledged for `min_idle_ms`.
+
+        Args:
+            consumer: The consumer name that takes the events over.
+            min_idle_ms: The minimum time since the event was delivered.
+            count: The maximum number of events in the batch.
+
+        Returns:
+            The events as (event id, fields) pairs.
+        """
+        _, events, *_ = self.connection.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        # entries deleted from the stream come back as None
+        events = [self._decode(event_id, fields) for event_id, fields in events if fields]
+        if not events:
+            return []
+
+        pending = self.connection.xpending_range(
+            self.stream, self.group, min=events[0][0], max=events[-1][0], count=len(events), consumername=consumer
+        )
+        deliveries = {entry["message_id"].decode(): entry["times_delivered"] for entry in pending}
+        dead = [(event_id, event) for event_id, event in events if deliveries.get(event_id, 0) > self.max_deliveries]
+        if dead:
+            self.dead_letter(dead)
+            dead_ids = {event_id for event_id, _ in dead}
+            events = [(event_id, event) for event_id, event in events if event_id not in dead_ids]
+        return events
+
+    def dead_letter(self, events: list[tuple[str, dict[str, str]]]):
+        """Moves events that keep failing to the dead letter stream, with their original id, and acknowledges them."""
+        logger.error(f"Moving {len(events)} events of {self.stream} to {self.dead_letter_stream}: {events}")
+        pipeline = self.connection.pipeline()
+        for event_id, event in events:
+            pipeline.xadd(
+                self.dead_letter_stream, {**event, "event_id": event_id}, maxlen=self.maxlen, approximate=True
+            )
+        pipeline.execute()
+        self.ack([event_id for event_id, _ in events])
+
+    def ack(self, event_ids: list[str]):
+        """Acknowledges processed events and removes them from the stream."""
+        if not event_ids:
+            return
+
+        pipeline = self.connection.pipeline()
+        pipeline.xack(self.stream, self.group, *event_ids)
+        pipeline.xdel(self.stream, *event_ids)
+        pipeline.execute()
+
+    @staticmethod
+    def _decode(event_id: bytes, fields: dict[bytes, bytes]) -> tuple[str, dict[str, str]]:
+        return event_id.decode(), {key.decode(): value.decode() for key, value in fields.items()}
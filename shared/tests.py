@@ -0,0 +1,404 @@
+import datetime
+import io
+import time
+from decimal import Decimal
+from unittest import mock
+
+import fakeredis
+import httpx
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from catering.enums import OrderStatus
+from providers import kfc
+
+from .cache import CacheService, Computed, cache_stats
+from .codecs import COMPRESSED, JSONCodec
+from .http import ProviderTransport, transport
+from .local_cache import INVALIDATION_CHANNEL, MISSING, LocalCache, local_caches
+from .metrics import ENABLED_KEY, CacheMetrics
+from .parsers import ORJSONParser
+from .rate_limit import rate_limiter
+from .renderers import ORJSONRenderer
+from .streams import StreamService
+
+REDIS_CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://localhost:6379/0",
+        "OPTIONS": {"CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeConnection}},
+        "TIMEOUT": None,
+    }
+}
+
+
+@override_settings(CACHE_NAMESPACES={"menu": {"L1": {"MAX_SIZE": 2, "TTL": 60}}})
+class CacheServiceTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.cache = CacheService()
+
+    def test_batch_operations(self):
+        self.cache.set_many("dishes", {"1": {"status": "cooking"}, "2": {"status": "cooked"}})
+        self.cache.set("other", "1", "not an order")
+
+        self.assertEqual(
+            self.cache.get_many("dishes", ["1", "2", "3"]), {"1": {"status": "cooking"}, "2": {"status": "cooked"}}
+        )
+
+        self.cache.delete_many("dishes", ["1", "3"])
+        self.assertEqual(self.cache.get_many("dishes", ["1", "2"]), {"2": {"status": "cooked"}})
+        self.assertEqual(self.cache.get("other", "1"), "not an order")
+
+    def test_pipeline(self):
+        self.cache.set("dishes", "1", {"status": "cooking"})
+
+        with self.cache.pipeline() as pipeline:
+            pipeline.get("dishes", "1")
+            pipeline.get_many("webhooks_seen", ["kfc:1:cooked", "kfc:1:completed"])
+            pipeline.add("webhooks_seen", "kfc:1:cooking", 1, timeout=60)
+            pipeline.add("webhooks_seen", "kfc:1:cooking", 1, timeout=60)
+            pipeline.set_many("dishes", {"2": {"status": "cooked"}})
+            pipeline.delete("dishes", "1")
+            pipeline.delete_many("dishes", [])
+
+        self.assertEqual(pipeline.results, [{"status": "cooking"}, {}, True, False, None, None, None])
+        self.assertEqual(self.cache.get_many("dishes", ["1", "2"]), {"2": {"status": "cooked"}})
+
+    def test_l1_serves_reads_until_a_write(self):
+        self.cache.set("menu", "restaurants", ["Silpo"])
+        self.cache.get("menu", "restaurants")
+        self.cache.get("menu", "missing")
+
+        cache.set("menu:restaurants", ["changed in Redis"])
+        self.assertEqual(self.cache.get("menu", "restaurants"), ["Silpo"])
+        self.assertEqual(self.cache.get_many("menu", ["restaurants", "other"]), {"restaurants": ["Silpo"]})
+
+        self.cache.set("menu", "restaurants", ["Silpo", "KFC"])
+        self.assertEqual(self.cache.get("menu", "restaurants"), ["Silpo", "KFC"])
+
+        self.assertEqual(
+            self.cache.stats()["menu"],
+            {"l1_hits": 2, "l2_hits": 2, "misses": 2, "l1_hit_ratio": 1 / 3, "hit_ratio": 2 / 3},
+        )
+
+    def test_get_or_compute_recomputes_once(self):
+        compute = mock.Mock(return_value=["Silpo"])
+
+        self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60), ["Silpo"])
+        self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60), ["Silpo"])
+
+        compute.assert_called_once()
+        self.assertTrue(self.cache.add("locks", "dishes:menu", 1), "the lock is released")
+
+    def test_get_or_compute_serves_stale_value_while_locked(self):
+        compute = mock.Mock(return_value="new")
+        self.cache.set("dishes", "menu", Computed("stale", delta=0.1, expires_at=time.time() - 1))
+        self.cache.add("locks", "dishes:menu", 1)
+
+        self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60), "stale")
+
+        compute.assert_not_called()
+        self.assertEqual(self.cache.stats()["dishes"]["stale_served"], 1)
+
+    def test_get_or_compute_waits_for_the_lock_holder(self):
+        self.cache.add("locks", "dishes:menu", 1)
+        compute = mock.Mock(return_value="computed by this caller")
+
+        with mock.patch("shared.cache.time.sleep", lambda _: self.cache.set("dishes", "menu", Computed("new", 0, 0))):
+            self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60), "new")
+        compute.assert_not_called()
+
+        self.cache.delete("dishes", "menu")
+        self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60, wait=0), compute.return_value)
+        self.assertEqual(self.cache.stats()["dishes"]["lock_timeouts"], 1)
+
+    def test_get_or_compute_refreshes_slow_values_early(self):
+        compute = mock.Mock(return_value="new")
+        self.cache.set("dishes", "menu", Computed("old", delta=60, expires_at=time.time() + 1))
+
+        with mock.patch("shared.cache.random.random", return_value=0.5):
+            self.assertEqual(self.cache.get_or_compute("dishes", "menu", compute, timeout=60), "new")
+        self.assertEqual(self.cache.stats()["dishes"]["early_refreshes"], 1)
+
+    def test_l1_is_bounded(self):
+        local_cache = LocalCache(max_size=2, ttl=60)
+        for key in ("1", "2", "3"):
+            local_cache.set(key, key)
+        local_cache.set("4", "4", timeout=0)
+
+        self.assertEqual(local_cache.get("1"), MISSING)
+        self.assertEqual(local_cache.get("3"), "3")
+        self.assertEqual(local_cache.get("4"), MISSING)
+
+
+class JSONCodecTest(SimpleTestCase):
+    def test_large_payloads_are_compressed(self):
+        codec = JSONCodec(compress_threshold=100)
+        small, large = {"status": "cooked"}, {"items": [{"id": 1, "quantity": 2}] * 50}
+
+        self.assertEqual(codec.encode(small)[:2], bytes((1, 0)))
+        self.assertEqual(codec.encode(large)[1], COMPRESSED)
+        self.assertEqual(codec.decode(codec.encode(small)), small)
+        self.assertEqual(codec.decode(codec.encode(large)), large)
+
+    def test_other_schema_versions_are_misses(self):
+        self.assertIsNone(JSONCodec(version=2).decode(JSONCodec(version=1).encode({"status": "cooked"})))
+
+    @override_settings(CACHE_NAMESPACES={"dishes": {"CODEC": "shared.tests.codec"}})
+    def test_namespace_codec(self):
+        CacheService().set("dishes", "1", {"name": "Salad"})
+
+        self.assertIsInstance(cache.get("dishes:1"), bytes)
+        self.assertEqual(CacheService().get("dishes", "1"), {"name": "Salad"})
+        with CacheService().pipeline() as pipeline:
+            pipeline.get("dishes", "1")
+            pipeline.get_many("dishes", ["1"])
+        self.assertEqual(pipeline.results, [{"name": "Salad"}, {"1": {"name": "Salad"}}])
+
+
+codec = JSONCodec()
+
+
+class ORJSONTest(SimpleTestCase):
+    data = {
+        "status": OrderStatus.COOKING,
+        "eta": datetime.date(2025, 7, 10),
+        "created_at": datetime.datetime(2025, 7, 10, 12, 30, 15, 120000, tzinfo=datetime.timezone.utc),
+        "total": Decimal("12.50"),
+        "error": gettext_lazy("Invalid webhook data."),
+        "items": [{"id": 1, "name": "Борщ\u2028"}],
+        1: None,
+    }
+
+    def test_renders_like_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_indented_responses_are_rendered_by_drf(self):
+        content = ORJSONRenderer().render(self.data, "application/json; indent=4")
+        self.assertEqual(content, JSONRenderer().render(self.data, "application/json; indent=4"))
+
+    def test_parses_like_drf(self):
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body), parser_context={})
+        )
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b"{"))
+
+
+class ProviderTransportTest(SimpleTestCase):
+    @mock.patch("shared.http.HTTP2_AVAILABLE", False)
+    def test_http2_without_h2_falls_back_with_a_warning(self):
+        with override_settings(KFC_PROVIDER_URL="http://kfc:8001?http2=true"):
+            with self.assertLogs("shared.http", "WARNING"):
+                self.assertFalse(ProviderTransport().options("kfc")["http2"])
+
+
+class BulkLookupTest(SimpleTestCase):
+    orders = {"kfc-1": "cooking", "kfc-2": "cooked", "kfc-3": "completed"}
+
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+        self.bulk_status = 200
+        transport._clients["kfc"] = httpx.Client(base_url="http://kfc", transport=httpx.MockTransport(self.handle))
+        self.addCleanup(transport.reset)
+        self.addCleanup(setattr, kfc.Client, "_bulk_disabled_until", 0.0)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/api/orders":
+            if self.bulk_status != 200:
+                return httpx.Response(self.bulk_status)
+            ids = request.url.params["ids"].split(",")
+            return httpx.Response(200, json=[{"id": i, "status": self.orders[i]} for i in ids if i in self.orders])
+
+        order_id = request.url.path.rsplit("/", 1)[1]
+        if order_id not in self.orders:
+            return httpx.Response(404)
+        return httpx.Response(200, json={"id": order_id, "status": self.orders[order_id]})
+
+    @mock.patch.object(kfc.Client, "BULK_SIZE", 2)
+    def test_bulk_requests_are_chunked(self):
+        orders = kfc.Client.get_orders(["kfc-1", "kfc-2", "kfc-3", "unknown"])
+
+        self.assertEqual(orders["kfc-2"], kfc.OrderResponse("kfc-2", "cooked"))
+        self.assertEqual(list(orders), ["kfc-1", "kfc-2", "kfc-3"])
+        self.assertEqual(len(self.requests), 2)
+
+    def test_single_gets_without_the_bulk_api(self):
+        self.bulk_status = 404
+        expected = {"kfc-1": kfc.OrderResponse("kfc-1", "cooking")}
+        self.assertEqual(kfc.Client.get_orders(["kfc-1", "unknown"]), expected)
+        self.assertEqual(len(self.requests), 3)
+
+        # the bulk API is not asked again until the cooldown is over
+        self.requests.clear()
+        self.assertEqual(kfc.Client.get_orders(["kfc-1"]), expected)
+        self.assertEqual(len(self.requests), 1)
+
+        self.bulk_status = 200
+        kfc.Client._bulk_disabled_until = 0.0
+        self.requests.clear()
+        self.assertEqual(kfc.Client.get_orders(["kfc-1"]), expected)
+        self.assertEqual([request.url.path for request in self.requests], ["/api/orders"])
+
+
+class StreamServiceTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch("shared.streams.get_redis_connection", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stream = StreamService("webhooks:test", "test", max_deliveries=2)
+        self.stream.ensure_group()
+
+    def test_failing_event_is_dead_lettered(self):
+        event_id = self.stream.publish({"id": "kfc-1", "status": "cooked"})
+        self.assertEqual(
+            self.stream.read("worker", count=10, block_ms=0), [(event_id, {"id": "kfc-1", "status": "cooked"})]
+        )
+
+        # the event fails and is taken over again until it was delivered `max_deliveries` times
+        self.assertEqual(len(self.stream.claim_pending("worker", min_idle_ms=0, count=10)), 1)
+        self.assertEqual(self.stream.claim_pending("worker", min_idle_ms=0, count=10), [])
+
+        self.assertEqual(self.redis.xpending("webhooks:test", "test")["pending"], 0)
+        [(_, dead)] = self.redis.xrange("webhooks:test:dead")
+        self.assertEqual(dead[b"event_id"], event_id.encode())
+
+
+class CacheMetricsTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint(self):
+        CacheService().set("dishes", "1", b"x" * 100)
+        CacheService().get("dishes", "1")
+        CacheService().get("dishes", "2")
+
+        self.assertEqual(self.client.get(reverse("cache-metrics")).status_code, 401)
+        response = self.client.get(reverse("cache-metrics"), headers={"Authorization": "Bearer secret"})
+
+        metrics = response.content.decode()
+        self.assertIn('cache_requests_total{namespace="dishes",result="l2_hit"} 1', metrics)
+        self.assertIn('cache_requests_total{namespace="dishes",result="miss"} 1', metrics)
+        self.assertIn('cache_operation_seconds_count{namespace="dishes",operation="get"} 2', metrics)
+        self.assertIn('cache_value_bytes_bucket{namespace="dishes",le="256"} 1', metrics)
+
+    def test_metrics_are_switched_off_at_runtime(self):
+        cache_stats.set_enabled(False)
+        CacheService().get("dishes", "1")
+        self.assertEqual(CacheService.stats(), {})
+
+        cache_stats.set_enabled(True)
+        CacheService().get("dishes", "1")
+        self.assertEqual(CacheService.stats()["dishes"]["misses"], 1)
+
+    @override_settings(CACHE_METRICS={"FLUSH_INTERVAL": 0})
+    def test_switch_is_re_read_while_metrics_are_off(self):
+        # the switch set by `manage.py cache_metrics` in another process
+        cache.set(ENABLED_KEY, False)
+        CacheService().get("dishes", "1")
+        self.assertEqual(CacheService.stats(), {})
+
+        cache.set(ENABLED_KEY, True)
+        CacheService().get("dishes", "1")
+        self.assertEqual(CacheService.stats()["dishes"]["misses"], 1)
+
+
+@override_settings(RATE_LIMITS={"kfc_webhook": {"RATE": "1/s", "BURST": 2, "KEY": "ip"}})
+class RateLimiterTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_429(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse("kfc-webhook")).status_code, 400)
+
+        response = self.client.post(reverse("kfc-webhook"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        # another client has its own bucket
+        self.assertEqual(self.client.post(reverse("kfc-webhook"), REMOTE_ADDR="10.0.0.2").status_code, 400)
+
+    def test_tokens_are_refilled(self):
+        request = RequestFactory().post("/")
+        for _ in range(2):
+            self.assertIsNone(rate_limiter.check("kfc_webhook", request))
+        retry_after = rate_limiter.check("kfc_webhook", request)
+        self.assertTrue(0 < retry_after <= 1)
+
+        time.sleep(retry_after)
+        self.assertIsNone(rate_limiter.check("kfc_webhook", request))
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        for address in ("10.0.0.3", "10.0.0.4"):
+            self.client.post(reverse("kfc-webhook"), HTTP_X_FORWARDED_FOR=address)
+
+        response = self.client.post(reverse("kfc-webhook"), HTTP_X_FORWARDED_FOR="10.0.0.5")
+        self.assertEqual(response.status_code, 429)
+
+    def test_viewset_webhook_is_limited(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse("food-kfc-webhook")).status_code, 400)
+        self.assertEqual(self.client.post(reverse("food-kfc-webhook")).status_code, 429)
+
+    def test_unknown_scope_is_not_limited(self):
+        self.assertIsNone(rate_limiter.check("other", RequestFactory().post("/")))
+
+
+@override_settings(CACHES=REDIS_CACHES)
+class RedisRateLimiterTest(RateLimiterTest):
+    pass
+
+
+@override_settings(CACHES=REDIS_CACHES)
+class RedisCacheServiceTest(CacheServiceTest):
+    def test_pipeline_is_one_round_trip(self):
+        redis = cache.client.get_client()
+        # the metrics are not flushed and the switch is not read during the pipeline
+        cache_stats.tick()
+        self.assertTrue(cache_stats.enabled)
+
+        with mock.patch.object(type(redis), "execute_command") as execute_command:
+            with self.cache.pipeline() as pipeline:
+                pipeline.get_many("webhooks_seen", ["kfc:1:cooked"])
+                pipeline.add("webhooks_seen", "kfc:1:cooking", 1, timeout=60)
+
+        execute_command.assert_not_called()
+        self.assertEqual(pipeline.results, [{}, True])
+        self.assertTrue(0 < redis.pttl(cache.make_key("webhooks_seen:kfc:1:cooking")) <= 60_000)
+
+    def test_metrics_of_all_processes_are_added_up(self):
+        other_process = CacheMetrics()
+        other_process.record("dishes", "misses", 2)
+        other_process.flush()
+        CacheService().get("dishes", "1")
+
+        self.assertIn('cache_requests_total{namespace="dishes",result="miss"} 3', cache_stats.render())
+        other_process.flush()
+        self.assertIn('cache_requests_total{namespace="dishes",result="miss"} 3', cache_stats.render())
+
+    def test_writes_invalidate_l1_of_other_processes(self):
+        subscriber = cache.client.get_client().pubsub(ignore_subscribe_messages=True)
+        subscriber.subscribe(INVALIDATION_CHANNEL)
+        subscriber.get_message(timeout=1)  # the subscription
+        self.cache.set("menu", "restaurants", ["Silpo"])
+        self.cache.get("menu", "restaurants")
+
+        message = subscriber.get_message(timeout=1)
+        local_caches.handle(message["data"])
+        self.assertEqual(local_caches.get("menu").get("restaurants"), ["Silpo"])
+
+        local_caches.handle(message["data"].replace(local_caches.origin.encode(), b"other process"))
+        self.assertEqual(local_caches.get("menu").get("restaurants"), MISSING)
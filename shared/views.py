@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import cache_stats
+
+
+def cache_metrics(request: HttpRequest) -> HttpResponse:
+    """
+    The cache metrics of all processes for Prometheus.
+
+    When `settings.METRICS_TOKEN` is set, the scraper must send it as
+    `Authorization: Bearer <token>`.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+
+    return HttpResponse(cache_stats.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
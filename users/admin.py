@@ -1,8 +1,35 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
-from .models import User
+from .logins import LastLogins
+from .models import Email, User
+
+
+class UserChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        LastLogins().apply(list(self.result_list))
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    readonly_fields = ("id", "password", "last_login")
\ No newline at end of file
+    list_display = ("email", "first_name", "last_name", "role", "is_active", "last_login")
+    readonly_fields = ("id", "password", "last_login")
+
+    # the logins not flushed to the table yet are read from Redis (users.logins)
+    def get_changelist(self, request, **kwargs):
+        return UserChangeList
+
+    def get_object(self, request, object_id, from_field=None):
+        user = super().get_object(request, object_id, from_field)
+        if user is not None:
+            LastLogins().apply([user])
+        return user
+
+
+@admin.register(Email)
+class EmailAdmin(admin.ModelAdmin):
+    list_display = ("to", "subject", "created_at", "sent_at", "attempts")
+    list_filter = ("sent_at",)
+    search_fields = ("to",)
+    readonly_fields = ("created_at", "sent_at", "attempts", "next_attempt_at", "error")
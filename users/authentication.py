@@ -0,0 +1,84 @@
+from typing import Iterable
+
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from shared.cache import CacheService
+
+from .models import User
+
+# what the API reads of the authenticated user, the other fields are loaded on access
+USER_FIELDS = ("id", "email", "phone", "first_name", "last_name", "role", "is_active", "is_staff", "is_superuser")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` resolving the user from the "auth_users" cache namespace
+    instead of a users query on every request.
+
+    The cache holds `USER_FIELDS` and the hash of the password, which is
+    always compared with the version in the token, so a token issued before a
+    password change is rejected. The tokens carry it with
+    `SIMPLE_JWT["CHECK_REVOKE_TOKEN"]`, tokens without it are rejected. The
+    entry is dropped on every save and delete of the user (`users.signals`),
+    so role changes, deactivation and password changes apply to the next
+    request.
+    Updates bypassing the signals (`QuerySet.update()`) apply after the TTL.
+    """
+
+    def get_user(self, validated_token) -> User:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cached = get_cached_user(user_id)
+        if cached is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        # from_db() takes the values in the order of the model fields
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in USER_FIELDS]
+        user = User.from_db(DEFAULT_DB_ALIAS, fields, [cached[field] for field in fields])
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != cached["password_version"]:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+def get_cached_user(user_id) -> dict | None:
+    """
+    Returns the fields of the user the API authenticates with, from the cache or the database.
+
+    Args:
+        user_id: The value of `SIMPLE_JWT["USER_ID_FIELD"]` of the user.
+
+    Returns:
+        `USER_FIELDS` and "password_version" of the user, None if there is no such user.
+    """
+    cache = CacheService()
+    cached = cache.get("auth_users", str(user_id))
+    if cached is not None:
+        return cached
+
+    user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*USER_FIELDS, "password").first()
+    if user is None:
+        return None
+    user["password_version"] = get_md5_hash_password(user.pop("password"))
+    cache.set("auth_users", str(user_id), user)
+    return user
+
+
+def invalidate_cached_user(user: User):
+    invalidate_cached_users([user])
+
+
+def invalidate_cached_users(users: Iterable[User]):
+    """Drops the cached users, for the bulk writes which send no `post_save`."""
+    CacheService().delete_many("auth_users", [str(getattr(user, api_settings.USER_ID_FIELD)) for user in users])
@@ -0,0 +1,105 @@
+import logging
+from datetime import datetime, timezone
+
+from django.db import connection as db_connection
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class LastLogins:
+    """
+    Deferred writes of `User.last_login`.
+
+    Logins are recorded in a Redis hash (`last_logins`, user id -> timestamp)
+    instead of an UPDATE per issued token, `flush` writes them to the users
+    table in batches. While a flush runs the logins are moved to
+    `last_logins:flushing`, so the ones recorded meanwhile are not lost, and a
+    failed flush is finished by the next one.
+    """
+
+    PENDING_KEY = "last_logins"
+    FLUSHING_KEY = "last_logins:flushing"
+
+    def __init__(self):
+        self.connection = get_redis_connection("default")
+
+    def record(self, user: User, at: datetime):
+        user.last_login = at
+        self.connection.hset(self.PENDING_KEY, str(user.pk), at.timestamp())
+
+    def pending(self, user_ids: list[int]) -> dict[int, datetime]:
+        """Returns the logins of the users not written to the table yet, users without one are left out."""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+
+        pipeline = self.connection.pipeline(transaction=False)
+        pipeline.hmget(self.FLUSHING_KEY, user_ids)
+        pipeline.hmget(self.PENDING_KEY, user_ids)
+        result = {}
+        for values in pipeline.execute():
+            for user_id, value in zip(user_ids, values):
+                if value is not None:
+                    at = datetime.fromtimestamp(float(value), tz=timezone.utc)
+                    result[user_id] = max(at, result.get(user_id, at))
+        return result
+
+    def apply(self, users: list[User]):
+        """Sets the pending `last_login` of the users loaded from the table."""
+        pending = self.pending([user.pk for user in users])
+        for user in users:
+            if user.pk in pending:
+                user.last_login = pending[user.pk]
+
+    def flush(self, batch_size: int = 1000) -> int:
+        """
+        Writes the recorded logins to the users table.
+
+        Args:
+            batch_size: How many users are updated by one statement.
+
+        Returns:
+            The number of users written.
+        """
+        # a flush that failed before deleting the hash is finished first
+        if not self.connection.exists(self.FLUSHING_KEY):
+            try:
+                self.connection.renamenx(self.PENDING_KEY, self.FLUSHING_KEY)
+            except ResponseError:  # no logins were recorded
+                return 0
+
+        logins = [
+            (int(user_id), datetime.fromtimestamp(float(value), tz=timezone.utc))
+            for user_id, value in self.connection.hgetall(self.FLUSHING_KEY).items()
+        ]
+        for start in range(0, len(logins), batch_size):
+            update_last_logins(logins[start:start + batch_size])
+        self.connection.delete(self.FLUSHING_KEY)
+        logger.info(f"Flushed the last logins of {len(logins)} users")
+        return len(logins)
+
+
+def update_last_logins(logins: list[tuple[int, datetime]]):
+    """Sets `last_login` of many users with one statement, a login never replaces a later one."""
+    if not logins:
+        return
+
+    if db_connection.vendor != "postgresql":
+        users = [User(pk=user_id, last_login=at) for user_id, at in logins]
+        User.objects.bulk_update(users, ["last_login"])
+        return
+
+    table = db_connection.ops.quote_name(User._meta.db_table)
+    values = ", ".join(["(%s::bigint, %s::timestamptz)"] * len(logins))
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET last_login = logins.last_login "
+            f"FROM (VALUES {values}) AS logins (id, last_login) "
+            f"WHERE {table}.id = logins.id "
+            f"AND ({table}.last_login IS NULL OR {table}.last_login < logins.last_login)",
+            [value for login in logins for value in login],
+        )
@@ -0,0 +1,138 @@
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from users.authentication import invalidate_cached_users
+from users.models import Role, User
+
+COLUMNS = ("email", "password", "first_name", "last_name", "phone")
+UPDATE_FIELDS = ["password", "first_name", "last_name", "phone"]
+
+
+def setup_worker(settings_module: str):
+    """Configures Django in the hashing processes started without fork."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users from a CSV file with the columns email,password,first_name,last_name,phone. "
+        "Passwords are hashed in parallel processes, users are inserted in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='The CSV file, "-" for stdin')
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Password hashing processes")
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Update the password, the name and the phone of existing users instead of skipping them",
+        )
+
+    def handle(self, *args, **options):
+        self.update = options["update"]
+        self.created = self.updated = self.skipped = self.invalid = 0
+        self.seen: set[str] = set()
+        batch_size, workers = options["batch_size"], options["workers"]
+
+        started = perf_counter()
+        file = sys.stdin if options["path"] == "-" else open(options["path"], newline="", encoding="utf-8")
+        with file, ProcessPoolExecutor(
+            max_workers=workers, initializer=setup_worker, initargs=(os.environ["DJANGO_SETTINGS_MODULE"],)
+        ) as pool:
+            reader = csv.DictReader(file)
+            missing = {"email", "password"} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"The CSV has no {', '.join(sorted(missing))} column")
+
+            # the next batch is hashed while the previous one is inserted
+            previous = None
+            while rows := list(islice(reader, batch_size)):
+                users = self.build(rows, reader.line_num - len(rows) + 1)
+                passwords = [user.password for user in users]
+                hashes = pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+                if previous:
+                    self.insert(*previous, started)
+                previous = users, hashes
+            if previous:
+                self.insert(*previous, started)
+
+        elapsed = perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {self.created} and updated {self.updated} users, skipped {self.skipped} existing "
+                f"and {self.invalid} invalid rows in {elapsed:.2f}s "
+                f"({(self.created + self.updated) / elapsed:.0f} users/s)"
+            )
+        )
+
+    def build(self, rows: list[dict[str, str]], first_line: int) -> list[User]:
+        """The users of the rows with a valid email and password, not in the table yet unless updating."""
+        users = []
+        for line, row in enumerate(rows, start=first_line):
+            email = User.objects.normalize_email((row.get("email") or "").strip())
+            try:
+                validate_email(email)
+            except ValidationError:
+                self.stderr.write(f"Line {line}: invalid email {email!r}")
+                self.invalid += 1
+                continue
+            if not row.get("password"):
+                self.stderr.write(f"Line {line}: no password for {email}")
+                self.invalid += 1
+                continue
+            if email in self.seen:
+                self.stderr.write(f"Line {line}: {email} is repeated")
+                self.invalid += 1
+                continue
+
+            self.seen.add(email)
+            users.append(
+                User(
+                    email=email,
+                    password=row["password"],
+                    first_name=row.get("first_name") or "",
+                    last_name=row.get("last_name") or "",
+                    phone=row.get("phone") or "",
+                    role=Role.CUSTOMER,
+                )
+            )
+
+        if not self.update:
+            # skipped before hashing, the hash costs more than the insert
+            emails = [user.email for user in users]
+            existing = set(User.objects.filter(email__in=emails).values_list("email", flat=True))
+            self.skipped += len(existing)
+            users = [user for user in users if user.email not in existing]
+        return users
+
+    def insert(self, users: list[User], hashes, started: float):
+        for user, password in zip(users, hashes):
+            user.password = password
+
+        # the users created since build() are updated or skipped, not counted as created
+        existing = list(User.objects.filter(email__in=[user.email for user in users]).only("email"))
+        if self.update:
+            User.objects.bulk_create(users, update_conflicts=True, unique_fields=["email"], update_fields=UPDATE_FIELDS)
+            # the bulk update sends no post_save to drop the users cached for the authentication
+            invalidate_cached_users(existing)
+            self.updated += len(existing)
+        else:
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            self.skipped += len(existing)
+        self.created += len(users) - len(existing)
+
+        elapsed = perf_counter() - started
+        done = self.created + self.updated
+        self.stdout.write(f"{done} users in {elapsed:.2f}s ({done / elapsed:.0f} users/s)")
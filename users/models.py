@@ -1,5 +1,6 @@
 from enum import StrEnum, auto
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
@@ -75,4 +76,30 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     EMAIL_FIELD = "email"
     USERNAME_FIELD = "email"
-    REQUIRED_FIELDS = []
\ No newline at end of file
+    REQUIRED_FIELDS = []
+
+
+class Email(models.Model):
+    """An outgoing email, sent by `users.tasks.send_emails` after the transaction that queued it is committed."""
+
+    class Meta:
+        db_table = "emails"
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"], condition=models.Q(sent_at__isnull=True), name="emails_pending_idx"
+            ),
+        ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    to = models.EmailField(max_length=100)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # failed attempts, the email is retried with a backoff until settings.EMAIL_OUTBOX["MAX_ATTEMPTS"]
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.to}: {self.subject}"
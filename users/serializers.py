@@ -1,4 +1,8 @@
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+
+from .logins import LastLogins
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,4 +17,13 @@ class UserSerializer(serializers.ModelSerializer):
         if password is not None:
             instance.set_password(password)
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """Records the login for a deferred write (`logins.LastLogins`) instead of updating `last_login` in the request."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        LastLogins().record(self.user, timezone.now())
+        return data
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance: User, **kwargs):
+    """Drops the user cached for the authentication (`authentication.CachedJWTAuthentication`)."""
+    invalidate_cached_user(instance)
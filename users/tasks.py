@@ -1,17 +1,92 @@
+import logging
+import smtplib
+from datetime import timedelta
 
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
 
-@shared_task(queue='low_priority')
-def send_activation_email(subject, message, recipient_list):
+from .logins import LastLogins
+from .models import Email
+
+logger = logging.getLogger(__name__)
+
+# rejected by the server for this email only, the others are sent over the same connection
+EMAIL_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+@shared_task(queue="low_priority", autoretry_for=(smtplib.SMTPException, OSError), retry_backoff=True, max_retries=5)
+def send_emails(batch_size: int | None = None):
     """
-    Celery task to send an email asynchronously.
+    Sends the queued emails of the outbox over one SMTP connection.
+
+    Emails are sent in batches of `batch_size`. A batch is claimed in a short
+    transaction by moving its `next_attempt_at` `LEASE` seconds ahead, so
+    concurrent runs send different emails and no row is locked during the
+    SMTP round-trips. The results are saved in a second transaction. A batch
+    of a worker that died while sending it is sent again after the lease.
+
+    A rejected email is retried after `RETRY_DELAY * 2 ** (attempts - 1)`
+    seconds up to `MAX_ATTEMPTS` times, if the connection is lost the task
+    itself is retried with a backoff.
     """
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=recipient_list,
-        fail_silently=False,
-    )
+    batch_size = batch_size or settings.EMAIL_OUTBOX["BATCH_SIZE"]
+
+    with get_connection(fail_silently=False) as connection:
+        while True:
+            emails = _claim_batch(batch_size)
+            if not emails:
+                return
+
+            now = timezone.now()
+            sent, error = _send_batch(connection, emails, now)
+            with transaction.atomic():
+                Email.objects.bulk_update(emails[:sent], ["sent_at", "attempts", "next_attempt_at", "error"])
+                # the rest are released for the retry
+                Email.objects.filter(pk__in=[email.pk for email in emails[sent:]]).update(next_attempt_at=now)
+            logger.info(f"Sent {sent} of {len(emails)} queued emails")
+            if error is not None:
+                raise error
+
+
+def _claim_batch(batch_size: int) -> list[Email]:
+    """Leases the next due emails to this run, the rows are locked only while they are claimed."""
+    options = settings.EMAIL_OUTBOX
+    with transaction.atomic():
+        now = timezone.now()
+        emails = list(
+            Email.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, next_attempt_at__lte=now, attempts__lt=options["MAX_ATTEMPTS"])
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        Email.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=options["LEASE"])
+        )
+    return emails
+
+
+def _send_batch(connection, emails: list[Email], now) -> tuple[int, Exception | None]:
+    """Sends the emails, returns how many of them were handled and the error that stopped the batch."""
+    for index, email in enumerate(emails):
+        message = EmailMessage(email.subject, email.message, settings.DEFAULT_FROM_EMAIL, [email.to])
+        try:
+            connection.send_messages([message])
+        except EMAIL_ERRORS as e:
+            logger.warning(f"Email {email.pk} to {email.to} was rejected: {e}")
+            email.attempts += 1
+            email.error = str(e)
+            delay = settings.EMAIL_OUTBOX["RETRY_DELAY"] * 2 ** (email.attempts - 1)
+            email.next_attempt_at = now + timedelta(seconds=delay)
+        except (smtplib.SMTPException, OSError) as e:
+            return index, e
+        else:
+            email.sent_at = now
+    return len(emails), None
+
+
+@shared_task(queue="low_priority")
+def flush_last_logins(batch_size: int = 1000):
+    """Writes the logins recorded since the last run to `User.last_login`, run periodically by Celery beat."""
+    LastLogins().flush(batch_size=batch_size)
@@ -2,13 +2,26 @@ from django.urls import reverse
 from django.core.cache import cache
 from rest_framework.test import APITestCase
 from rest_framework import status
-from users.models import User
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import CachedJWTAuthentication, get_cached_user
+from users.models import Email, Role, User
+from users.logins import LastLogins
+from users.tasks import flush_last_logins, send_emails
 import time
 from django.core import mail
 from django.conf import settings
 from django.utils import timezone
 import datetime
-from users.utils import generate_activation_key 
+import smtplib
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+import fakeredis
+from unittest.mock import patch
+from django.core.mail import get_connection
+from users.utils import generate_activation_key, queue_email
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 
@@ -56,7 +69,9 @@ class UserActivationTest(APITestCase):
         response = self.client.get(activation_url)
         self.assertEqual(response.status_code, 400)
 
-    def test_resend_activation_email(self):
+    # the queued emails are sent in the test, without a broker
+    @patch("users.tasks.send_emails.delay", side_effect=send_emails.run)
+    def test_resend_activation_email(self, delay):
         # 1. Register a new user
         registration_data = {
             'email': 'resend@example.com',
@@ -70,7 +85,9 @@ class UserActivationTest(APITestCase):
         # Clear the outbox before registration
         mail.outbox = []
         
-        registration_response = self.client.post(registration_url, registration_data, format='json')
+        # the email is sent once the registration is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            registration_response = self.client.post(registration_url, registration_data, format='json')
         if registration_response.status_code != status.HTTP_201_CREATED:
             print(f"Registration failed: {registration_response.status_code} - {registration_response.data}")
         self.assertEqual(registration_response.status_code, status.HTTP_201_CREATED)
@@ -86,7 +103,8 @@ class UserActivationTest(APITestCase):
         # Clear the outbox before resending
         mail.outbox = []
         
-        resend_response = self.client.post(resend_url, resend_data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            resend_response = self.client.post(resend_url, resend_data, format='json')
         self.assertEqual(resend_response.status_code, status.HTTP_200_OK)
         self.assertEqual(resend_response.data['message'], 'Activation email resent successfully.')
 
@@ -110,3 +128,242 @@ class UserActivationTest(APITestCase):
         response = self.client.get(activation_url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data["error"], "Invalid activation key.")
+
+
+    def test_resend_invalidates_previous_key(self):
+        user = User.objects.create_user(email="resent@example.com", password="testpassword")
+        user.is_active = False
+        user.save()
+        previous_key = generate_activation_key(user)
+        activation_key = generate_activation_key(user)
+
+        response = self.client.get(reverse("activate", args=[previous_key]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse("activate", args=[activation_key]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+
+        # the key can be used once
+        response = self.client.get(reverse("activate", args=[activation_key]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EmailOutboxTest(APITestCase):
+    @patch("users.tasks.send_emails.delay", side_effect=send_emails.run)
+    def test_sent_after_commit(self, delay):
+        with self.captureOnCommitCallbacks() as callbacks:
+            email = queue_email("Subject", "Message", "outbox@example.com")
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        delay.assert_called_once_with()
+        email.refresh_from_db()
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(mail.outbox[0].to, ["outbox@example.com"])
+
+    def test_batches_share_one_connection(self):
+        for i in range(5):
+            queue_email("Subject", "Message", f"user{i}@example.com")
+
+        with patch("users.tasks.get_connection", wraps=get_connection) as connection:
+            send_emails(batch_size=2)
+
+        connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(Email.objects.filter(sent_at__isnull=True).exists())
+
+    def test_rejected_email_is_retried_later(self):
+        rejected = queue_email("Subject", "Message", "rejected@example.com")
+        queue_email("Subject", "Message", "accepted@example.com")
+
+        def send_messages(messages):
+            if messages[0].to == ["rejected@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"rejected@example.com": (550, b"No such user")})
+            return len(messages)
+
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=send_messages):
+            send_emails()
+
+        rejected.refresh_from_db()
+        self.assertIsNone(rejected.sent_at)
+        self.assertEqual(rejected.attempts, 1)
+        self.assertGreater(rejected.next_attempt_at, timezone.now())
+        self.assertTrue(Email.objects.get(to="accepted@example.com").sent_at)
+
+    def test_emails_are_sent_outside_of_the_claim(self):
+        queue_email("Subject", "Message", "first@example.com")
+        queue_email("Subject", "Message", "second@example.com")
+        due = []
+
+        def send_messages(messages):
+            # the batch is leased to this run, not locked by an open transaction
+            due.append(Email.objects.filter(next_attempt_at__lte=timezone.now()).count())
+            if messages[0].to == ["second@example.com"]:
+                raise smtplib.SMTPServerDisconnected("Connection lost")
+            return len(messages)
+
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=send_messages):
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                send_emails.run()
+
+        self.assertEqual(due, [0, 0])
+        self.assertTrue(Email.objects.get(to="first@example.com").sent_at)
+        # released for the retry of the task
+        second = Email.objects.get(to="second@example.com")
+        self.assertIsNone(second.sent_at)
+        self.assertLessEqual(second.next_attempt_at, timezone.now())
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="jwt@example.com", password="testpassword", first_name="Jwt")
+        token = AccessToken.for_user(self.user)
+        self.request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def authenticate(self) -> User:
+        user, _ = CachedJWTAuthentication().authenticate(self.request)
+        return user
+
+    def test_user_is_cached(self):
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.role, Role.CUSTOMER)
+        self.assertEqual(user.first_name, "Jwt")
+
+    def test_changes_apply_to_next_request(self):
+        self.authenticate()
+
+        self.user.role = Role.SUPPORT
+        self.user.save()
+        self.assertEqual(self.authenticate().role, Role.SUPPORT)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_token_issued_before_a_password_change_is_rejected(self):
+        self.authenticate()
+
+        self.user.set_password("newpassword")
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+        token = AccessToken.for_user(self.user)
+        self.request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.authenticate().pk, self.user.pk)
+
+    def test_save_of_cached_user_keeps_password(self):
+        user = self.authenticate()
+        user.first_name = "Changed"
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Changed")
+        self.assertTrue(self.user.check_password("testpassword"))
+
+
+class LastLoginTest(APITestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch("users.logins.get_redis_connection", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email="login@example.com", password="testpassword")
+
+    def login(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"email": "login@example.com", "password": "testpassword"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_login_is_flushed_later(self):
+        self.login()
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+        pending = LastLogins().pending([self.user.pk])[self.user.pk]
+
+        flush_last_logins()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login, pending)
+        self.assertEqual(LastLogins().pending([self.user.pk]), {})
+
+    def test_logins_recorded_during_flush_are_kept(self):
+        self.login()
+        last_logins = LastLogins()
+        self.redis.rename(LastLogins.PENDING_KEY, LastLogins.FLUSHING_KEY)  # a flush failed after taking the hash
+        self.login()
+
+        self.assertEqual(last_logins.flush(), 1)
+        self.assertEqual(last_logins.flush(), 1)
+        self.assertEqual(last_logins.flush(), 0)
+
+    def test_admin_shows_pending_login(self):
+        admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.client.force_login(admin)
+        self.login()
+
+        response = self.client.get(reverse("admin:users_user_changelist"))
+        self.assertEqual(response.status_code, 200)
+        users = {user.pk: user for user in response.context["cl"].result_list}
+        self.assertIsNotNone(users[self.user.pk].last_login)
+
+        response = self.client.get(reverse("admin:users_user_change", args=[self.user.pk]))
+        self.assertIsNotNone(response.context["original"].last_login)
+
+
+class ImportUsersTest(APITestCase):
+    def import_users(self, content: str, *args) -> StringIO:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write(content)
+        self.stdout, stderr = StringIO(), StringIO()
+        call_command("import_users", file.name, "--workers", "2", *args, stdout=self.stdout, stderr=stderr)
+        return stderr
+
+    def test_import(self):
+        User.objects.create_user(email="existing@example.com", password="oldpassword", first_name="Old")
+
+        stderr = self.import_users(
+            "email,password,first_name,last_name,phone\n"
+            "new@example.com,newpassword,New,User,0501234567\n"
+            "existing@example.com,changed,Changed,User,\n"
+            "not-an-email,password,,,\n"
+            "new@example.com,repeated,,,\n"
+        )
+
+        user = User.objects.get(email="new@example.com")
+        self.assertTrue(user.check_password("newpassword"))
+        self.assertEqual((user.first_name, user.phone, user.role), ("New", "0501234567", Role.CUSTOMER))
+        existing = User.objects.get(email="existing@example.com")
+        self.assertEqual(existing.first_name, "Old")
+        self.assertIn("Line 4: invalid email", stderr.getvalue())
+        self.assertIn("Line 5: new@example.com is repeated", stderr.getvalue())
+
+    def test_update_existing(self):
+        User.objects.create_user(email="existing@example.com", password="oldpassword", first_name="Old")
+
+        self.import_users("email,password,first_name\nexisting@example.com,changed,Changed\n", "--update")
+
+        existing = User.objects.get(email="existing@example.com")
+        self.assertEqual(existing.first_name, "Changed")
+        self.assertTrue(existing.check_password("changed"))
+
+    def test_update_counts_and_drops_the_cached_users(self):
+        existing = User.objects.create_user(email="existing@example.com", password="oldpassword", first_name="Old")
+        get_cached_user(existing.pk)
+
+        self.import_users(
+            "email,password,first_name\nexisting@example.com,changed,Changed\nnew@example.com,new,New\n", "--update"
+        )
+
+        self.assertIn("Created 1 and updated 1 users", self.stdout.getvalue())
+        self.assertEqual(get_cached_user(existing.pk)["first_name"], "Changed")
@@ -1,7 +1,10 @@
 from .views import activate_user, resend_activation_email, RegisterView
 from django.urls import path
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("activate/<str:activation_key>/", activate_user, name="activate"),  
     path("resend_activation_email/", resend_activation_email, name="resend_activation_email"),
+    path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]
\ No newline at end of file
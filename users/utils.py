@@ -1,29 +1,85 @@
 import uuid
-from django.core.cache import cache
 from django.conf import settings
-from django.core.mail import send_mail
+from django.db import transaction
 import logging
 
+from shared.cache import CacheService
+
+from .models import Email
+
 logger = logging.getLogger(__name__)
 
 def generate_activation_key(user):
+    """
+    Creates a new activation key of the user, the previous one stops working.
+
+    The key is stored twice with the same expiry: by user (`activation_key:<user id>`)
+    to find the previous key on resend, and by key (`activation_user:<key>`)
+    to find the user on activation without scanning the keys of all users.
+    """
     key = uuid.uuid4().hex
-    cache_key = f"activation_key:{user.id}"
+    cache = CacheService()
+    timeout = settings.ACTIVATION_KEY_EXPIRATION_TIME
     try:
-        cache.set(cache_key, key, settings.ACTIVATION_KEY_EXPIRATION_TIME)
+        previous_key = cache.get("activation_key", str(user.id))
+        with cache.pipeline() as pipeline:
+            if previous_key:
+                pipeline.delete("activation_user", previous_key)
+            pipeline.set("activation_key", str(user.id), key, timeout=timeout)
+            pipeline.set("activation_user", key, user.id, timeout=timeout)
     except Exception as e:
         logger.error(f"Error saving activation key to cache: {e}")
     print(f"Generated activation key: {key} for user {user.id}")
     return key
 
+
+def consume_activation_key(activation_key: str) -> int | None:
+    """
+    Makes the activation key unusable.
+
+    Args:
+        activation_key: The key from the activation link.
+
+    Returns:
+        The id of the user the key was generated for, None if the key is invalid,
+        expired, replaced by a newer one or already used.
+    """
+    cache = CacheService()
+    user_id = cache.get("activation_user", activation_key)
+    if user_id is None or cache.get("activation_key", str(user_id)) != activation_key:
+        return None
+    # of concurrent activations with the same key only one deletes it
+    if not cache.delete("activation_key", str(user_id)):
+        return None
+    cache.delete("activation_user", activation_key)
+    return user_id
+
+
 def send_activation_email(user, activation_key):
     subject = "Activate your account"
     message = f"Please click the following link to activate your account: http://localhost:8000/users/activate/{activation_key}" 
 
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-    )
+    queue_email(subject, message, user.email)
+
+
+def queue_email(subject: str, message: str, to: str) -> Email:
+    """
+    Queues an email to the outbox.
+
+    The email is saved in the current transaction and the sending task is
+    enqueued once it is committed, so the request does not wait for SMTP and
+    no email is sent for a rolled back registration.
+
+    Args:
+        subject: The subject of the email.
+        message: The plain text body.
+        to: The recipient address.
+
+    Returns:
+        The queued email.
+    """
+    from .tasks import send_emails
+
+    email = Email.objects.create(subject=subject, message=message, to=to)
+    transaction.on_commit(send_emails.delay)
+    return email
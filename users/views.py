@@ -3,14 +3,16 @@ from django.contrib.auth.hashers import make_password
 from rest_framework import viewsets, routers, permissions, serializers, generics, status
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.core.cache import cache
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
+from shared.rate_limit import TokenBucketThrottle
+
+from .authentication import CachedJWTAuthentication
 from .models import User
 from .serializers import UserSerializer
-from .utils import generate_activation_key, send_activation_email
+from .utils import consume_activation_key, generate_activation_key, send_activation_email
 import uuid
 from django.conf import settings
 from rest_framework.exceptions import ValidationError
@@ -43,7 +45,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UsersAPIViewSet(viewsets.GenericViewSet):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_permissions(self):
@@ -66,20 +68,16 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle.scoped("register")]
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        logger.info(f"User created with id: {user.id}")  
-        user.is_active = False  
-        user.save()
-        activation_key = generate_activation_key(user)
-        logger.info(f"Activation key generated: {activation_key}")  
-        send_activation_email(user, activation_key)
-        
-        # Store activation key in cache
-        cache_key = f"activation_key:{user.id}"
-        cache.set(cache_key, activation_key, timeout=settings.ACTIVATION_KEY_EXPIRATION_TIME)
-        logger.info(f"Activation key saved to cache with key: {cache_key}")  
+        # the user and the activation email are committed together, the email is sent by the outbox task
+        with transaction.atomic():
+            user = serializer.save(is_active=False)
+            logger.info(f"User created with id: {user.id}")  
+            activation_key = generate_activation_key(user)
+            logger.info(f"Activation key generated: {activation_key}")  
+            send_activation_email(user, activation_key)
 
         return Response(
             {"message": "User registered successfully. Check your email to activate your account."},
@@ -89,25 +87,21 @@ class RegisterView(generics.CreateAPIView):
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@throttle_classes([TokenBucketThrottle.scoped("activate")])
 def activate_user(request, activation_key):
-    cache_key_prefix = "activation_key:"
-    for user_id in cache.iter_keys(cache_key_prefix + "*"):
-        cache_key = user_id
-        cached_key = cache.get(cache_key)
-
-        if cached_key == activation_key:
-            user_id = cache_key.split(":")[1]
-            user = get_object_or_404(User, pk=user_id)
-            user.is_active = True
-            user.save()
-            cache.delete(cache_key)
-            return Response({"message": "User activated successfully."}, status=status.HTTP_200_OK)
+    user_id = consume_activation_key(activation_key)
+    if user_id is None:
+        return Response({"error": "Invalid activation key."}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response({"error": "Invalid activation key."}, status=status.HTTP_400_BAD_REQUEST)
+    user = get_object_or_404(User, pk=user_id)
+    user.is_active = True
+    user.save(update_fields=["is_active"])
+    return Response({"message": "User activated successfully."}, status=status.HTTP_200_OK)
 
 
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@throttle_classes([TokenBucketThrottle.scoped("resend_activation_email")])
 def resend_activation_email(request):
     email = request.data.get("email")
     if not email: